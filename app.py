@@ -3,25 +3,29 @@ from __future__ import annotations
 
 import argparse
 import json
+import os
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-import pandas as pd
 from rich import print as rprint
 
 from src.config import Settings
 from src.qa_agent import QueryAgent
-from src.schemas import OutputSchema
+from src.schemas import InputSchema, OutputSchema
+from src.server import DEFAULT_HOST, DEFAULT_PORT, QueryClient, QueryServer
 
 
 # -------------------- Yardımcılar --------------------
 
 def _load_models_from_settings(settings_path: Optional[str], cfg: Settings) -> None:
     """
-    config/settings.yaml içinden model adlarını okumak için.
+    config/settings.yaml içinden model adlarını ve getirme eşiklerini okumak için.
     Format:
     models:
       query: Qwen/Qwen3-4B-Instruct-2507
+    retrieval:          # opsiyonel
+      min_relevance: 0.08
+      low_conf_gap: 0.0
     """
     if not settings_path:
         return
@@ -48,6 +52,15 @@ def _load_models_from_settings(settings_path: Optional[str], cfg: Settings) -> N
         cfg.qwen_model = qwen_name.strip()
         rprint(f"[cyan]Ayar:[/cyan] Qwen modeli -> {cfg.qwen_model}")
 
+    # retrieval: getirme eşikleri (calibrate komutunun yazdığı bölüm)
+    try:
+        applied = cfg.apply_retrieval(data.get("retrieval") or {})
+    except (TypeError, ValueError) as e:
+        rprint(f"[yellow]Uyarı:[/yellow] settings.yaml retrieval bölümü okunamadı: {e}")
+        applied = {}
+    if applied:
+        rprint("[cyan]Ayar:[/cyan] retrieval -> " + ", ".join(f"{k}={v}" for k, v in applied.items()))
+
 
 def _default_qa_path(cmd_arg: Optional[str]) -> Path:
     """
@@ -87,6 +100,21 @@ def _choose_output_paths(
     return json_path, xlsx_path
 
 
+def _read_questions(qa_path: Path) -> tuple[List[str], List[str]]:
+    """Soru dosyası -> (sorular, expected'ler). Öğeler düz metin ya da {"query", "expected"}."""
+    items = json.loads(qa_path.read_text(encoding="utf-8"))
+    questions: List[str] = []
+    expecteds: List[str] = []
+    for it in items:
+        if isinstance(it, str):
+            questions.append(it)
+            expecteds.append("")
+        else:
+            questions.append(it.get("query", ""))
+            expecteds.append(it.get("expected") or "")
+    return questions, expecteds
+
+
 def _row_from_output(idx: int, out: OutputSchema) -> Dict[str, Any]:
     """
     OutputSchema -> düz dict (JSON ve Excel için).
@@ -118,24 +146,96 @@ def cmd_build(pdf_dir: Optional[str], prompt_yaml: str, settings_path: Optional[
 
     agent = QueryAgent(cfg, prompt_yaml)
     target_dir = pdf_dir or "data/query_data"
-    agent.build_index(target_dir)
-    rprint(f"[green]✅ İndeks oluşturuldu.[/green]  [dim]Klasör:[/dim] {target_dir}")
+    def progress(st) -> None:
+        rprint(
+            f"    [dim]PDF[/dim] {st.files_parsed}/{st.files_total}  [dim]chunk[/dim] {st.chunks}  "
+            f"[dim]batch[/dim] {st.batches}  [dim]parse[/dim] {st.parse_s:.1f}s  "
+            f"[dim]embed+yaz[/dim] {st.chunks_per_s:.1f} chunk/s  [dim]geçen[/dim] {st.wall_s:.1f}s"
+        )
 
+    plan = agent.build_index(target_dir, progress=progress)
+    rprint(f"[green]✅ İndeks güncellendi.[/green]  [dim]Klasör:[/dim] {target_dir}")
+    rprint(
+        f"    [dim]Yeni:[/dim] {len(plan.added)}  [dim]Değişen:[/dim] {len(plan.changed)}  "
+        f"[dim]Silinen:[/dim] {len(plan.removed)}  [dim]Aynı:[/dim] {len(plan.unchanged)}"
+    )
 
-def cmd_ask(question: str, k: int, prompt_yaml: str, settings_path: Optional[str]):
-    cfg = Settings()
-    _load_models_from_settings(settings_path, cfg)
 
-    agent = QueryAgent(cfg, prompt_yaml)
-    out = agent.ask(question, k=k)
+def _print_stream(events) -> Optional[OutputSchema]:
+    # Parçalar geldikçe yazılır; son öğe OutputSchema
+    out = None
+    for event in events:
+        if isinstance(event, OutputSchema):
+            out = event
+        else:
+            print(event, end="", flush=True)
+    print()
+    return out
+
+
+def _print_trace(trace: Dict[str, Any]) -> None:
+    rprint(f"[dim]trace {trace['trace_id']}  toplam {trace['duration_ms']:.1f} ms[/dim]")
+    for sp in trace["spans"]:
+        extra = {k: v for k, v in sp.items() if k not in ("name", "start_ms", "duration_ms")}
+        info = "  ".join(f"{k}={v}" for k, v in extra.items())
+        rprint(f"    {sp['name']:<18} {sp['start_ms']:9.1f} +{sp['duration_ms']:9.1f} ms  [dim]{info}[/dim]")
+
+
+def cmd_ask(question: str, k: Optional[int], prompt_yaml: str, settings_path: Optional[str],
+            server: Optional[str] = None, stream: bool = False, debug: bool = False, pdf: str = ""):
+    out = None
+    if server:
+        # Sıcak sunucu varsa model yüklemeden ona sor
+        client = QueryClient(server)
+        if client.health():
+            if stream:
+                out = _print_stream(client.ask_stream(question, k=k, pdf_path=pdf))
+            else:
+                out = client.ask(question, k=k, pdf_path=pdf)
+        else:
+            rprint(f"[yellow]Uyarı:[/yellow] Sunucuya ulaşılamadı ({server}), yerel çalıştırılıyor.")
+
+    if out is None:
+        cfg = Settings()
+        _load_models_from_settings(settings_path, cfg)
+        cfg.trace_debug = debug
+
+        agent = QueryAgent(cfg, prompt_yaml)
+        inp = InputSchema(query=question, pdf_path=pdf)
+        out = _print_stream(agent.answer_stream(inp, k=k)) if stream else agent.answer(inp, k=k)
 
     if isinstance(out, OutputSchema):
         row = _row_from_output(1, out)
         rprint(json.dumps(row, ensure_ascii=False, indent=2))
+        if out.debug:
+            _print_trace(out.debug)
     else:
         rprint(out)
 
 
+def _write_outputs(rows: List[Dict[str, Any]], out_json_path: Path, out_xlsx_path: Path) -> None:
+    # JSON yaz (expected dahil)
+    out_json_path.write_text(json.dumps(rows, ensure_ascii=False, indent=2), encoding="utf-8")
+    rprint(f"[green]JSON kaydedildi →[/green] {out_json_path}")
+
+    # Excel yaz — kolon sırası: idx, query, expected, answer, doc_id, page
+    import pandas as pd  # yalnızca batch çıktısı için gerekli
+
+    df = pd.DataFrame(rows, columns=["idx", "query", "expected", "answer", "doc_id", "page"])
+    df.to_excel(out_xlsx_path, index=False)
+    rprint(f"[green]Excel kaydedildi →[/green] {out_xlsx_path}")
+
+
+def _print_rows(rows: List[Dict[str, Any]]) -> None:
+    for row in rows:
+        rprint(f"[white]{row['idx']:02d}[/white] [bold]Q:[/bold] {row['query']}")
+        rprint(
+            f"    [dim]Expected:[/dim] {row['expected']}  "
+            f"[dim]Ans:[/dim] {row['answer']}  "
+            f"[dim]Ref:[/dim] {row.get('doc_id','')} s.{row.get('page')}"
+        )
+
+
 def cmd_batch(
     qa_json: Optional[str],
     out_json: Optional[str],
@@ -143,65 +243,278 @@ def cmd_batch(
     k: int,
     prompt_yaml: str,
     settings_path: Optional[str],
+    checkpoint: Optional[str] = None,
+    resume: bool = False,
+    prefetch: int = 2,
+    workers: int = 1,
+    pin: bool = True,
+    trace_log: Optional[str] = None,
 ):
+    from src.batch_runner import Checkpoint, run_batch, run_sharded
+
     cfg = Settings()
     _load_models_from_settings(settings_path, cfg)
+    if trace_log:
+        cfg.trace_log_path = trace_log
 
     agent = QueryAgent(cfg, prompt_yaml)
 
     qa_path = _default_qa_path(qa_json)
     rprint(f"Soru dosyası: {qa_path}")
 
-    items = json.loads(qa_path.read_text(encoding="utf-8"))
+    # Soru ve expected'leri oku
+    questions, expecteds = _read_questions(qa_path)
 
-    rows: List[Dict[str, Any]] = []
-    for i, it in enumerate(items, 1):
-        # Soru ve expected'i oku
-        if isinstance(it, str):
-            q = it
-            expected = ""
-        else:
-            q = it.get("query", "")
-            expected = (it.get("expected") or "")
+    # Çıktı dosya yollarını seç (aynı klasöre yaz); checkpoint varsayılanı run.jsonl
+    out_json_path, out_xlsx_path = _choose_output_paths(qa_path, out_json, out_xlsx)
+    ckpt = Checkpoint(checkpoint or out_json_path.with_suffix(".jsonl"))
+
+    def make_row(i: int, pred: OutputSchema) -> Dict[str, Any]:
+        row = _row_from_output(i, pred)
+        row["expected"] = expecteds[i - 1]
+        return row
+
+    # Getirme/bağlam sıradaki parçalar için arka planda hazırlanır; her parça
+    # biter bitmez checkpoint'e eklenir (--resume ile kaldığı yerden devam eder)
+    if workers > 1:
+        stats, per_worker = run_sharded(
+            cfg, prompt_yaml, questions, make_row, ckpt, workers, k=k, resume=resume,
+            prefetch=prefetch, pin=pin, on_rows=_print_rows,
+        )
+        for w in per_worker:
+            rprint(
+                f"    [dim]işçi {w['worker']}[/dim] çekirdek {w['cores']}  [dim]yükleme[/dim] {w['load_s']:.1f}s  "
+                f"{w['done']} soru  [dim]üretim[/dim] {w['generate_s']:.1f}s  [dim]toplam[/dim] {w['wall_s']:.1f}s"
+            )
+    else:
+        stats = run_batch(
+            agent, questions, make_row, ckpt, k=k, resume=resume,
+            chunk_size=cfg.llm_batch_size, prefetch=prefetch, on_rows=_print_rows,
+        )
+        rprint(
+            f"    [dim]hazırlık[/dim] {stats.prepare_s:.1f}s  [dim]üretim[/dim] {stats.generate_s:.1f}s  "
+            f"[dim]bekleme[/dim] {stats.wait_s:.1f}s"
+        )
+    if stats.skipped:
+        rprint(f"[cyan]Devam:[/cyan] checkpoint'te olan {stats.skipped} soru atlandı ({ckpt.path})")
+    qps = stats.done / stats.wall_s if stats.wall_s else 0.0
+    rprint(f"    [dim]toplam[/dim] {stats.wall_s:.1f}s  [dim]hız[/dim] {qps:.2f} soru/s")
 
-        pred = agent.ask(q, k=k)
+    rows = [r for r in ckpt.rows() if 1 <= r["idx"] <= len(questions)]
+    _write_outputs(rows, out_json_path, out_xlsx_path)
 
-        # OutputSchema ise referansı al, expected'i ekle
-        if isinstance(pred, OutputSchema):
-            row = _row_from_output(i, pred)
-            row["expected"] = expected
-        else:
-            row = {
-                "idx": i,
-                "query": q,
-                "expected": expected,  # <-- İSTENEN KOLON
-                "answer": (pred or "").strip(),
-                "doc_id": "",
-                "page": None,
-            }
-
-        rows.append(row)
-
-        rprint(f"[white]{i:02d}[/white] [bold]Q:[/bold] {q}")
+    rprint(f"[bold]Bitti.[/bold] Toplam: {len(rows)}")
+
+
+def cmd_serve(
+    host: str,
+    port: int,
+    max_batch: int,
+    max_wait_ms: int,
+    prompt_yaml: str,
+    settings_path: Optional[str],
+    trace_log: Optional[str] = None,
+):
+    cfg = Settings()
+    _load_models_from_settings(settings_path, cfg)
+    if trace_log:
+        cfg.trace_log_path = trace_log
+
+    agent = QueryAgent(cfg, prompt_yaml)
+    server = QueryServer(agent, host=host, port=port, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    rprint(f"[green]Sunucu hazır →[/green] http://{host}:{port}  [dim](POST /ask, GET /health, GET /metrics)[/dim]")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        rprint("[bold]Kapatılıyor.[/bold]")
+
+
+def cmd_bench(
+    suite: str,
+    qa_json: Optional[str],
+    k: int,
+    modes: Optional[str],
+    out_json: Optional[str],
+    prompt_yaml: str,
+    settings_path: Optional[str],
+    pdf_dir: Optional[str] = None,
+    stub: bool = False,
+    baseline: Optional[str] = None,
+    scale: int = 1,
+):
+    from src.bench import bench_cpu_modes, bench_decoding, bench_scaling
+
+    cfg = Settings()
+    _load_models_from_settings(settings_path, cfg)
+    agent = QueryAgent(cfg, prompt_yaml)
+
+    qa_path = _default_qa_path(qa_json)
+    questions, _ = _read_questions(qa_path)
+    rprint(f"Soru dosyası: {qa_path}  [dim]({len(questions)} soru)[/dim]")
+
+    mode_list = [m.strip() for m in (modes or "").split(",") if m.strip()]
+    regressed = False
+    if suite == "pipeline":
+        results, regressed = _bench_pipeline(cfg, prompt_yaml, qa_path, questions, k, mode_list, pdf_dir, stub, baseline)
+    elif suite == "vectors":
+        results = _bench_vectors(cfg, qa_path, questions, k, mode_list, pdf_dir, stub, scale)
+    elif suite == "scaling":
+        results = bench_scaling(agent, questions, workers=[int(m) for m in mode_list] or (1, 2, 4), k=k)
+        base = results[0].qps if results else 0.0
+        for r in results:
+            rprint(
+                f"    [bold]{r.workers:>3} işçi[/bold]  {r.questions} soru  [dim]yükleme[/dim] {r.load_s:6.1f}s  "
+                f"[dim]çalışma[/dim] {r.work_s:7.1f}s  {r.qps:6.2f} soru/s  [dim]x{(r.qps / base if base else 0):.2f}[/dim]"
+            )
+    elif suite == "cpu":
+        results = bench_cpu_modes(agent, questions, modes=mode_list or ("fp32", "int8", "bf16"), k=k)
+        for r in results:
+            rprint(
+                f"    [bold]{r.mode:<6}[/bold] [dim]yükleme[/dim] {r.load_s:6.1f}s  [dim]RSS[/dim] {r.rss_mb:8.0f} MB  "
+                f"{r.new_tokens:5d} token  {r.ms_per_token:7.1f} ms/token"
+            )
+    else:
+        results = bench_decoding(agent, questions, modes=mode_list or ("greedy", "prompt_lookup"), k=k)
+        base = results[0].tokens_per_s if results else 0.0
+        for r in results:
+            speedup = r.tokens_per_s / base if base else 0.0
+            rprint(
+                f"    [bold]{r.mode:<14}[/bold] {r.new_tokens:5d} token  {r.seconds:7.2f}s  "
+                f"{r.tokens_per_s:7.2f} token/s  [dim]x{speedup:.2f}[/dim]  "
+                f"[dim]greedy ile aynı:[/dim] {r.same_as_greedy}/{r.prompts}"
+            )
+    if out_json:
+        Path(out_json).write_text(
+            json.dumps([r.as_dict() for r in results], ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+        rprint(f"[green]JSON kaydedildi →[/green] {out_json}")
+    if suite == "pipeline" and regressed:
+        raise SystemExit(1)  # CI: tabana göre gerileme
+
+
+def _bench_pipeline(cfg: Settings, prompt_yaml: str, qa_path: Path, questions: List[str], k: int,
+                    scales: List[str], pdf_dir: Optional[str], stub: bool, baseline: Optional[str]):
+    from src.bench import bench_pipeline, compare_baseline
+    from src.ingest_multi import iter_pdfs
+
+    pdfs = sorted(iter_pdfs(pdf_dir or str(qa_path.parent)))
+    if not pdfs:
+        raise SystemExit(f"PDF bulunamadı: {pdf_dir or qa_path.parent}")
+    results = bench_pipeline(cfg, prompt_yaml, pdfs, questions, k=k,
+                             scales=[int(s) for s in scales] or (1,), stub=stub)
+    for r in results:
         rprint(
-            f"    [dim]Expected:[/dim] {expected}  "
-            f"[dim]Ans:[/dim] {row['answer']}  "
-            f"[dim]Ref:[/dim] {row.get('doc_id','')} s.{row.get('page')}"
+            f"[bold]{r.corpus}[/bold] [dim]({r.backend}{', stub' if r.stub else ''})[/dim]  "
+            f"{r.pages} sayfa  {r.chunks} chunk  [dim]indeks[/dim] {r.index_s:.2f}s ({r.chunks_per_s:.0f} chunk/s)  "
+            f"{r.qps:.2f} soru/s  [dim]RSS[/dim] {r.rss_mb:.0f} MB [dim]tepe[/dim] {r.peak_rss_mb:.0f} MB  "
+            f"[dim]indeks diski[/dim] {r.index_mb:.1f} MB  [dim]cevaplar[/dim] {r.answers_sha}"
+        )
+        for st in r.stages.values():
+            if st.n:
+                rprint(f"    {st.stage:<12} n={st.n:<5} p50 {st.p50_ms:9.2f} ms  p95 {st.p95_ms:9.2f} ms  "
+                       f"[dim]toplam {st.total_s:.3f}s[/dim]")
+
+    diffs = []
+    if baseline:
+        base = json.loads(Path(baseline).read_text(encoding="utf-8"))
+        diffs = compare_baseline(results, base)
+        rprint(f"Taban: {baseline}")
+        for d in diffs:
+            mark = "[red]GERİLEME[/red]" if d.regressed else ""
+            rprint(f"    {d.corpus:<10} {d.stage:<12} {d.base_ms:9.2f} → {d.now_ms:9.2f} ms  "
+                   f"[dim]x{d.ratio:.2f}[/dim] {mark}")
+        shas = {b["corpus"]: b.get("answers_sha") for b in base}
+        for r in results:
+            if shas.get(r.corpus) and shas[r.corpus] != r.answers_sha:
+                rprint(f"[yellow]Uyarı:[/yellow] {r.corpus} cevapları tabandan farklı "
+                       f"({shas[r.corpus]} → {r.answers_sha})")
+    return results, any(d.regressed for d in diffs)
+
+
+def _bench_vectors(cfg: Settings, qa_path: Path, questions: List[str], k: int, variants: List[str],
+                   pdf_dir: Optional[str], stub: bool, scale: int):
+    from src.bench import bench_vectors
+    from src.ingest_multi import iter_pdfs
+
+    pdfs = sorted(iter_pdfs(pdf_dir or str(qa_path.parent)))
+    if not pdfs:
+        raise SystemExit(f"PDF bulunamadı: {pdf_dir or qa_path.parent}")
+    results = bench_vectors(cfg, pdfs, questions, k=k, scale=scale, stub=stub,
+                            variants=variants or ("float32", "float16", "int8", "int8+rescore"))
+    if results:
+        rprint(f"{results[0].chunks} chunk  {results[0].questions} soru  "
+               f"[dim](recall@{results[0].k}, referans: float32 tam arama{', stub' if stub else ''})[/dim]")
+    base = results[0].vector_mb if results else 0.0
+    for r in results:
+        rprint(
+            f"    [bold]{r.variant:<14}[/bold] recall {r.recall:6.3f}  [dim]vektör[/dim] {r.vector_mb:8.2f} MB "
+            f"[dim](x{(r.vector_mb / base if base else 0):.2f})[/dim]  [dim]disk[/dim] {r.disk_mb:8.2f} MB  "
+            f"p50 {r.p50_ms:7.2f} ms  p95 {r.p95_ms:7.2f} ms"
         )
+    return results
 
-    # Çıktı dosya yollarını seç (aynı klasöre yaz)
-    out_json_path, out_xlsx_path = _choose_output_paths(qa_path, out_json, out_xlsx)
 
-    # JSON yaz (expected dahil)
-    out_json_path.write_text(json.dumps(rows, ensure_ascii=False, indent=2), encoding="utf-8")
-    rprint(f"[green]JSON kaydedildi →[/green] {out_json_path}")
+def _write_retrieval_settings(settings_path: str, values: Dict[str, Any]) -> None:
+    # settings.yaml'ın retrieval: bölümünü günceller; diğer bölümler korunur
+    import yaml  # type: ignore
 
-    # Excel yaz — kolon sırası: idx, query, expected, answer, doc_id, page
-    df = pd.DataFrame(rows, columns=["idx", "query", "expected", "answer", "doc_id", "page"])
-    df.to_excel(out_xlsx_path, index=False)
-    rprint(f"[green]Excel kaydedildi →[/green] {out_xlsx_path}")
+    p = Path(settings_path)
+    data = (yaml.safe_load(p.read_text(encoding="utf-8")) or {}) if p.exists() else {}
+    data.setdefault("retrieval", {}).update(values)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    p.write_text(yaml.safe_dump(data, sort_keys=False, allow_unicode=True), encoding="utf-8")
 
-    rprint(f"[bold]Bitti.[/bold] Toplam: {len(rows)}")
+
+def cmd_calibrate(
+    qa_json: Optional[str],
+    k: int,
+    max_false_reject: float,
+    write: bool,
+    prompt_yaml: str,
+    settings_path: Optional[str],
+):
+    """
+    Etiketli soru setinden (answerable alanı) getirme kapısı eşiklerini seçer.
+    Yalnızca embed + arama yapılır; LLM yüklenmez.
+    """
+    from src.calibrate import calibrate_gate, retrieval_hits
+    from src.vectorstore import best_scores_info
+
+    cfg = Settings()
+    _load_models_from_settings(settings_path, cfg)
+    agent = QueryAgent(cfg, prompt_yaml)
+
+    qa_path = _default_qa_path(qa_json)
+    items = json.loads(qa_path.read_text(encoding="utf-8"))
+    labelled = [it for it in items if isinstance(it, dict) and isinstance(it.get("answerable"), bool)]
+    if not labelled:
+        raise SystemExit(f"'answerable' alanı olan soru yok: {qa_path}")
+    questions = [it.get("query", "") for it in labelled]
+    answerable = [it["answerable"] for it in labelled]
+    rprint(f"Soru dosyası: {qa_path}  [dim]({sum(answerable)} cevaplanabilir, "
+           f"{len(answerable) - sum(answerable)} cevaplanamaz)[/dim]")
+
+    hits = retrieval_hits(agent, questions, k=k)
+    scores = [best_scores_info(h) for h in hits]
+    for (t1, t5), a, q in sorted(zip(scores, answerable, questions), key=lambda x: x[0][0]):
+        mark = "[green]✓[/green]" if a else "[red]✗[/red]"
+        rprint(f"    {mark} top1 {t1:.4f}  [dim]fark[/dim] {t1 - t5:.4f}  [dim]{q[:70]}[/dim]")
+
+    choice = calibrate_gate(agent, hits, answerable, max_false_reject=max_false_reject)
+    rprint(
+        f"[bold]Seçilen eşikler:[/bold] min_relevance={choice.min_relevance:.4f}  "
+        f"low_conf_gap={choice.low_conf_gap:.4f}"
+    )
+    rprint(
+        f"    [dim]cevaplanamaz durdurulan[/dim] {choice.rejected_unanswerable}/{choice.unanswerable}  "
+        f"[dim]cevaplanabilir geçen[/dim] {choice.kept_answerable}/{choice.answerable}"
+    )
+    values = {"min_relevance": round(choice.min_relevance, 4), "low_conf_gap": round(choice.low_conf_gap, 4)}
+    if write and settings_path:
+        _write_retrieval_settings(settings_path, values)
+        rprint(f"[green]Ayar dosyasına yazıldı →[/green] {settings_path} (retrieval)")
+    else:
+        rprint("settings.yaml için:\nretrieval:\n" + "".join(f"  {k}: {v}\n" for k, v in values.items()))
 
 
 # -------------------- CLI --------------------
@@ -219,9 +532,17 @@ def main():
     # ask
     a = sub.add_parser("ask", help="Tek soru sor")
     a.add_argument("--q", required=True, help="Soru metni")
-    a.add_argument("--k", type=int, default=5, help="Kaç belge getirilsin (top_k)")
+    a.add_argument("--k", type=int, default=None,
+                   help="Kaç belge getirilsin (varsayılan: top_k; --pdf ile scoped_top_k)")
+    a.add_argument("--pdf", default="",
+                   help="Yalnızca bu PDF'te ara (indekste yoksa önce eklenir)")
     a.add_argument("--prompts", default="prompts/query_prompt.yaml", help="Prompt YAML yolu")
     a.add_argument("--settings", default="config/settings.yaml", help="Ayar dosyası (yaml)")
+    a.add_argument("--server", default=os.getenv("QUERY_SERVER"),
+                   help="Çalışan sunucu adresi (ör. http://127.0.0.1:8765); verilirse model yüklenmez")
+    a.add_argument("--stream", action="store_true", help="Cevap metnini üretildikçe yazdır")
+    a.add_argument("--debug", action="store_true",
+                   help="Aşama süreleri ve token sayılarını (trace) yazdır; yalnızca yerel çalıştırmada")
 
     # batch
     bt = sub.add_parser("batch", help="JSON soru seti çalıştır")
@@ -229,17 +550,81 @@ def main():
     bt.add_argument("--out_json", default=None, help="Çıktı JSON (varsayılan: <qa_json klasörü>/run.json)")
     bt.add_argument("--out_xlsx", default=None, help="Çıktı Excel (varsayılan: <qa_json klasörü>/run.xlsx)")
     bt.add_argument("--k", type=int, default=5, help="Kaç belge getirilsin (top_k)")
+    bt.add_argument("--checkpoint", default=None,
+                    help="Satır satır sonuç dosyası (JSONL; varsayılan: <out_json>.jsonl)")
+    bt.add_argument("--resume", action="store_true", help="Checkpoint'te cevabı olan soruları atla")
+    bt.add_argument("--prefetch", type=int, default=2, help="Önceden hazırlanacak parça (batch) sayısı")
+    bt.add_argument("--workers", type=int, default=1,
+                    help="Soruları N işçi sürecine böl (her biri kendi modelini yükler)")
+    bt.add_argument("--no_pin", action="store_true", help="İşçileri çekirdek kümelerine sabitleme")
+    bt.add_argument("--trace_log", default=None, help="Batch başına trace'lerin yazılacağı JSONL ('-' -> stderr)")
     bt.add_argument("--prompts", default="prompts/query_prompt.yaml", help="Prompt YAML yolu")
     bt.add_argument("--settings", default="config/settings.yaml", help="Ayar dosyası (yaml)")
 
+    # serve
+    sv = sub.add_parser("serve", help="Modeli sıcak tutan yerel sorgu sunucusu")
+    sv.add_argument("--host", default=DEFAULT_HOST, help="Dinlenecek adres")
+    sv.add_argument("--port", type=int, default=DEFAULT_PORT, help="Dinlenecek port")
+    sv.add_argument("--max_batch", type=int, default=8, help="Tek generate'e toplanacak en fazla istek")
+    sv.add_argument("--max_wait_ms", type=int, default=20, help="Batch doldurmak için en fazla bekleme (ms)")
+    sv.add_argument("--trace_log", default=None, help="İstek başına trace'lerin yazılacağı JSONL ('-' -> stderr)")
+    sv.add_argument("--prompts", default="prompts/query_prompt.yaml", help="Prompt YAML yolu")
+    sv.add_argument("--settings", default="config/settings.yaml", help="Ayar dosyası (yaml)")
+
+    # calibrate
+    cb = sub.add_parser("calibrate", help="Getirme kapısı eşiklerini etiketli soru setinden seç")
+    cb.add_argument("--qa_json", default=None,
+                    help="answerable alanlı soru JSON (varsayılan: data/query_data/qa10_kvkk.json)")
+    cb.add_argument("--k", type=int, default=5, help="Getirilecek aday sayısı (top5 için en az 5)")
+    cb.add_argument("--max_false_reject", type=float, default=0.0,
+                    help="Kapıda kaybedilebilecek cevaplanabilir soru oranı (0..1)")
+    cb.add_argument("--write", action="store_true", help="Seçilen eşikleri --settings dosyasına yaz")
+    cb.add_argument("--prompts", default="prompts/query_prompt.yaml", help="Prompt YAML yolu")
+    cb.add_argument("--settings", default="config/settings.yaml", help="Ayar dosyası (yaml)")
+
+    # bench
+    bn = sub.add_parser("bench", help="Performans ölçümleri")
+    bn.add_argument("--suite", choices=["decode", "cpu", "scaling", "pipeline", "vectors"], default="decode",
+                    help="pipeline: indeksleme + soru aşamalarının p50/p95 gecikmesi ve bellek; "
+                         "vectors: flat indeks dtype'larının (float32/float16/int8) recall@k ve belleği; "
+                         "decode: extract çağrısında decoding modlarının token/s karşılaştırması; "
+                         "cpu: CPU modlarının (fp32/int8/bf16) bellek ve token gecikmesi; "
+                         "scaling: batch --workers N için soru/s")
+    bn.add_argument("--qa_json", default=None, help="Soru listesi JSON (varsayılan: data/query_data/qa10_kvkk.json)")
+    bn.add_argument("--k", type=int, default=5, help="Kaç belge getirilsin (top_k)")
+    bn.add_argument("--modes", default=None,
+                    help="Virgülle ayrılmış modlar; decode: greedy,prompt_lookup,draft  cpu: fp32,int8,bf16  "
+                         "scaling: işçi sayıları (ör. 1,2,4)  pipeline: derlem ölçekleri (ör. 1,8,32)  "
+                         "vectors: float32,float16,int8,int8+rescore")
+    bn.add_argument("--pdf_dir", default=None, help="pipeline/vectors: PDF klasörü (varsayılan: qa_json klasörü)")
+    bn.add_argument("--scale", type=int, default=1, help="vectors: sentetik derlem ölçeği (bkz. pipeline)")
+    bn.add_argument("--stub", action="store_true",
+                    help="pipeline/vectors: model yüklemeden deterministik yer tutucu LLM/embedder (çevrimdışı/CI)")
+    bn.add_argument("--baseline", default=None,
+                    help="pipeline: karşılaştırılacak önceki --out_json; gerilemede çıkış kodu 1")
+    bn.add_argument("--out_json", default=None, help="Sonuçların yazılacağı JSON (opsiyonel)")
+    bn.add_argument("--prompts", default="prompts/query_prompt.yaml", help="Prompt YAML yolu")
+    bn.add_argument("--settings", default="config/settings.yaml", help="Ayar dosyası (yaml)")
+
     args = ap.parse_args()
 
     if args.cmd == "build":
         return cmd_build(args.pdf_dir, args.prompts, args.settings)
     if args.cmd == "ask":
-        return cmd_ask(args.q, args.k, args.prompts, args.settings)
+        return cmd_ask(args.q, args.k, args.prompts, args.settings, args.server, args.stream, args.debug,
+                       args.pdf)
     if args.cmd == "batch":
-        return cmd_batch(args.qa_json, args.out_json, args.out_xlsx, args.k, args.prompts, args.settings)
+        return cmd_batch(args.qa_json, args.out_json, args.out_xlsx, args.k, args.prompts, args.settings,
+                         args.checkpoint, args.resume, args.prefetch, args.workers, not args.no_pin,
+                         args.trace_log)
+    if args.cmd == "serve":
+        return cmd_serve(args.host, args.port, args.max_batch, args.max_wait_ms, args.prompts, args.settings,
+                         args.trace_log)
+    if args.cmd == "calibrate":
+        return cmd_calibrate(args.qa_json, args.k, args.max_false_reject, args.write, args.prompts, args.settings)
+    if args.cmd == "bench":
+        return cmd_bench(args.suite, args.qa_json, args.k, args.modes, args.out_json, args.prompts, args.settings,
+                         args.pdf_dir, args.stub, args.baseline, args.scale)
 
 
 if __name__ == "__main__":
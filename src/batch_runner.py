@@ -0,0 +1,303 @@
+# src/batch_runner.py
+from __future__ import annotations
+import json
+import os
+import queue
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from .schemas import OutputSchema, dump_model
+
+
+class Checkpoint:
+    """
+    Satır başına bir sonuç (JSON) içeren ekleme-yalnız dosya. Her satır yazıldıktan
+    sonra diske aktarılır; yarıda kesilen son satır okumada yok sayılır.
+    Satırlar "idx" alanıyla anahtarlanır (aynı idx tekrar yazılırsa sonuncusu geçerli).
+    """
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+
+    def load(self) -> Dict[int, Dict[str, Any]]:
+        rows: Dict[int, Dict[str, Any]] = {}
+        if not self.path.is_file():
+            return rows
+        with self.path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # çökme anında yarım kalmış satır
+                rows[int(row["idx"])] = row
+        return rows
+
+    def reset(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text("", encoding="utf-8")
+
+    def _ends_cleanly(self) -> bool:
+        if not self.path.is_file() or self.path.stat().st_size == 0:
+            return True
+        with self.path.open("rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def append(self, rows: List[Dict[str, Any]]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        broken = not self._ends_cleanly()
+        with self.path.open("a", encoding="utf-8") as f:
+            if broken:
+                f.write("\n")  # yarım kalmış son satır ayrı kalsın (okumada atlanır)
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def rows(self) -> List[Dict[str, Any]]:
+        return [row for _, row in sorted(self.load().items())]
+
+
+@dataclass
+class RunStats:
+    total: int = 0
+    skipped: int = 0     # --resume ile atlanan (checkpoint'te olan) sorular
+    done: int = 0
+    prepare_s: float = 0.0   # getirme + bağlam (arka planda, üretimle örtüşür)
+    generate_s: float = 0.0  # LLM
+    wait_s: float = 0.0      # üretim, hazırlığı beklerken geçen süre
+    wall_s: float = 0.0
+
+
+def _pending(checkpoint: Checkpoint, idxs: List[int], questions: List[str],
+             resume: bool, stats: RunStats) -> List[Tuple[int, str]]:
+    if resume:
+        done = checkpoint.load()
+        todo = [(i, q) for i, q in zip(idxs, questions) if i not in done]
+        stats.skipped = len(idxs) - len(todo)
+        return todo
+    checkpoint.reset()
+    return list(zip(idxs, questions))
+
+
+def _pipeline(agent, items: List[Tuple[int, str]], k: Optional[int], chunk_size: int, prefetch: int,
+              sink: Callable[[List[Tuple[int, OutputSchema]]], None], stats: RunStats) -> None:
+    # Bir thread sıradaki parçaları hazırlarken (prepare_batch) ana thread üretir (finish_batch)
+    size = max(1, int(chunk_size))
+    chunks = [items[s:s + size] for s in range(0, len(items), size)]
+
+    def prepare(chunk):
+        t0 = time.perf_counter()
+        prep = agent.prepare_batch([q for _, q in chunk], k)
+        return prep, time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-prefetch") as ex:
+        pending: Deque = deque()
+        nxt = 0
+
+        def fill() -> None:
+            nonlocal nxt
+            while nxt < len(chunks) and len(pending) < max(1, int(prefetch)):
+                pending.append((chunks[nxt], ex.submit(prepare, chunks[nxt])))
+                nxt += 1
+
+        fill()
+        while pending:
+            chunk, fut = pending.popleft()
+            t0 = time.perf_counter()
+            prep, prep_s = fut.result()
+            stats.wait_s += time.perf_counter() - t0
+            stats.prepare_s += prep_s
+            fill()  # üretim sürerken sıradaki parçalar hazırlansın
+
+            t0 = time.perf_counter()
+            outs = agent.finish_batch(prep)
+            stats.generate_s += time.perf_counter() - t0
+            stats.done += len(outs)
+            sink([(i, out) for (i, _), out in zip(chunk, outs)])
+
+
+def run_batch(
+    agent,
+    questions: List[str],
+    make_row: Callable[[int, OutputSchema], Dict[str, Any]],
+    checkpoint: Checkpoint,
+    k: Optional[int] = None,
+    resume: bool = False,
+    chunk_size: int = 8,
+    prefetch: int = 2,
+    indices: Optional[List[int]] = None,
+    on_rows: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+) -> RunStats:
+    """
+    Soruları chunk_size'lık parçalar halinde çalıştırır. Bir thread, sıradaki en fazla
+    `prefetch` parçanın getirme + bağlam hazırlığını (agent.prepare_batch) yaparken
+    ana thread mevcut parçayı üretir (agent.finish_batch). Her parçanın satırları
+    biter bitmez checkpoint'e eklenir.
+
+    indices: soruların 1-tabanlı idx'leri (varsayılan 1..N)
+    resume: checkpoint'te satırı olan idx'ler atlanır; aksi halde checkpoint sıfırlanır
+    """
+    idxs = list(indices) if indices is not None else list(range(1, len(questions) + 1))
+    stats = RunStats(total=len(idxs))
+    t_start = time.perf_counter()
+    todo = _pending(checkpoint, idxs, questions, resume, stats)
+
+    def sink(results: List[Tuple[int, OutputSchema]]) -> None:
+        rows = [make_row(i, out) for i, out in results]
+        checkpoint.append(rows)
+        if on_rows is not None:
+            on_rows(rows)
+
+    _pipeline(agent, todo, k, chunk_size, prefetch, sink, stats)
+    stats.wall_s = time.perf_counter() - t_start
+    return stats
+
+
+# ---------- Çok süreçli (shard'lı) çalıştırma ----------
+
+def _available_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split_cores(workers: int, cores: Optional[List[int]] = None) -> List[List[int]]:
+    """Kullanılabilir çekirdekleri işçilere ardışık, eşit bloklar halinde böler."""
+    if cores is None:
+        cores = _available_cores()
+    workers = max(1, int(workers))
+    per, extra = divmod(len(cores), workers)
+    if per == 0:
+        # Çekirdekten çok işçi: her işçiye tek çekirdek, sırayla paylaşılır
+        return [[cores[w % len(cores)]] for w in range(workers)]
+    out, start = [], 0
+    for w in range(workers):
+        n = per + (1 if w < extra else 0)
+        out.append(cores[start:start + n])
+        start += n
+    return out
+
+
+def _shard_worker(wid: int, cfg, prompt_yaml: str, items: List[Tuple[int, str]], k: Optional[int],
+                  chunk_size: int, prefetch: int, cores: Optional[List[int]], out_q) -> None:
+    # Ayrı süreç (spawn): kendi ajanı, kendi çekirdek kümesi ve torch thread sayısı
+    try:
+        if cores and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+        if cores and cfg.torch_threads <= 0:
+            cfg.torch_threads = len(cores)
+        # Paylaşılan disk önbelleklerine birden çok süreç yazmasın; indeks yalnızca okunur
+        cfg.answer_cache_path = ""
+        cfg.embed_cache_dir = ""
+        if cfg.trace_log_path and cfg.trace_log_path != "-":
+            p = Path(cfg.trace_log_path)
+            cfg.trace_log_path = str(p.with_name(f"{p.stem}.w{wid}{p.suffix}"))  # işçi başına trace dosyası
+        from .qa_agent import QueryAgent
+
+        t0 = time.perf_counter()
+        agent = QueryAgent(cfg, prompt_yaml)
+        agent.llm, agent.emb, agent._get_vs()  # ısıt: yükleme süresi ayrı ölçülsün
+        load_s = time.perf_counter() - t0
+
+        stats = RunStats(total=len(items))
+        t0 = time.perf_counter()
+        _pipeline(agent, items, k, chunk_size, prefetch,
+                  lambda results: out_q.put(("rows", wid, [(i, dump_model(out)) for i, out in results])),
+                  stats)
+        stats.wall_s = time.perf_counter() - t0
+        out_q.put(("done", wid, {"load_s": load_s, **asdict(stats)}))
+    except BaseException:
+        out_q.put(("error", wid, traceback.format_exc()))
+
+
+def run_sharded(
+    cfg,
+    prompt_yaml: str,
+    questions: List[str],
+    make_row: Callable[[int, OutputSchema], Dict[str, Any]],
+    checkpoint: Checkpoint,
+    workers: int,
+    k: Optional[int] = None,
+    resume: bool = False,
+    prefetch: int = 2,
+    pin: bool = True,
+    on_rows: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+    poll_s: float = 5.0,
+) -> Tuple[RunStats, List[Dict[str, Any]]]:
+    """
+    Soruları N işçi sürecine round-robin dağıtır. Her işçi kendi QueryAgent'ını yükler
+    (Settings'teki cpu_mode/nicemleme ile), verilirse ayrı bir çekirdek kümesine
+    sabitlenir ve parçalarını run_batch ile aynı hatta çalıştırır. Sonuçlar kuyruktan
+    geldikçe checkpoint'e (tek yazar: ana süreç) eklenir; çıktılar idx sırasıyla
+    checkpoint'ten üretilir. İşçi başına istatistikler de döner.
+    Kuyruk poll_s boyunca boş kalırsa işçiler yoklanır; "done" göndermeden ölen
+    bir işçi (OOM, segfault) RuntimeError'a yol açar.
+    """
+    import multiprocessing as mp
+
+    idxs = list(range(1, len(questions) + 1))
+    stats = RunStats(total=len(idxs))
+    t_start = time.perf_counter()
+    todo = _pending(checkpoint, idxs, questions, resume, stats)
+    workers = max(1, min(int(workers), len(todo) or 1))
+    shards = [todo[w::workers] for w in range(workers)]
+    core_sets = split_cores(workers) if pin else [None] * workers
+    if not pin and cfg.torch_threads <= 0:
+        # Sabitleme yok: her işçi yine de çekirdeklerin yalnızca payını kullansın
+        cfg = replace(cfg, torch_threads=max(1, len(_available_cores()) // workers))
+
+    ctx = mp.get_context("spawn")
+    out_q = ctx.Queue()
+    procs = {
+        w: ctx.Process(
+            target=_shard_worker,
+            args=(w, cfg, prompt_yaml, shards[w], k, cfg.llm_batch_size, prefetch, core_sets[w], out_q),
+            name=f"batch-worker-{w}", daemon=True,
+        )
+        for w in range(workers) if shards[w]
+    }
+    for p in procs.values():
+        p.start()
+
+    worker_stats: List[Dict[str, Any]] = []
+    finished: set = set()
+    running = len(procs)
+    try:
+        while running:
+            try:
+                kind, wid, payload = out_q.get(timeout=poll_s)
+            except queue.Empty:
+                # OOM/segfault: süreç "done" göndermeden ölürse sonsuza kadar beklenmesin
+                dead = [(w, p.exitcode) for w, p in procs.items()
+                        if w not in finished and p.exitcode is not None]
+                if dead:
+                    w, code = dead[0]
+                    raise RuntimeError(
+                        f"İşçi {w} beklenmedik şekilde sonlandı (exitcode={code}); tamamlanan "
+                        f"sonuçlar checkpoint'te, kalanlar için --resume ile tekrar çalıştırın"
+                    )
+                continue
+            if kind == "rows":
+                rows = [make_row(i, OutputSchema(**out)) for i, out in payload]
+                checkpoint.append(rows)
+                stats.done += len(rows)
+                if on_rows is not None:
+                    on_rows(rows)
+            elif kind == "done":
+                worker_stats.append({"worker": wid, "cores": core_sets[wid], **payload})
+                finished.add(wid)
+                running -= 1
+            else:
+                raise RuntimeError(f"İşçi {wid} hata verdi:\n{payload}")
+    finally:
+        for p in procs.values():
+            if p.is_alive() and running:
+                p.terminate()
+            p.join()
+    stats.wall_s = time.perf_counter() - t_start
+    return stats, sorted(worker_stats, key=lambda w: w["worker"])
@@ -0,0 +1,535 @@
+# src/bench.py
+from __future__ import annotations
+import hashlib
+import random
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+@dataclass
+class DecodeResult:
+    mode: str
+    prompts: int
+    new_tokens: int
+    seconds: float
+    same_as_greedy: int  # greedy ile birebir aynı çıktı veren prompt sayısı
+
+    @property
+    def tokens_per_s(self) -> float:
+        return self.new_tokens / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> Dict:
+        return {**asdict(self), "tokens_per_s": round(self.tokens_per_s, 2)}
+
+
+def extract_prompts(agent, questions: List[str], k: int | None = None) -> List[Tuple[str, str]]:
+    """Soru başına extract (system, user) prompt'u; bağlamı olmayan sorular atlanır."""
+    prompts = []
+    for q, docs in zip(questions, agent.retrieve_batch(questions, k)):
+        if docs:
+            prompts.append(agent._extract_prompt(q, agent._context(docs)))
+    return prompts
+
+
+def bench_decoding(agent, questions: List[str], modes: Sequence[str] = ("greedy", "prompt_lookup"),
+                   k: int | None = None, warmup: int = 1) -> List[DecodeResult]:
+    """
+    Extract çağrısını her decoding modunda aynı prompt'larla çalıştırıp token/s ölçer.
+    Prefix KV-cache ölçüm boyunca kapatılır: modlar aynı prefill maliyetini öder.
+    greedy önce ölçülürse sonraki modların çıktıları onunla karşılaştırılır.
+    """
+    llm = agent.llm
+    prompts = extract_prompts(agent, questions, k)
+    saved = (llm.decoding, llm.prefix_cache_size)
+    llm.prefix_cache_size = 0
+    llm.clear_prefix_cache()
+    results: List[DecodeResult] = []
+    reference: List[str] = []
+    try:
+        for mode in modes:
+            llm.decoding = mode
+            for system, user in prompts[:warmup]:
+                llm.chat(system, user, assist=True)
+            outs, new_tokens = [], 0
+            t0 = time.perf_counter()
+            for system, user in prompts:
+                outs.append(llm.chat(system, user, assist=True))
+                new_tokens += llm.last_new_tokens
+            secs = time.perf_counter() - t0
+            if mode == "greedy":
+                reference = outs
+            same = sum(a == b for a, b in zip(outs, reference)) if reference else 0
+            results.append(DecodeResult(mode, len(prompts), new_tokens, secs, same))
+    finally:
+        llm.decoding, llm.prefix_cache_size = saved
+    return results
+
+
+# ---------- CPU çıkarım modları ----------
+
+def _status_mb(field: str) -> float:
+    # Linux: /proc/self/status alanı (kB); başka platformda 0
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return 0.0
+
+
+def _rss_mb() -> float:
+    return _status_mb("VmRSS")
+
+
+@dataclass
+class CpuModeResult:
+    mode: str
+    load_s: float
+    rss_mb: float         # model yüklemesinin getirdiği yerleşik bellek
+    prompts: int
+    new_tokens: int
+    seconds: float
+
+    @property
+    def ms_per_token(self) -> float:
+        return 1000.0 * self.seconds / self.new_tokens if self.new_tokens else 0.0
+
+    def as_dict(self) -> Dict:
+        return {**asdict(self), "ms_per_token": round(self.ms_per_token, 2)}
+
+
+def _measure_cpu_mode(model_name: str, mode: str, prompts: List[Tuple[str, str]],
+                      threads: int, interop_threads: int, compile: bool) -> CpuModeResult:
+    # Ayrı süreçte çalışır: her mod temiz bir bellek tabanından ölçülür
+    from .qwen_llm import QwenChat
+
+    base = _rss_mb()
+    t0 = time.perf_counter()
+    llm = QwenChat(model_name, prefix_cache_size=0, cpu_mode=mode, threads=threads,
+                   interop_threads=interop_threads, compile=compile)
+    load_s = time.perf_counter() - t0
+    rss = _rss_mb() - base
+    if prompts:
+        llm.chat(*prompts[0])  # ısınma
+    new_tokens = 0
+    t0 = time.perf_counter()
+    for system, user in prompts:
+        llm.chat(system, user)
+        new_tokens += llm.last_new_tokens
+    return CpuModeResult(llm.cpu_mode or "cuda", load_s, rss, len(prompts), new_tokens,
+                         time.perf_counter() - t0)
+
+
+def bench_cpu_modes(agent, questions: List[str], modes: Sequence[str] = ("fp32", "int8", "bf16"),
+                    k: int | None = None) -> List[CpuModeResult]:
+    """
+    QwenChat'i her CPU modunda ayrı bir süreçte yükleyip bellek (RSS) ve
+    token başına gecikmeyi ölçer. Prompt'lar extract prompt'larıdır.
+    """
+    import multiprocessing as mp
+    from concurrent.futures import ProcessPoolExecutor
+
+    cfg = agent.cfg
+    prompts = extract_prompts(agent, questions, k)
+    results = []
+    for mode in modes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as ex:
+            results.append(ex.submit(
+                _measure_cpu_mode, cfg.qwen_model, mode, prompts,
+                cfg.torch_threads, cfg.torch_interop_threads, cfg.torch_compile,
+            ).result())
+    return results
+
+
+# ---------- Çok süreçli ölçekleme ----------
+
+@dataclass
+class ScalingResult:
+    workers: int
+    questions: int
+    wall_s: float      # süreç başlatma + model yükleme dahil
+    work_s: float      # yükleme hariç: en yavaş işçinin çalışma süresi
+    load_s: float      # işçilerin en uzun yükleme süresi
+
+    @property
+    def qps(self) -> float:
+        return self.questions / self.work_s if self.work_s else 0.0
+
+    def as_dict(self) -> Dict:
+        return {**asdict(self), "qps": round(self.qps, 3)}
+
+
+def bench_scaling(agent, questions: List[str], workers: Sequence[int] = (1, 2, 4),
+                  k: int | None = None, pin: bool = True) -> List[ScalingResult]:
+    """batch --workers N ile aynı yol; her N için soru/s (yükleme hariç) ölçülür."""
+    import tempfile
+    from .batch_runner import Checkpoint, run_sharded
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in workers:
+            ckpt = Checkpoint(f"{tmp}/w{n}.jsonl")
+            stats, per_worker = run_sharded(
+                agent.cfg, agent.prompt_yaml, questions, lambda i, out: {"idx": i}, ckpt, n, k=k, pin=pin,
+            )
+            results.append(ScalingResult(
+                workers=n, questions=stats.done, wall_s=stats.wall_s,
+                work_s=max((w["wall_s"] for w in per_worker), default=0.0),
+                load_s=max((w["load_s"] for w in per_worker), default=0.0),
+            ))
+    return results
+
+
+# ---------- Uçtan uca boru hattı ----------
+
+PIPELINE_STAGES = (
+    "parse", "chunk", "embed", "index",                      # indeksleme (dosya / batch başına)
+    "query_embed", "search", "rerank", "context",             # soru başına
+    "extract", "verify", "reference", "question",             # question: soru başına toplam
+)
+
+
+# Trace span adı -> aşama (soru başına toplanır; bkz. QueryAgent._ask_steps)
+_SPAN_STAGES = {
+    "query_embed": "query_embed", "search": "search", "rerank": "rerank", "context": "context",
+    "llm.chat": "extract", "llm.classify": "verify", "grounding": "reference", "reference": "reference",
+}
+
+# İndeksleme span'leri (dosya / batch başına; bkz. run_ingest, QueryAgent._upsert)
+_INGEST_STAGES = {
+    "ingest.parse": "parse", "ingest.chunk": "chunk", "ingest.embed": "embed", "ingest.index": "index",
+}
+
+
+@dataclass
+class StageStats:
+    stage: str
+    n: int
+    total_s: float
+    p50_ms: float
+    p95_ms: float
+
+    @classmethod
+    def of(cls, stage: str, samples: List[float]) -> "StageStats":
+        if not samples:
+            return cls(stage, 0, 0.0, 0.0, 0.0)
+        ms = np.asarray(samples, dtype=np.float64) * 1000.0
+        return cls(stage, len(samples), float(sum(samples)),
+                   float(np.percentile(ms, 50)), float(np.percentile(ms, 95)))
+
+
+@dataclass
+class PipelineResult:
+    corpus: str           # ör. "kvkk" veya "kvkk_x8" (sentetik)
+    backend: str
+    stub: bool
+    pages: int
+    chunks: int
+    questions: int
+    index_s: float        # indeksleme duvar süresi (parse + chunk + embed + index)
+    query_s: float        # soru döngüsü
+    rss_mb: float         # ölçüm sonunda yerleşik bellek
+    peak_rss_mb: float    # süreç boyunca tepe (VmHWM)
+    index_mb: float       # indeks klasörünün diskteki boyutu
+    answers_sha: str      # cevapların parmak izi (stub'la deterministik)
+    stages: Dict[str, StageStats] = field(default_factory=dict)
+
+    @property
+    def qps(self) -> float:
+        return self.questions / self.query_s if self.query_s else 0.0
+
+    @property
+    def chunks_per_s(self) -> float:
+        return self.chunks / self.index_s if self.index_s else 0.0
+
+    def as_dict(self) -> Dict:
+        d = asdict(self)
+        d["stages"] = {name: asdict(st) for name, st in self.stages.items()}
+        return {**d, "qps": round(self.qps, 3), "chunks_per_s": round(self.chunks_per_s, 1)}
+
+
+def _synthetic_pages(pages: List, copies: int, seed: int = 0) -> List:
+    """
+    Sayfaları `copies` kez çoğaltır. İlk kopya özgün metindir; diğerlerinde her sayfanın
+    cümleleri sabit tohumlu RNG ile karıştırılır ve kaynak adı değişir (Test.pdf -> Test~2.pdf).
+    Kelime dağılımı korunur, chunk'lar birebir tekrar etmez.
+    """
+    from .ingest_multi import PageChunk
+
+    out = list(pages)
+    for c in range(2, copies + 1):
+        rng = random.Random(f"{seed}|{c}")
+        for pg in pages:
+            sents = re.split(r"(?<=[.!?;:])\s+", pg.text)
+            rng.shuffle(sents)
+            out.append(PageChunk(page=pg.page, text=" ".join(sents), source=_copy_name(pg.source, c)))
+    return out
+
+
+def _copy_name(source: str, c: int) -> str:
+    stem, dot, ext = source.rpartition(".")
+    return f"{stem}~{c}.{ext}" if dot else f"{source}~{c}"
+
+
+def _corpus_files(pdf_paths: List[str], copies: int, folder: str, store, seed: int = 0) -> List[str]:
+    """
+    İndekslenecek dosyalar: özgün PDF'ler + (copies > 1) sentetik kopyalar. Her kopya
+    klasöre ayrı bir dosya olarak yazılır (özgün bayt + kopya numaralı yorum satırı;
+    hash'i ve chunk ID'leri farklı) ve karıştırılmış sayfaları o hash'le PageStore'a
+    konur: ingest işçisi kopyanın sayfalarını depodan okur, parse etmez.
+    """
+    from .ingest_multi import read_pdf_pages
+    from .manifest import file_sha256
+
+    files = list(pdf_paths)
+    if copies <= 1:
+        return files
+    pages = [pg for pdf in pdf_paths for pg in read_pdf_pages(pdf)]
+    by_source: Dict[str, List] = {}
+    for pg in _synthetic_pages(pages, copies, seed)[len(pages):]:
+        by_source.setdefault(pg.source, []).append(pg)
+    for pdf in pdf_paths:
+        raw = Path(pdf).read_bytes()
+        for c in range(2, copies + 1):
+            path = Path(folder) / _copy_name(Path(pdf).name, c)
+            path.write_bytes(raw + f"\n% synthetic copy {c}\n".encode("ascii"))
+            store.put_pages(file_sha256(str(path)), by_source.get(path.name, []))
+            files.append(str(path))
+    return files
+
+
+def _dir_mb(path: str) -> float:
+    return sum(p.stat().st_size for p in Path(path).rglob("*") if p.is_file()) / (1024.0 * 1024.0)
+
+
+def bench_pipeline(cfg, prompt_yaml: str, pdf_paths: List[str], questions: List[str],
+                   k: int | None = None, scales: Sequence[int] = (1,), stub: bool = False,
+                   seed: int = 0) -> List[PipelineResult]:
+    """
+    İndekslemeden cevaba kadar her aşamanın gecikmesi (p50/p95), throughput ve bellek.
+    Her ölçek için geçici bir klasörde sıfırdan indeks kurulur; ölçek > 1 sentetik
+    kopyalarla (bkz. _corpus_files) büyütülmüş derlemdir. İndeksleme üretimdeki yoldan
+    (QueryAgent._sync -> run_ingest: süreç havuzu, manifest ID'leri, PageStore) geçer;
+    sorular QueryAgent.ask ile çalışır. Aşama süreleri trace span'lerinden okunur.
+    Cevap/embedding önbellekleri kapalıdır: her soru tüm aşamalardan geçer.
+    stub=True: model ağırlığı yüklenmez (bench_stubs); sonuçlar deterministiktir.
+    """
+    import dataclasses
+    import tempfile
+    from . import tracing
+    from .ingest_multi import read_pdf_pages
+    from .qa_agent import QueryAgent
+    from .vectorstore import index_size
+
+    k = k or cfg.top_k
+    n_pages = sum(len(read_pdf_pages(pdf)) for pdf in pdf_paths)
+
+    results: List[PipelineResult] = []
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as tmp:
+            run_cfg = dataclasses.replace(
+                cfg, chroma_dir=str(Path(tmp) / "index"), page_store_dir=str(Path(tmp) / "pages"),
+                embed_cache_dir="", answer_cache_size=0, answer_cache_path="", query_emb_cache_size=0,
+                rerank=cfg.rerank and not stub, trace_debug=True, trace_log_path="",
+            )
+            if stub:
+                # Stub embedder'ın skorları gerçek modelle kalibre edilmiş eşiklerle kıyaslanamaz
+                run_cfg = dataclasses.replace(run_cfg, min_relevance=0.0, low_conf_gap=0.0)
+            agent = QueryAgent(run_cfg, prompt_yaml)
+            if stub:
+                from .bench_stubs import StubChat, StubEmbeddings, StubTokenizer
+                agent._emb, agent._llm, agent._tok = StubEmbeddings(), StubChat(), StubTokenizer()
+            agent.emb, agent.llm  # yükleme ölçüme girmesin
+            times: Dict[str, List[float]] = {name: [] for name in PIPELINE_STAGES}
+
+            # --- indeksleme: build_index ile aynı yol; aşama süreleri ingest span'lerinden ---
+            copies = Path(tmp) / "copies"
+            copies.mkdir()
+            files = _corpus_files(pdf_paths, int(scale), str(copies), agent.store, seed)
+            vs, manifest = agent._open_index()
+            trace = tracing.Trace("bench.ingest")
+            t_index = time.perf_counter()
+            with tracing.activate(trace):
+                agent._sync(vs, manifest, manifest.plan(files))
+            index_s = time.perf_counter() - t_index
+            for sp in trace.spans:
+                stage = _INGEST_STAGES.get(sp["name"])
+                if stage is not None:
+                    times[stage].append(sp["duration_ms"] / 1000.0)
+
+            # --- soru başına: QueryAgent.ask'in kendisi; aşama süreleri trace span'lerinden ---
+            answers: List[str] = []
+            t_loop = time.perf_counter()
+            for q in questions:
+                t_q = time.perf_counter()
+                out = agent.ask(q, k=k)
+                times["question"].append(time.perf_counter() - t_q)
+                per_q: Dict[str, float] = {}
+                for sp in (out.debug or {}).get("spans", []):
+                    stage = _SPAN_STAGES.get(sp["name"])
+                    if stage is not None:
+                        per_q[stage] = per_q.get(stage, 0.0) + sp["duration_ms"] / 1000.0
+                for stage, seconds in per_q.items():
+                    times[stage].append(seconds)
+                answers.append(f"{out.answer}|{out.reference.doc_id}|{out.reference.page}")
+            query_s = time.perf_counter() - t_loop
+
+            results.append(PipelineResult(
+                corpus=f"kvkk_x{scale}" if scale > 1 else "kvkk",
+                backend=run_cfg.vector_backend,
+                stub=stub,
+                pages=n_pages * max(1, int(scale)),
+                chunks=index_size(vs),
+                questions=len(questions),
+                index_s=index_s,
+                query_s=query_s,
+                rss_mb=_rss_mb(),
+                peak_rss_mb=_status_mb("VmHWM"),
+                index_mb=_dir_mb(run_cfg.chroma_dir),
+                answers_sha=hashlib.sha1("\n".join(answers).encode("utf-8")).hexdigest()[:16],
+                stages={name: StageStats.of(name, ts) for name, ts in times.items()},
+            ))
+            del agent, vs
+    return results
+
+
+@dataclass
+class StageDiff:
+    corpus: str
+    stage: str
+    base_ms: float
+    now_ms: float
+    regressed: bool
+
+    @property
+    def ratio(self) -> float:
+        return self.now_ms / self.base_ms if self.base_ms else 0.0
+
+
+def compare_baseline(results: List[PipelineResult], baseline: List[Dict],
+                     tolerance: float = 1.25, min_ms: float = 0.5) -> List[StageDiff]:
+    """
+    Aşama p50'lerini kayıtlı bir bench_pipeline JSON'uyla (aynı corpus adı) karşılaştırır.
+    p50 tabanın `tolerance` katını ve min_ms'den fazla aşarsa gerileme sayılır
+    (mikro saniyelik aşamalardaki gürültü yok sayılsın).
+    """
+    base = {b["corpus"]: b for b in baseline}
+    diffs = []
+    for r in results:
+        b = base.get(r.corpus)
+        if b is None:
+            continue
+        for name, st in r.stages.items():
+            bst = (b.get("stages") or {}).get(name)
+            if not bst or not st.n or not bst.get("n"):
+                continue
+            base_ms = float(bst["p50_ms"])
+            diffs.append(StageDiff(r.corpus, name, base_ms, st.p50_ms,
+                                   st.p50_ms > base_ms * tolerance and st.p50_ms - base_ms > min_ms))
+    return diffs
+
+
+# ---------- Sıkıştırılmış vektörler: recall@k ve bellek ----------
+
+@dataclass
+class VectorResult:
+    variant: str          # ör. "float32", "int8", "int8+rescore"
+    chunks: int
+    questions: int
+    k: int
+    recall: float         # float32 tam top-k'ya göre ortalama recall@k
+    vector_mb: float      # aramada taranan vektör verisi (bellekte tutulması gereken)
+    disk_mb: float        # indeks klasörü (float32 kopya dahil)
+    p50_ms: float         # soru başına arama gecikmesi
+    p95_ms: float
+
+    def as_dict(self) -> Dict:
+        return asdict(self)
+
+
+def bench_vectors(cfg, pdf_paths: List[str], questions: List[str], k: int | None = None,
+                  variants: Sequence[str] = ("float32", "float16", "int8", "int8+rescore"),
+                  scale: int = 1, stub: bool = False, seed: int = 0) -> List[VectorResult]:
+    """
+    Flat indeksin dtype seçeneklerini aynı embedding'lerle karşılaştırır. Derlem bir kez
+    üretimdeki ingest yolundan (run_ingest: süreç havuzu, manifest chunk ID'leri, PageStore)
+    geçirilip embed edilir; her varyant geçici klasörde kurulur ve sorular tek tek
+    aranır. Referans, float32 vektörlerle tam (exact) top-k'dır.
+    "<dtype>+rescore": cfg.flat_rescore (0 ise 4*k) aday tam hassasiyetle yeniden sıralanır.
+    """
+    import tempfile
+    from .ingest_pipeline import run_ingest
+    from .manifest import file_sha256
+    from .page_store import PageStore
+    from .vectorstore import FlatIndex, add_embeddings
+
+    k = k or cfg.top_k
+    if stub:
+        from .bench_stubs import StubEmbeddings
+        emb = StubEmbeddings()
+    else:
+        from .embeddings import build_embeddings
+        emb = build_embeddings(cfg.embed_model)
+
+    docs: List = []
+    ids: List[str] = []
+    parts: List[np.ndarray] = []
+
+    def collect(batch_docs: List, batch_ids: List[str]) -> None:
+        docs.extend(batch_docs)
+        ids.extend(batch_ids)
+        parts.append(np.asarray(emb.embed_documents([d.page_content for d in batch_docs]), dtype=np.float32))
+
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        store_root = str(Path(corpus_dir) / "pages")
+        store = PageStore(store_root, cfg.chunk_size, cfg.chunk_overlap)
+        files = _corpus_files(pdf_paths, int(scale), corpus_dir, store, seed)
+        run_ingest(
+            files, {f: file_sha256(f) for f in files}, upsert=collect, on_file_done=lambda pdf, file_ids: None,
+            chunk_size=cfg.chunk_size, chunk_overlap=cfg.chunk_overlap, workers=cfg.ingest_workers,
+            batch_size=cfg.ingest_batch_size, queue_size=cfg.ingest_queue_size, store_root=store_root,
+        )
+    if not docs:
+        return []
+    vecs = np.concatenate(parts)
+    row_of = {cid: i for i, cid in enumerate(ids)}
+    step = max(1, int(cfg.ingest_batch_size))
+    qvecs = np.asarray(emb.embed_queries(questions), dtype=np.float32)
+    kk = min(k, len(docs))
+    exact = [set(np.argsort(-(vecs @ q))[:kk].tolist()) for q in qvecs]
+
+    results: List[VectorResult] = []
+    for variant in variants:
+        dtype, _, mode = variant.partition("+")
+        rescore = (cfg.flat_rescore or 4 * k) if mode == "rescore" else 0
+        with tempfile.TemporaryDirectory() as tmp:
+            vs = FlatIndex(None, tmp, dtype=dtype, rescore=rescore)
+            for s in range(0, len(docs), step):
+                add_embeddings(vs, docs[s:s + step], ids[s:s + step], vecs[s:s + step])
+            times, hits = [], 0
+            for q, truth in zip(qvecs, exact):
+                t = time.perf_counter()
+                found = vs.search_by_vectors([q.tolist()], k, with_text=False)[0]
+                times.append(time.perf_counter() - t)
+                hits += len(truth & {row_of[cid] for cid, _, _, _ in found})
+            st = StageStats.of("search", times)
+            results.append(VectorResult(
+                variant=variant,
+                chunks=len(docs),
+                questions=len(questions),
+                k=kk,
+                recall=hits / (kk * len(questions)) if kk and questions else 0.0,
+                vector_mb=vs.vector_bytes / (1024.0 * 1024.0),
+                disk_mb=_dir_mb(tmp),
+                p50_ms=st.p50_ms,
+                p95_ms=st.p95_ms,
+            ))
+            del vs
+    return results
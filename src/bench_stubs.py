@@ -0,0 +1,123 @@
+# src/bench_stubs.py
+from __future__ import annotations
+import hashlib
+import re
+from types import SimpleNamespace
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from . import tracing
+from .utils import cut_at_stop
+
+# Model ağırlığı gerektirmeyen, deterministik yer tutucular: bench'in CI'da
+# (çevrimdışı) çalışması için. Ölçülen şey boru hattının kendi maliyetidir.
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def _words(text: str) -> List[str]:
+    return [w.casefold() for w in _WORD.findall(text)]
+
+
+class StubEmbeddings(Embeddings):
+    """Kelime hash'lerinden (feature hashing) normalize vektör; E5Embeddings arayüzü."""
+    def __init__(self, dim: int = 384):
+        self.dim = int(dim)
+
+    def _vec(self, text: str) -> np.ndarray:
+        v = np.zeros(self.dim, dtype=np.float32)
+        for w in _words(text):
+            h = int.from_bytes(hashlib.blake2b(w.encode("utf-8"), digest_size=8).digest(), "little")
+            v[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        n = float(np.linalg.norm(v))
+        return v / n if n else v
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vec(t).tolist() for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vec(text).tolist()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+
+class StubTokenizer:
+    """Kelime + noktalama parçaları; QueryAgent._count_tokens'ın kullandığı çağrı biçimi."""
+    _TOK = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+    def __call__(self, text: str, add_special_tokens: bool = False):
+        return SimpleNamespace(input_ids=self._TOK.findall(text))
+
+
+class StubChat:
+    """
+    QwenChat'in kullanılan arayüzü. extract: bağlamda soruyla en çok kelime paylaşan
+    satırın ilk max_words kelimesi; classify: cevap kelimelerinin bağlamdaki oranı.
+    """
+    def __init__(self, max_words: int = 12):
+        self.max_words = int(max_words)
+        self.tok = StubTokenizer()
+        self.decoding = "greedy"
+        self.prefix_cache_size = 0
+        self.last_new_tokens = 0
+
+    @staticmethod
+    def _split(user: str) -> Tuple[str, str]:
+        # context-first şablon: "----\n{context}\n----" ... "Soru: {question}"
+        parts = user.split("----")
+        context = parts[1] if len(parts) >= 3 else user
+        q = re.search(r"Soru:\s*(.*)", user)
+        return context, (q.group(1) if q else "")
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tok(text).input_ids)
+
+    def clear_prefix_cache(self) -> None:
+        pass
+
+    def chat(self, system: str, user: str, cache_prefix: Optional[str] = None, assist: bool = False,
+             max_new_tokens: Optional[int] = None, stop: Optional[Sequence[str]] = None) -> str:
+        # QwenChat ile aynı span adları: bench aşamaları trace'ten okunur
+        with tracing.span("llm.chat", assist=False) as sp:
+            out = self._answer(user, max_new_tokens, stop)
+            sp.update(prompt_tokens=self.count_tokens(system + user), cached_tokens=0,
+                      new_tokens=self.last_new_tokens)
+        return out
+
+    def _answer(self, user: str, max_new_tokens: Optional[int], stop: Optional[Sequence[str]]) -> str:
+        context, question = self._split(user)
+        qw = set(_words(question))
+        best, best_n = "", 0
+        for line in context.splitlines():
+            n = len(qw & set(_words(line)))
+            if n > best_n:
+                best, best_n = line, n
+        words = best.split()[: min(self.max_words, max_new_tokens or self.max_words)]
+        out = " ".join(words) if words else "BELİRTİLMEMİŞ"
+        self.last_new_tokens = self.count_tokens(out)
+        return cut_at_stop(out, stop)
+
+    def chat_stream(self, system: str, user: str, **kwargs) -> Iterator[str]:
+        for i, w in enumerate(self.chat(system, user, **kwargs).split(" ")):
+            yield w if i == 0 else " " + w
+
+    def chat_batch(self, pairs: List[Tuple[str, str]], batch_size: Optional[int] = None,
+                   assist: bool = False, **kwargs) -> List[str]:
+        return [self.chat(s, u, **kwargs) for s, u in pairs]
+
+    def classify(self, system: str, user: str, labels: Tuple[str, ...] = ("YES", "NO"),
+                 cache_prefix: Optional[str] = None) -> float:
+        with tracing.span("llm.classify") as sp:
+            context, _ = self._split(user)
+            m = re.search(r"Cevap:\s*(.*)", user)
+            aw = _words(m.group(1) if m else "")
+            cw = set(_words(context))
+            sp.update(prompt_tokens=self.count_tokens(system + user), cached_tokens=0, new_tokens=0)
+            return sum(w in cw for w in aw) / len(aw) if aw else 0.0
+
+    def classify_batch(self, pairs: List[Tuple[str, str]], labels: Tuple[str, ...] = ("YES", "NO"),
+                       batch_size: Optional[int] = None) -> List[float]:
+        return [self.classify(s, u, labels) for s, u in pairs]
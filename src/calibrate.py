@@ -0,0 +1,70 @@
+# src/calibrate.py
+from __future__ import annotations
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .vectorstore import best_scores_info
+
+
+@dataclass
+class GateChoice:
+    min_relevance: float
+    low_conf_gap: float
+    answerable: int
+    unanswerable: int
+    kept_answerable: int         # kapıdan geçen cevaplanabilir sorular
+    rejected_unanswerable: int   # kapıda durdurulan cevaplanamaz sorular
+
+    @property
+    def recall(self) -> float:
+        return self.kept_answerable / self.answerable if self.answerable else 1.0
+
+    @property
+    def rejection(self) -> float:
+        return self.rejected_unanswerable / self.unanswerable if self.unanswerable else 0.0
+
+    def as_dict(self) -> Dict:
+        return {**asdict(self), "recall": round(self.recall, 4), "rejection": round(self.rejection, 4)}
+
+
+Hits = List[Tuple[Any, float]]
+
+
+def retrieval_hits(agent, questions: List[str], k: int = 5, source: Optional[str] = None) -> List[Hits]:
+    """Soru başına skorlu adaylar (QueryAgent.search_scored); LLM çağrılmaz, kapı uygulanmaz."""
+    return agent.search_scored(questions, max(int(k), 5), source)
+
+
+def _candidates(values: Sequence[float]) -> List[float]:
+    # 0 (kontrol kapalı) + gözlenen ardışık değerlerin orta noktaları (eğitim setine en geniş pay)
+    v = sorted({round(float(x), 6) for x in values if x > 0})
+    return [0.0] + [round((a + b) / 2, 6) for a, b in zip(v, v[1:])]
+
+
+def calibrate_gate(agent, hits: List[Hits], answerable: List[bool],
+                   max_false_reject: float = 0.0) -> GateChoice:
+    """
+    min_relevance x low_conf_gap ızgarasında, cevaplanabilir soruların en fazla
+    max_false_reject oranını kapıda kaybederek en çok cevaplanamaz soruyu durduran
+    eşik çiftini seçer. Eşitlikte daha az kayıp, sonra daha gevşek eşikler tercih edilir.
+    Her aday çift, çalışma anındaki kural olan agent.passes_gate ile değerlendirilir.
+    """
+    scores = [best_scores_info(h) for h in hits]
+    n_ans = sum(1 for a in answerable if a)
+    n_un = len(answerable) - n_ans
+    budget = int(max_false_reject * n_ans + 1e-9)
+    # Kapı kapalıyken (0, 0) geçen cevaplanabilirler; adayı olmayan soru hiçbir eşikte geçmez
+    kept_open = sum(1 for h, a in zip(hits, answerable) if a and agent.passes_gate(h, 0.0, 0.0))
+    best: Optional[Tuple[Tuple, GateChoice]] = None
+    for m in _candidates([t1 for t1, _ in scores]):
+        for g in _candidates([t1 - t5 for t1, t5 in scores]):
+            passed = [agent.passes_gate(h, m, g) for h in hits]
+            kept = sum(1 for p, a in zip(passed, answerable) if p and a)
+            rejected = sum(1 for p, a in zip(passed, answerable) if not p and not a)
+            if kept_open - kept > budget:
+                continue
+            key = (rejected, kept, -m, -g)
+            if best is None or key > best[0]:
+                best = (key, GateChoice(m, g, n_ans, n_un, kept, rejected))
+    assert best is not None  # (0, 0) her zaman bütçe içinde
+    return best[1]
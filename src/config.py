@@ -20,17 +20,85 @@ class Settings:
     chunk_size: int = 1200
     chunk_overlap: int = 120
     top_k: int = 5
+    scoped_top_k: int = 3  # pdf_path ile tek belgeye sınırlı isteklerde k (0 -> top_k)
     mmr: bool = True
     mmr_lambda: float = 0.5
 
+    # İndeksleme
+    ingest_workers: int = 0        # PDF parse süreç sayısı (0 -> cpu_count-1)
+    ingest_batch_size: int = 256   # embed + upsert batch boyutu (tepe belleği belirler)
+    ingest_queue_size: int = 8     # parse edilmiş PDF'ler için kuyruk sınırı
+
+    # Bağlam
+    context_max_tokens: int = 1536   # Qwen tokenizer'ıyla bağlam bütçesi (0 -> eski 6000 karakter sınırı)
+    token_count_cache_size: int = 100000
+
+    # Reranker (geniş getir -> cross-encoder ile sırala -> az chunk tut)
+    rerank: bool = False
+    rerank_model: str = "BAAI/bge-reranker-base"
+    rerank_fetch_k: int = 20     # reranker'a giden aday sayısı
+    rerank_top_n: int = 3        # bağlama giren chunk sayısı
+    rerank_threshold: float = 0.25
+    rerank_batch_size: int = 32
+    rerank_cache_size: int = 50000  # (soru, chunk) skor LRU'su
+
+    # LLM
+    llm_batch_size: int = 8  # batch komutunda tek generate'e giren prompt sayısı
+    prefix_cache_size: int = 3  # saklanan prompt öneki KV sayısı (0 -> kapalı)
+    decoding: str = "greedy"    # extract çağrısı: greedy | prompt_lookup | draft
+    prompt_lookup_num_tokens: int = 10
+    draft_model: str = ""       # decoding="draft" için küçük taslak model (aynı tokenizer)
+    cpu_mode: str = "auto"      # CUDA yoksa: auto | int8 | bf16 | fp32 (auto: bf16 destekliyse bf16, değilse int8)
+    torch_threads: int = 0      # 0 -> torch varsayılanı
+    torch_interop_threads: int = 0
+    torch_compile: bool = False
+
+    # Soru önbellekleri
+    query_emb_cache_size: int = 1024   # sorgu embedding LRU'su
+    answer_cache_size: int = 10000     # 0 -> cevap önbelleği kapalı
+    answer_cache_ttl_s: float = 86400.0
+    answer_cache_path: str = ""        # ör. storage/answer_cache.json (boş -> yalnızca bellek)
+    answer_cache_semantic: float = 0.0  # >0 -> bu kosinüs eşiğini geçen yakın soru cevabı kullanılır
+
     # eşikler
-    min_relevance: float = 0.08
+    # Getirme kapısı: en iyi skor < min_relevance ya da top1 - top5 < low_conf_gap ise
+    # LLM çağrılmadan BELİRTİLMEMİŞ döner (0 -> kontrol kapalı). Varsayılan kapalı;
+    # `app.py calibrate --write` kalibre edilmiş değerleri settings.yaml'a yazar.
+    min_relevance: float = 0.0
     low_conf_gap: float = 0.0
+    # cevap bu skorla bağlamda bulunursa verifier atlanır (1.0 birebir, 0.98 katlanmış;
+    # fuzzy eşleşmeler varsayılan olarak yalnızca referans için kullanılır)
+    grounding_threshold: float = 0.98
+    verify_threshold: float = 0.5  # verifier P(YES) bu değerin altındaysa cevap reddedilir
+
+    # İzleme
+    trace_log_path: str = ""   # soru/batch başına span'ler JSON satırı olarak ("-" -> stderr; boş -> kapalı)
+    trace_debug: bool = False  # span'ler OutputSchema.debug alanına da eklenir
 
     # Depolama
-    chroma_dir: str = "storage/chroma"
+    vector_backend: str = "chroma"  # "chroma" | "flat" (süreç içi mmap'li NumPy indeksi)
+    flat_dtype: str = "float32"     # flat indeks vektör tipi: float32 | float16 | int8 (boyut başına nicemleme)
+    flat_rescore: int = 0           # >0: sıkıştırılmış skorla bu kadar aday, float32 kopyayla yeniden sırala
+    chroma_dir: str = "storage/chroma"  # flat backend <chroma_dir>/flat altında durur
+    page_store_dir: str = "storage/pages"  # parse edilmiş sayfa/chunk metinleri (boş -> kapalı)
+    embed_cache_dir: str = "storage/embed_cache"  # boş -> embedding önbelleği kapalı
+    embed_cache_dtype: str = "float16"
+    embed_cache_max_items: int = 1_000_000
 
     # ---- Yükleyiciler ----
+    RETRIEVAL_KEYS = ("top_k", "scoped_top_k", "min_relevance", "low_conf_gap")
+
+    def apply_retrieval(self, section: Dict[str, Any]) -> Dict[str, Any]:
+        """settings.yaml `retrieval:` bölümü; uygulanan alanları döndürür (bilinmeyenler yok sayılır)."""
+        applied: Dict[str, Any] = {}
+        for key in self.RETRIEVAL_KEYS:
+            if section.get(key) is None:
+                continue
+            cast = type(getattr(self, key))
+            setattr(self, key, cast(section[key]))
+            applied[key] = getattr(self, key)
+        return applied
+
     @classmethod
     def from_yaml(cls, yaml_path: Optional[str] = None) -> "Settings":
         """
@@ -39,6 +107,9 @@ class Settings:
         models:
           query: Qwen/Qwen3-4B-Instruct-2507
           # embed: intfloat/multilingual-e5-base   (opsiyonel)
+        retrieval:                                  (opsiyonel; bkz. apply_retrieval)
+          min_relevance: 0.08                       (app.py calibrate --write)
+          low_conf_gap: 0.0
 
         YAML yoksa veya alan bulunamazsa -> varsayılanları korur.
         Ortam değişkenleri her zaman en yüksek önceliğe sahiptir:
@@ -59,7 +130,7 @@ class Settings:
             if isinstance(embed_from_yaml, str) and embed_from_yaml.strip():
                 inst.embed_model = embed_from_yaml.strip()
 
-            # İstersen burada başka alanları da (chunk_size, chroma_dir vs.) yaml'dan okuyabilirsin.
+            inst.apply_retrieval(data.get("retrieval") or {})
 
         # 2) ENV override (her zaman öncelikli)
         qwen_env = os.getenv("QWEN_MODEL")
@@ -75,6 +146,18 @@ class Settings:
         if chroma_env and chroma_env.strip():
             inst.chroma_dir = chroma_env.strip()
 
+        backend_env = os.getenv("VECTOR_BACKEND")
+        if backend_env and backend_env.strip():
+            inst.vector_backend = backend_env.strip().lower()
+
+        cpu_env = os.getenv("QWEN_CPU_MODE")
+        if cpu_env and cpu_env.strip():
+            inst.cpu_mode = cpu_env.strip().lower()
+
+        trace_env = os.getenv("RAG_TRACE_LOG")
+        if trace_env and trace_env.strip():
+            inst.trace_log_path = trace_env.strip()
+
         topk_env = os.getenv("TOP_K")
         if topk_env and topk_env.isdigit():
             inst.top_k = int(topk_env)
@@ -0,0 +1,151 @@
+# src/context_builder.py
+from __future__ import annotations
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+
+from .qcache import QueryEmbeddingLRU
+
+# Cümle sonu: noktalama + boşluk ya da paragraf arası. Tek satır sonu sayılmaz:
+# pypdf metninde her satır kaydırması da "\n" olarak gelir.
+_SENT_END = re.compile(r"[.!?…:;](?=\s)|\n\s*\n")
+_WORD_END = re.compile(r"\S(?=\s)")
+
+
+def overlap_len(a: str, b: str, min_len: int = 16) -> int:
+    """a'nın sonu ile b'nin başı arasındaki en uzun ortak parça (chunk_overlap tekrarı)."""
+    probe = b[:min_len]
+    if len(probe) < min_len:
+        return len(b) if a.endswith(b) else 0
+    i = a.find(probe, max(0, len(a) - len(b)))
+    while i != -1:
+        if b.startswith(a[i:]):
+            return len(a) - i
+        i = a.find(probe, i + 1)
+    return 0
+
+
+def _chunk_pos(d: Document) -> Optional[int]:
+    # "<önek>-p<sayfa>-<n>" -> n (sayfa içi sıra); ID yoksa komşuluk bilinmez
+    cid = str(d.metadata.get("chunk_id") or "")
+    try:
+        return int(cid.rsplit("-", 1)[1])
+    except (IndexError, ValueError):
+        return None
+
+
+@dataclass
+class _Piece:
+    doc: Document
+    pos: Optional[int]
+    lo: int
+    hi: int
+    head_trim: bool = False   # baştaki tekrar (önceki chunk'la ortak) atıldı
+    tail_trim: bool = False   # sondaki tekrar (sonraki chunk'la ortak) atıldı
+
+
+class ContextBuilder:
+    """
+    Token bütçeli bağlam paketleyici.
+
+    - Bütçe LLM tokenizer'ıyla ölçülür; parça başına token sayıları metin hash'iyle
+      önbelleğe alınır (aynı chunk'lar sorular arasında tekrar sayılmaz).
+    - Aynı kaynak/sayfadaki komşu chunk'lar birleştirilir, chunk_overlap tekrarı atılır.
+    - Bütçe getirme sırasıyla doldurulur; sığmayan ilk chunk'tan yalnızca cümle
+      sınırında biten, sığan en uzun baş kısım alınır ve durulur (hiçbir şey
+      seçilmemişse kelime sınırına düşülür).
+    Toplam, parça sayımlarının toplamıdır (tokenizer sınır etkileri nedeniyle yaklaşık).
+    """
+    def __init__(self, count_tokens: Callable[[str], int], max_tokens: int = 1536, cache_size: int = 100000):
+        self._count = count_tokens
+        self.max_tokens = int(max_tokens)
+        self.counts = QueryEmbeddingLRU(cache_size)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        n = self.counts.get(key)
+        if n is None:
+            n = self._count(text)
+            self.counts.put(key, n)
+        return n
+
+    @staticmethod
+    def _header(d: Document) -> str:
+        return f"[{d.metadata.get('source')} | s.{d.metadata.get('page')}]"
+
+    def _sentence_prefix(self, text: str, budget: int, pattern: re.Pattern = _SENT_END) -> int:
+        """text'in cümle sınırında biten ve budget'a sığan en uzun baş kısmının uzunluğu."""
+        cuts = [m.end() for m in pattern.finditer(text)]
+        lo, hi, best = 0, len(cuts) - 1, 0
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            if self._count(text[:cuts[mid]]) <= budget:
+                best, lo = cuts[mid], mid + 1
+            else:
+                hi = mid - 1
+        return best
+
+    def select(self, docs: List[Document]) -> List[List[_Piece]]:
+        """Bütçeye giren parçalar; kaynak/sayfa bloğu başına, blok içinde sayfa sırasıyla."""
+        blocks: Dict[Tuple[str, int], List[_Piece]] = {}
+        seen_text = set()
+        used = 0
+        for d in docs:
+            text = d.page_content.strip()
+            if not text or text in seen_text:
+                continue
+            key = (str(d.metadata.get("source")), int(d.metadata.get("page") or 0))
+            block = blocks.get(key)
+            cost = 0 if block else self.count(self._header(d)) + 1
+            piece = _Piece(doc=d, pos=_chunk_pos(d), lo=0, hi=len(text))
+            prev = nxt = None
+            if block and piece.pos is not None:
+                prev = next((p for p in block if p.pos == piece.pos - 1), None)
+                nxt = next((p for p in block if p.pos == piece.pos + 1), None)
+            if prev is not None and not prev.tail_trim:
+                k = overlap_len(prev.doc.page_content.strip()[:prev.hi], text)
+                piece.lo, piece.head_trim = k, k > 0
+            if nxt is not None and not nxt.head_trim:
+                k = overlap_len(text[piece.lo:], nxt.doc.page_content.strip()[nxt.lo:])
+                piece.hi, piece.tail_trim = len(text) - k, k > 0
+            body = text[piece.lo:piece.hi]
+            cost += self.count(body) + 1
+            if used + cost > self.max_tokens:
+                # Son parça: cümle sınırında kesilmiş baş kısım (sonraki chunk'la artık bitişik değil)
+                room = self.max_tokens - used - (cost - self.count(body))
+                cut = self._sentence_prefix(body, room)
+                if cut == 0 and not blocks:
+                    # Tek bir cümle bile sığmıyorsa boş bağlam yerine kelime sınırında kes
+                    cut = self._sentence_prefix(body, room, _WORD_END)
+                if cut > 0:
+                    piece.hi, piece.tail_trim = piece.lo + cut, False
+                    blocks.setdefault(key, []).append(piece)
+                break
+            seen_text.add(text)
+            blocks.setdefault(key, []).append(piece)
+            used += cost
+        for block in blocks.values():
+            block.sort(key=lambda p: -1 if p.pos is None else p.pos)
+        return list(blocks.values())
+
+    def build(self, docs: List[Document]) -> str:
+        parts = []
+        for block in self.select(docs):
+            out = self._header(block[0].doc) + "\n"
+            for i, p in enumerate(block):
+                body = p.doc.page_content.strip()[p.lo:p.hi]
+                if i > 0:
+                    prev = block[i - 1]
+                    if prev.tail_trim or p.head_trim:
+                        pass  # tekrar atıldı: metin kesintisiz devam eder
+                    elif prev.pos is not None and p.pos == prev.pos + 1:
+                        out += "\n"
+                    else:
+                        out += "\n...\n"
+                out += body
+            parts.append(out + "\n")
+        return "\n".join(parts)
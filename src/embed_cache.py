@@ -0,0 +1,181 @@
+# src/embed_cache.py
+from __future__ import annotations
+import atexit
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    İçerik adresli, diskte kalıcı embedding önbelleği.
+
+    Anahtar: (model adı, normalize bayrağı) -> alt klasör; klasör içinde
+    sha1("passage: ..."/"query: ..." metni). Vektörler tek bir ham dosyada
+    (N x dim, float16/float32) satır satır tutulur ve np.memmap ile okunur;
+    anahtar -> satır eşlemesi index.npz'de saklanır.
+    Kayıt sayısı max_items'ı aşınca en az yakın zamanda kullanılanlar atılır
+    (dosya sıkıştırılarak yeniden yazılır).
+
+    dir/<sha1(model|normalize)[:16]>/
+        meta.json     {"model", "normalize", "dim", "dtype"}
+        vectors.bin   ham satırlar
+        index.npz     keys (S40), rows (int64), ticks (int64)
+
+    index.npz yalnızca flush()'ta (ve sıkıştırmadan hemen sonra) yazılır; yalnızca
+    okuma (LRU tick'i) değişikliği tek başına diski yazdırmaz. vectors.bin yeniden
+    yazılmadan önce index.npz silinir: arada çökme eski eşlemeyi yeni satırlarla
+    eşleştiremez, önceki eşleme yalnızca kaybolur.
+    """
+    def __init__(self, cache_dir: str, model_name: str, normalize: bool = True,
+                 dtype: str = "float16", max_items: int = 1_000_000):
+        fp = hashlib.sha1(f"{model_name}|{int(bool(normalize))}".encode("utf-8")).hexdigest()[:16]
+        self.dir = Path(cache_dir) / fp
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.normalize = bool(normalize)
+        self.dtype = np.dtype(dtype)
+        self.max_items = int(max_items)
+
+        self._vec_path = self.dir / "vectors.bin"
+        self._idx_path = self.dir / "index.npz"
+        self._meta_path = self.dir / "meta.json"
+
+        self.dim: Optional[int] = None
+        self._rows: Dict[str, int] = {}
+        self._ticks: Dict[str, int] = {}
+        self._tick = 0
+        self._n_rows = 0            # vectors.bin içindeki satır sayısı
+        self._mm: Optional[np.memmap] = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._load()
+        atexit.register(self.flush)
+
+    # ---------- Yardımcılar ----------
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _load(self) -> None:
+        if not (self._meta_path.is_file() and self._idx_path.is_file() and self._vec_path.is_file()):
+            return
+        try:
+            meta = json.loads(self._meta_path.read_text(encoding="utf-8"))
+            if np.dtype(meta["dtype"]) != self.dtype:
+                return  # farklı dtype ile yazılmış; baştan kurulur
+            self.dim = int(meta["dim"])
+            idx = np.load(self._idx_path)
+            keys = [k.decode("ascii") for k in idx["keys"]]
+            self._rows = dict(zip(keys, idx["rows"].tolist()))
+            self._ticks = dict(zip(keys, idx["ticks"].tolist()))
+            self._tick = max(self._ticks.values(), default=0)
+            row_bytes = self.dim * self.dtype.itemsize
+            self._n_rows = self._vec_path.stat().st_size // row_bytes
+            if self._rows and max(self._rows.values()) >= self._n_rows:
+                raise ValueError("index.npz vectors.bin ile uyuşmuyor")
+        except Exception:
+            # Bozuk önbellek sadece yavaşlık demektir; sıfırdan başla
+            self.dim, self._rows, self._ticks, self._tick, self._n_rows = None, {}, {}, 0, 0
+
+    def _matrix(self) -> np.memmap:
+        if self._mm is None or self._mm.shape[0] != self._n_rows:
+            self._mm = np.memmap(self._vec_path, dtype=self.dtype, mode="r",
+                                 shape=(self._n_rows, self.dim))
+        return self._mm
+
+    # ---------- Okuma / yazma ----------
+    def get_many(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        with self._lock:
+            out: List[Optional[np.ndarray]] = [None] * len(keys)
+            if not self._rows:
+                return out
+            mm = self._matrix()
+            for i, k in enumerate(keys):
+                row = self._rows.get(k)
+                if row is None:
+                    continue
+                out[i] = np.asarray(mm[row], dtype=np.float32)
+                self._tick += 1
+                self._ticks[k] = self._tick  # bir sonraki flush'ta kalıcı olur
+            return out
+
+    def put_many(self, keys: Sequence[str], vecs: np.ndarray) -> None:
+        if len(keys) == 0:
+            return
+        vecs = np.asarray(vecs)
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vecs.shape[1])
+                self._drop_index()  # eski (ör. farklı dtype'lı) eşleme yeni dosyaya uygulanmasın
+                self._meta_path.write_text(json.dumps({
+                    "model": self.model_name, "normalize": self.normalize,
+                    "dim": self.dim, "dtype": self.dtype.name,
+                }), encoding="utf-8")
+                self._vec_path.write_bytes(b"")
+            new = [(k, v) for k, v in zip(keys, vecs) if k not in self._rows]
+            if not new:
+                return
+            block = np.stack([v for _, v in new]).astype(self.dtype)
+            with self._vec_path.open("ab") as f:
+                f.write(block.tobytes())
+            for k, _ in new:
+                self._rows[k] = self._n_rows
+                self._n_rows += 1
+                self._tick += 1
+                self._ticks[k] = self._tick
+            self._dirty = True
+            if len(self._rows) > self.max_items:
+                self._evict()
+
+    def _evict(self) -> None:
+        # En yeni %90'ı tut; her put'ta yeniden sıkıştırmamak için pay bırakılır
+        keep_n = max(1, int(self.max_items * 0.9))
+        keep = sorted(self._rows, key=lambda k: self._ticks[k], reverse=True)[:keep_n]
+        mm = self._matrix()
+        rows = np.array([self._rows[k] for k in keep], dtype=np.int64)
+        tmp = self._vec_path.with_suffix(".tmp")
+        with tmp.open("wb") as f:
+            for start in range(0, len(rows), 65536):  # bellek sınırlı kopya
+                f.write(np.asarray(mm[rows[start:start + 65536]]).tobytes())
+        self._mm = None  # dosya değişmeden önce eşlemeyi bırak
+        del mm
+        self._drop_index()
+        os.replace(tmp, self._vec_path)
+        self._rows = {k: i for i, k in enumerate(keep)}
+        self._ticks = {k: self._ticks[k] for k in keep}
+        self._n_rows = len(keep)
+        self._write_index()
+
+    def _drop_index(self) -> None:
+        try:
+            self._idx_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._dirty or not self._rows:
+                return
+            self._write_index()
+
+    def _write_index(self) -> None:
+        # Kilit altında çağrılır
+        keys = list(self._rows)
+        tmp = self._idx_path.with_suffix(".tmp.npz")
+        np.savez(
+            tmp,
+            keys=np.array(keys, dtype="S40"),
+            rows=np.array([self._rows[k] for k in keys], dtype=np.int64),
+            ticks=np.array([self._ticks[k] for k in keys], dtype=np.int64),
+        )
+        os.replace(tmp, self._idx_path)
+        self._dirty = False
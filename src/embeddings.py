@@ -1,33 +1,70 @@
 from __future__ import annotations
-from typing import List
+from typing import List, Optional
+import numpy as np
 from langchain_core.embeddings import Embeddings
-from sentence_transformers import SentenceTransformer
+
+from .embed_cache import EmbeddingCache
 
 class E5Embeddings(Embeddings):
     """
     E5 için doğru kullanım:
       - Belgeler:  'passage: {text}'
       - Sorgular:  'query: {question}'
+    cache verilirse encode öncesi diskteki embedding önbelleğine bakılır;
+    yalnızca önbellekte olmayan metinler modele gider.
     """
-    def __init__(self, model_name: str = "intfloat/multilingual-e5-base", normalize: bool = True):
+    def __init__(self, model_name: str = "intfloat/multilingual-e5-base", normalize: bool = True,
+                 cache: Optional[EmbeddingCache] = None):
+        from sentence_transformers import SentenceTransformer  # ağır import; ilk kullanımda
         self.model = SentenceTransformer(model_name)
         self.normalize = normalize
+        self.cache = cache
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        texts = [f"passage: {t}" for t in texts]
+    def _encode(self, texts: List[str]) -> np.ndarray:
         vecs = self.model.encode(
             texts, normalize_embeddings=self.normalize,
             convert_to_numpy=True, show_progress_bar=False
         )
-        return vecs.tolist()
+        return np.asarray(vecs, dtype=np.float32)
+
+    def _encode_cached(self, texts: List[str]) -> np.ndarray:
+        if self.cache is None:
+            return self._encode(texts)
+        keys = [self.cache.key(t) for t in texts]
+        found = self.cache.get_many(keys)
+        missing = [i for i, v in enumerate(found) if v is None]
+        if missing:
+            fresh = self._encode([texts[i] for i in missing])
+            # Önbellek dtype'ına yuvarla: sonuç, isabet olsun olmasın aynı olsun
+            fresh = fresh.astype(self.cache.dtype).astype(np.float32)
+            self.cache.put_many([keys[i] for i in missing], fresh)
+            for j, i in enumerate(missing):
+                found[i] = fresh[j]
+        return np.stack(found) if found else np.zeros((0, 0), dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = [f"passage: {t}" for t in texts]
+        return self._encode_cached(texts).tolist()
+
+    def flush_cache(self) -> None:
+        """Önbellek eşlemesini diske yazar (indeksleme sonunda; süreç çıkışında da yazılır)."""
+        if self.cache is not None:
+            self.cache.flush()
 
     def embed_query(self, text: str) -> List[float]:
         text = f"query: {text}"
-        vec = self.model.encode(
-            [text], normalize_embeddings=self.normalize,
-            convert_to_numpy=True, show_progress_bar=False
-        )[0]
-        return vec.tolist()
+        return self._encode_cached([text])[0].tolist()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Birden çok soru tek encode çağrısında (batch değerlendirme için)."""
+        if not texts:
+            return []
+        return self._encode_cached([f"query: {t}" for t in texts]).tolist()
 
-def build_embeddings(model_name: str = "intfloat/multilingual-e5-base") -> E5Embeddings:
-    return E5Embeddings(model_name=model_name, normalize=True)
+def build_embeddings(model_name: str = "intfloat/multilingual-e5-base", cache_dir: Optional[str] = None,
+                     cache_dtype: str = "float16", cache_max_items: int = 1_000_000) -> E5Embeddings:
+    cache = None
+    if cache_dir:
+        cache = EmbeddingCache(cache_dir, model_name, normalize=True,
+                               dtype=cache_dtype, max_items=cache_max_items)
+    return E5Embeddings(model_name=model_name, normalize=True, cache=cache)
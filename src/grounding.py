@@ -0,0 +1,144 @@
+# src/grounding.py
+from __future__ import annotations
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import List, Optional, Tuple
+import unicodedata
+
+from langchain_core.documents import Document
+
+# Türkçe'ye özgü harfler NFKD ile ayrışmadığı (ı) ya da büyük/küçük dönüşümü
+# beklenmedik olduğu (İ -> i̇) için elle katlanır.
+_FOLD = {
+    "ı": "i", "İ": "i", "I": "i",
+    "ç": "c", "Ç": "c", "ğ": "g", "Ğ": "g",
+    "ö": "o", "Ö": "o", "ş": "s", "Ş": "s", "ü": "u", "Ü": "u",
+    "’": "'", "‘": "'", "`": "'", "´": "'",
+    "“": '"', "”": '"', "„": '"', "«": '"', "»": '"',
+    "–": "-", "—": "-", "‐": "-", "­": "",
+}
+_STRIP = " \t\r\n\"'“”‘’"
+
+# Skor seviyeleri
+EXACT = 1.0     # yalnızca boşluk farkı
+FOLDED = 0.98   # büyük/küçük harf, aksan veya tırnak farkı
+FUZZY_MAX = 0.9799  # fuzzy skorlar katlanmış eşleşmenin altında kalır
+
+
+def _fold_char(ch: str) -> str:
+    if ch in _FOLD:
+        return _FOLD[ch]
+    decomposed = unicodedata.normalize("NFKD", ch)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def normalize_with_offsets(text: str, fold: bool = True) -> Tuple[str, List[int]]:
+    """
+    Boşlukları tek boşluğa indirir (fold=True ise harfleri de katlar) ve
+    normalize metnin her karakteri için orijinal metindeki indeksi döndürür.
+    """
+    out: List[str] = []
+    offsets: List[int] = []
+    prev_space = True  # baştaki boşlukları at
+    for i, ch in enumerate(text or ""):
+        if ch.isspace():
+            if not prev_space:
+                out.append(" ")
+                offsets.append(i)
+            prev_space = True
+            continue
+        mapped = _fold_char(ch) if fold else ch
+        for m in mapped:
+            out.append(m)
+            offsets.append(i)
+        prev_space = False
+    if out and out[-1] == " ":
+        out.pop()
+        offsets.pop()
+    return "".join(out), offsets
+
+
+@dataclass
+class GroundedSpan:
+    doc_index: int   # retrieved docs listesindeki sıra
+    source: str      # PDF dosya adı
+    page: int        # 1-tabanlı sayfa
+    start: int       # chunk metni içindeki karakter ofseti (dahil)
+    end: int         # chunk metni içindeki karakter ofseti (hariç)
+    score: float     # 1.0 birebir, 0.98 katlanmış, altı fuzzy benzerlik
+    text: str        # chunk'taki orijinal eşleşen metin
+
+
+class SpanGrounder:
+    """
+    Getirilen chunk'ları bir kez normalize eder; cevabı chunk'lar içinde
+    karakter ofsetleriyle bulur. Sırasıyla denenir:
+      1) boşluk-duyarsız birebir eşleşme
+      2) büyük/küçük harf + aksan + tırnak katlanmış eşleşme
+      3) fuzzy (SequenceMatcher) en iyi pencere
+    """
+    def __init__(self, docs: List[Document], min_fuzzy: float = 0.6):
+        self.docs = docs
+        self.min_fuzzy = float(min_fuzzy)
+        self._plain = [normalize_with_offsets(d.page_content, fold=False) for d in docs]
+        self._folded = [normalize_with_offsets(d.page_content, fold=True) for d in docs]
+
+    def _span(self, i: int, offsets: List[int], j: int, n: int, score: float) -> GroundedSpan:
+        d = self.docs[i]
+        start = offsets[j]
+        end = offsets[j + n - 1] + 1
+        return GroundedSpan(
+            doc_index=i,
+            source=str(d.metadata.get("source") or ""),
+            page=int(d.metadata.get("page") or 0),
+            start=start,
+            end=end,
+            score=score,
+            text=d.page_content[start:end],
+        )
+
+    def find(self, answer: str) -> Optional[GroundedSpan]:
+        ans = (answer or "").strip(_STRIP)
+        if not ans or not self.docs:
+            return None
+
+        plain_ans, _ = normalize_with_offsets(ans, fold=False)
+        if not plain_ans:
+            return None
+        for i, (norm, offsets) in enumerate(self._plain):
+            j = norm.find(plain_ans)
+            if j != -1:
+                return self._span(i, offsets, j, len(plain_ans), EXACT)
+
+        folded_ans, _ = normalize_with_offsets(ans, fold=True)
+        if not folded_ans:
+            return None
+        for i, (norm, offsets) in enumerate(self._folded):
+            j = norm.find(folded_ans)
+            if j != -1:
+                return self._span(i, offsets, j, len(folded_ans), FOLDED)
+
+        return self._fuzzy(folded_ans)
+
+    def _fuzzy(self, ans: str) -> Optional[GroundedSpan]:
+        # Her eşleşen bloğu cevabın olası başlangıcına hizalayıp pencereyi puanla
+        best: Optional[Tuple[float, int, int, int]] = None
+        n = len(ans)
+        for i, (norm, _) in enumerate(self._folded):
+            if not norm:
+                continue
+            sm = SequenceMatcher(None, norm, ans, autojunk=False)
+            blocks = sorted(sm.get_matching_blocks(), key=lambda b: b.size, reverse=True)[:3]
+            for b in blocks:
+                if b.size == 0:
+                    continue
+                j = max(0, min(b.a - b.b, len(norm) - 1))
+                window = norm[j:j + n]
+                score = SequenceMatcher(None, window, ans, autojunk=False).ratio()
+                if best is None or score > best[0]:
+                    best = (score, i, j, len(window))
+        if best is None or best[0] < self.min_fuzzy:
+            return None
+        score, i, j, size = best
+        # Ratio ≥ 0.98 olsa da birebir değil: FOLDED eşiğindeki verifier atlanmasın
+        return self._span(i, self._folded[i][1], j, size, min(round(score, 4), FUZZY_MAX))
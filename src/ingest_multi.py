@@ -1,6 +1,6 @@
 from __future__ import annotations
 from pathlib import Path
-from typing import Iterable, List
+from typing import Iterable, List, Optional
 from pypdf import PdfReader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from dataclasses import dataclass
@@ -11,8 +11,16 @@ class PageChunk:
     text: str
     source: str  # filename
 
-def read_pdf_pages(pdf_path: str) -> List[PageChunk]:
+def read_pdf_pages(pdf_path: str, store=None, file_hash: Optional[str] = None) -> List[PageChunk]:
+    """
+    store (PageStore) ve file_hash verilirse önce parse edilmiş sayfa deposuna bakılır;
+    yoksa pypdf ile çıkarılıp depoya yazılır.
+    """
     p = Path(pdf_path)
+    if store is not None and file_hash:
+        cached = store.get_pages(file_hash, p.name)
+        if cached is not None:
+            return cached
     reader = PdfReader(str(p))
     out: List[PageChunk] = []
     for i, pg in enumerate(reader.pages):
@@ -20,6 +28,8 @@ def read_pdf_pages(pdf_path: str) -> List[PageChunk]:
         if not txt:
             continue
         out.append(PageChunk(page=i+1, text=txt, source=p.name))
+    if store is not None and file_hash:
+        store.put_pages(file_hash, out)
     return out
 
 def chunk_pages(pages: List[PageChunk], chunk_size=1200, chunk_overlap=120) -> List[PageChunk]:
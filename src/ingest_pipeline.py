@@ -0,0 +1,187 @@
+# src/ingest_pipeline.py
+from __future__ import annotations
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .ingest_multi import PageChunk, read_pdf_pages, chunk_pages
+from .manifest import chunk_ids_for
+from .page_store import PageStore
+from .vectorstore import to_documents
+from . import tracing
+
+_DONE = object()
+
+
+def _parse_and_chunk(pdf: str, file_hash: str, chunk_size: int, chunk_overlap: int,
+                     store_root: Optional[str]) -> Tuple[str, List[PageChunk], List[str], float, float]:
+    # İşçi sürecinde çalışır (pickle edilebilmesi için modül seviyesinde)
+    t0 = time.perf_counter()
+    store = PageStore(store_root, chunk_size, chunk_overlap) if store_root else None
+    pages = read_pdf_pages(pdf, store=store, file_hash=file_hash)
+    t1 = time.perf_counter()
+    chunks = chunk_pages(pages, chunk_size, chunk_overlap)
+    ids = chunk_ids_for(chunks, file_hash)
+    if store is not None:
+        store.put_chunks(ids, chunks)
+    return pdf, chunks, ids, t1 - t0, time.perf_counter() - t1
+
+
+@dataclass
+class IngestStats:
+    files_total: int = 0
+    files_parsed: int = 0
+    files_done: int = 0
+    chunks: int = 0
+    batches: int = 0
+    parse_s: float = 0.0    # işçilerde harcanan toplam parse+chunk süresi
+    upsert_s: float = 0.0   # embed + vektör deposuna yazma süresi
+    wall_s: float = 0.0
+
+    @property
+    def chunks_per_s(self) -> float:
+        return self.chunks / self.upsert_s if self.upsert_s else 0.0
+
+    @property
+    def files_per_s(self) -> float:
+        return self.files_parsed / self.wall_s if self.wall_s else 0.0
+
+
+def default_workers(n: int) -> int:
+    return max(1, (os.cpu_count() or 2) - 1) if n <= 0 else n
+
+
+def run_ingest(
+    pdfs: List[str],
+    hashes: Dict[str, str],
+    upsert: Callable[[list, List[str]], None],
+    on_file_done: Callable[[str, List[str]], None],
+    chunk_size: int,
+    chunk_overlap: int,
+    workers: int = 0,
+    batch_size: int = 256,
+    queue_size: int = 8,
+    progress: Optional[Callable[[IngestStats], None]] = None,
+    store_root: Optional[str] = None,
+) -> IngestStats:
+    """
+    PDF'leri süreç havuzunda paralel parse+chunk eder; sonuçlar sınırlı bir kuyruk
+    üzerinden tüketiciye akar, tüketici sabit boyutlu batch'ler halinde embed edip
+    upsert eder. Bellekte en fazla queue_size PDF'in chunk'ları + bir batch bulunur.
+
+    hashes: pdf yolu -> dosya hash'i (deterministik chunk ID'leri için)
+    on_file_done: bir PDF'in tüm chunk'ları yazıldığında çağrılır (manifest kaydı)
+    Etkin bir trace varsa dosya başına ingest.parse / ingest.chunk span'leri eklenir.
+    store_root: verilirse sayfa/chunk metinleri PageStore'a yazılır (ve oradan okunur)
+    """
+    stats = IngestStats(files_total=len(pdfs))
+    if not pdfs:
+        return stats
+    workers = default_workers(workers)
+    q: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+    t_start = time.perf_counter()
+
+    stop = threading.Event()  # tüketici hata verirse üretici beklemeden çıksın
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            if workers == 1:
+                for pdf in pdfs:
+                    if not put(_parse_and_chunk(pdf, hashes[pdf], chunk_size, chunk_overlap, store_root)):
+                        return
+                return
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                todo = list(pdfs)
+                running = set()
+                while todo or running:
+                    # Aynı anda en fazla 2*workers iş: sonuçlar kuyrukta birikmesin
+                    while todo and len(running) < 2 * workers:
+                        pdf = todo.pop(0)
+                        running.add(ex.submit(
+                            _parse_and_chunk, pdf, hashes[pdf], chunk_size, chunk_overlap, store_root
+                        ))
+                    finished, running = wait(running, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        if not put(fut.result()):
+                            for r in running:
+                                r.cancel()
+                            return
+        except BaseException as e:  # hata tüketici tarafında yükseltilir
+            put(e)
+        finally:
+            put(_DONE)
+
+    producer = threading.Thread(target=produce, name="ingest-producer", daemon=True)
+    producer.start()
+
+    buf_docs: list = []
+    buf_ids: List[str] = []
+    # Batch'e girmiş ama henüz yazılmamış dosyalar: (pdf, o dosyanın ID'leri, buffer'daki son indeks)
+    open_files: List[Tuple[str, List[str], int]] = []
+    written = 0  # buffer başlangıcına kadar yazılmış toplam chunk
+
+    def flush(force: bool = False) -> None:
+        nonlocal buf_docs, buf_ids, written, open_files
+        while buf_docs and (force or len(buf_docs) >= batch_size):
+            n = min(batch_size, len(buf_docs))
+            t0 = time.perf_counter()
+            upsert(buf_docs[:n], buf_ids[:n])
+            stats.upsert_s += time.perf_counter() - t0
+            stats.batches += 1
+            buf_docs, buf_ids = buf_docs[n:], buf_ids[n:]
+            written += n
+            # Tamamı yazılmış dosyaları bildir
+            while open_files and open_files[0][2] <= written:
+                pdf, ids, _ = open_files.pop(0)
+                on_file_done(pdf, ids)
+                stats.files_done += 1
+            stats.wall_s = time.perf_counter() - t_start
+            if progress is not None:
+                progress(stats)
+
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            pdf, chunks, ids, parse_s, chunk_s = item
+            stats.files_parsed += 1
+            stats.parse_s += parse_s + chunk_s
+            trace = tracing.current()
+            if trace is not None:
+                # Süreler işçide ölçüldü; span'ler etkin trace'e burada eklenir
+                trace.add("ingest.parse", parse_s, file=os.path.basename(pdf))
+                trace.add("ingest.chunk", chunk_s, chunks=len(chunks))
+            buf_docs.extend(to_documents(chunks, ids))
+            buf_ids.extend(ids)
+            stats.chunks += len(chunks)
+            open_files.append((pdf, ids, written + len(buf_docs)))
+            flush()
+
+        flush(force=True)
+        # Chunk üretmeyen (boş/taranmış) dosyalar da kaydedilsin
+        for pdf, ids, _ in open_files:
+            on_file_done(pdf, ids)
+            stats.files_done += 1
+    finally:
+        stop.set()
+        producer.join()
+    stats.wall_s = time.perf_counter() - t_start
+    if progress is not None:
+        progress(stats)
+    return stats
@@ -0,0 +1,140 @@
+# src/manifest.py
+from __future__ import annotations
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+MANIFEST_NAME = "manifest.json"
+
+
+def file_sha256(path: str, block: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for buf in iter(lambda: f.read(block), b""):
+            h.update(buf)
+    return h.hexdigest()
+
+
+def chunk_ids_for(chunks, file_hash: str) -> List[str]:
+    """
+    Deterministik chunk ID'leri: <sha1(kaynak|dosya hash'i)[:16]>-p<sayfa>-<sayfa içi sıra>.
+    Aynı dosya + aynı chunk ayarları her zaman aynı ID'leri üretir; içeriği aynı
+    iki farklı dosya adı çakışmaz.
+    """
+    seen: Dict[int, int] = {}
+    prefix: Dict[str, str] = {}
+    ids = []
+    for ch in chunks:
+        if ch.source not in prefix:
+            prefix[ch.source] = hashlib.sha1(f"{ch.source}|{file_hash}".encode("utf-8")).hexdigest()[:16]
+        n = seen.get(ch.page, 0)
+        seen[ch.page] = n + 1
+        ids.append(f"{prefix[ch.source]}-p{ch.page}-{n}")
+    return ids
+
+
+@dataclass
+class FileEntry:
+    sha256: str
+    mtime: float
+    size: int
+    chunk_ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class SyncPlan:
+    added: List[str] = field(default_factory=list)      # yeni PDF yolları
+    changed: List[str] = field(default_factory=list)    # içeriği değişen PDF yolları
+    removed: List[str] = field(default_factory=list)    # klasörde artık olmayan kaynak adları
+    unchanged: List[str] = field(default_factory=list)
+    hashes: Dict[str, str] = field(default_factory=dict)  # yol -> sha256 (added/changed)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+
+@dataclass
+class IndexManifest:
+    """
+    Koleksiyonun yanında (persist_dir/manifest.json) tutulan PDF başına kayıt.
+    Kaynak adı (metadata.source = dosya adı) -> hash, mtime, boyut, chunk ID'leri.
+    Chunk ayarları veya embed modeli değişirse manifest uyumsuz sayılır ve
+    indeks baştan kurulur.
+    """
+    chunk_size: int = 0
+    chunk_overlap: int = 0
+    embed_model: str = ""
+    files: Dict[str, FileEntry] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, persist_dir: str) -> "IndexManifest | None":
+        p = Path(persist_dir) / MANIFEST_NAME
+        if not p.is_file():
+            return None
+        data = json.loads(p.read_text(encoding="utf-8"))
+        files = {name: FileEntry(**fe) for name, fe in (data.get("files") or {}).items()}
+        return cls(
+            chunk_size=int(data.get("chunk_size", 0)),
+            chunk_overlap=int(data.get("chunk_overlap", 0)),
+            embed_model=str(data.get("embed_model", "")),
+            files=files,
+        )
+
+    def save(self, persist_dir: str) -> None:
+        p = Path(persist_dir) / MANIFEST_NAME
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_suffix(".tmp")
+        tmp.write_text(json.dumps(asdict(self), ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, p)
+
+    def compatible(self, chunk_size: int, chunk_overlap: int, embed_model: str) -> bool:
+        return (self.chunk_size, self.chunk_overlap, self.embed_model) == (
+            int(chunk_size), int(chunk_overlap), embed_model
+        )
+
+    def version(self) -> str:
+        """İndeks içeriğinin parmak izi: ayarlar + dosya hash'leri."""
+        h = hashlib.sha1(f"{self.chunk_size}|{self.chunk_overlap}|{self.embed_model}".encode("utf-8"))
+        for name in sorted(self.files):
+            h.update(f"|{name}:{self.files[name].sha256}".encode("utf-8"))
+        return h.hexdigest()[:16]
+
+    def plan(self, pdf_paths: Iterable[str]) -> SyncPlan:
+        plan = SyncPlan()
+        present = set()
+        for path in pdf_paths:
+            name = Path(path).name
+            present.add(name)
+            st = os.stat(path)
+            old = self.files.get(name)
+            if old is not None and old.size == st.st_size and old.mtime == st.st_mtime:
+                # Boyut + mtime aynıysa hash'i yeniden hesaplama
+                plan.unchanged.append(path)
+                continue
+            sha = file_sha256(path)
+            if old is None:
+                plan.added.append(path)
+            elif old.sha256 != sha:
+                plan.changed.append(path)
+            else:
+                # Yalnızca dokunulmuş (touch); içerik aynı
+                old.mtime, old.size = st.st_mtime, st.st_size
+                plan.unchanged.append(path)
+                continue
+            plan.hashes[path] = sha
+        plan.removed = [name for name in self.files if name not in present]
+        return plan
+
+    def record(self, path: str, sha: str, chunk_ids: List[str]) -> None:
+        st = os.stat(path)
+        self.files[Path(path).name] = FileEntry(
+            sha256=sha, mtime=st.st_mtime, size=st.st_size, chunk_ids=list(chunk_ids)
+        )
+
+    def forget(self, name: str) -> Tuple[str, ...]:
+        fe = self.files.pop(name, None)
+        return tuple(fe.chunk_ids) if fe else ()
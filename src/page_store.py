@@ -0,0 +1,180 @@
+# src/page_store.py
+from __future__ import annotations
+import mmap
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .ingest_multi import PageChunk
+
+
+def _path(base: Path, suffix: str) -> Path:
+    # with_suffix kullanılamaz: chunk korpus adları nokta içerir (<önek>.<cs>-<co>)
+    return base.parent / (base.name + suffix)
+
+
+class _Corpus:
+    """
+    Tek bir sıkıştırılmamış metin korpusu: <name>.bin (UTF-8 blob) + <name>.npy
+    (satır başına int64 sütunlar; son iki sütun blob içindeki [start, end) bayt ofseti).
+    Blob mmap ile, ofsetler np.load(mmap_mode="r") ile açılır.
+    """
+    def __init__(self, base: Path):
+        self.base = base
+        self._mm: Optional[mmap.mmap] = None
+        self._rows: Optional[np.ndarray] = None
+
+    @property
+    def exists(self) -> bool:
+        return _path(self.base, ".bin").is_file() and _path(self.base, ".npy").is_file()
+
+    @staticmethod
+    def write(base: Path, keys: List[Tuple[int, ...]], texts: List[str]) -> None:
+        base.parent.mkdir(parents=True, exist_ok=True)
+        blobs = [t.encode("utf-8") for t in texts]
+        ends = np.cumsum([len(b) for b in blobs], dtype=np.int64) if blobs else np.zeros(0, np.int64)
+        starts = ends - np.array([len(b) for b in blobs], dtype=np.int64)
+        n_key = len(keys[0]) if keys else 0
+        rows = np.zeros((len(blobs), n_key + 2), dtype=np.int64)
+        if blobs:
+            rows[:, :n_key] = np.array(keys, dtype=np.int64)
+            rows[:, n_key] = starts
+            rows[:, n_key + 1] = ends
+        # Önce geçici dosyalara yaz, sonra yer değiştir (eşzamanlı süreçler için güvenli)
+        tmp_bin = _path(base, f".bin.{os.getpid()}.tmp")
+        tmp_npy = _path(base, f".{os.getpid()}.tmp.npy")
+        tmp_bin.write_bytes(b"".join(blobs))
+        np.save(tmp_npy, rows)
+        os.replace(tmp_bin, _path(base, ".bin"))
+        os.replace(tmp_npy, _path(base, ".npy"))
+
+    @staticmethod
+    def remove(base: Path) -> None:
+        for suffix in (".bin", ".npy"):
+            try:
+                _path(base, suffix).unlink()
+            except FileNotFoundError:
+                pass
+
+    def rows(self) -> np.ndarray:
+        if self._rows is None:
+            self._rows = np.load(_path(self.base, ".npy"), mmap_mode="r")
+        return self._rows
+
+    def text(self, row: int) -> str:
+        r = self.rows()[row]
+        start, end = int(r[-2]), int(r[-1])
+        if end <= start:
+            return ""
+        if self._mm is None:
+            with open(_path(self.base, ".bin"), "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm[start:end].decode("utf-8")
+
+
+class PageStore:
+    """
+    pypdf çıktısı ve chunk metinleri için diskte kalıcı, mmap'li depo.
+
+    root/pages/<pdf sha256>.{bin,npy}          sayfa metinleri  (sütunlar: page, start, end)
+    root/chunks/<id öneki>.<cs>-<co>.{bin,npy}  chunk metinleri  (sütunlar: page, n, start, end)
+
+    Sayfalar PDF içerik hash'iyle anahtarlanır: aynı PDF bir daha parse edilmez.
+    Chunk'lar deterministik chunk ID'si (<önek>-p<sayfa>-<n>) ile okunur; böylece
+    bağlam ve referans için vektör deposundan belge metni istemek gerekmez.
+    """
+    def __init__(self, root: str, chunk_size: int = 1200, chunk_overlap: int = 120):
+        self.root = Path(root)
+        self.chunk_size = int(chunk_size)
+        self.chunk_overlap = int(chunk_overlap)
+        self._chunk_corpora: Dict[str, Tuple[_Corpus, Dict[Tuple[int, int], int]]] = {}
+        self._lock = threading.Lock()
+
+    # ---------- Sayfalar ----------
+    def _pages_base(self, file_hash: str) -> Path:
+        return self.root / "pages" / file_hash
+
+    def has_pages(self, file_hash: str) -> bool:
+        return _Corpus(self._pages_base(file_hash)).exists
+
+    def get_pages(self, file_hash: str, source: str) -> Optional[List[PageChunk]]:
+        corpus = _Corpus(self._pages_base(file_hash))
+        if not corpus.exists:
+            return None
+        rows = corpus.rows()
+        return [PageChunk(page=int(rows[i][0]), text=corpus.text(i), source=source)
+                for i in range(len(rows))]
+
+    def put_pages(self, file_hash: str, pages: List[PageChunk]) -> None:
+        _Corpus.write(self._pages_base(file_hash), [(p.page,) for p in pages], [p.text for p in pages])
+
+    def delete_pages(self, file_hashes: Sequence[str]) -> None:
+        for file_hash in set(file_hashes):
+            _Corpus.remove(self._pages_base(file_hash))
+
+    # ---------- Chunk'lar ----------
+    def _chunks_base(self, prefix: str) -> Path:
+        return self.root / "chunks" / f"{prefix}.{self.chunk_size}-{self.chunk_overlap}"
+
+    def put_chunks(self, chunk_ids: List[str], chunks: List[PageChunk]) -> None:
+        by_prefix: Dict[str, Tuple[List[Tuple[int, int]], List[str]]] = {}
+        for cid, ch in zip(chunk_ids, chunks):
+            prefix, page, n = _parse_chunk_id(cid)
+            keys, texts = by_prefix.setdefault(prefix, ([], []))
+            keys.append((page, n))
+            texts.append(ch.text)
+        for prefix, (keys, texts) in by_prefix.items():
+            _Corpus.write(self._chunks_base(prefix), keys, texts)
+            with self._lock:
+                self._chunk_corpora.pop(prefix, None)
+
+    def delete_chunks(self, chunk_ids: Sequence[str]) -> None:
+        """Verilen chunk ID'lerinin ait olduğu korpusları (önek başına dosya) siler."""
+        prefixes = set()
+        for cid in chunk_ids:
+            try:
+                prefixes.add(_parse_chunk_id(cid)[0])
+            except ValueError:
+                continue
+        for prefix in prefixes:
+            with self._lock:
+                self._chunk_corpora.pop(prefix, None)
+            _Corpus.remove(self._chunks_base(prefix))
+
+    def _chunk_corpus(self, prefix: str) -> Optional[Tuple[_Corpus, Dict[Tuple[int, int], int]]]:
+        with self._lock:
+            hit = self._chunk_corpora.get(prefix)
+            if hit is None:
+                corpus = _Corpus(self._chunks_base(prefix))
+                if not corpus.exists:
+                    return None
+                rows = corpus.rows()
+                lookup = {(int(r[0]), int(r[1])): i for i, r in enumerate(rows)}
+                hit = self._chunk_corpora[prefix] = (corpus, lookup)
+            return hit
+
+    def chunk_text(self, chunk_id: str) -> Optional[str]:
+        try:
+            prefix, page, n = _parse_chunk_id(chunk_id)
+        except ValueError:
+            return None
+        hit = self._chunk_corpus(prefix)
+        if hit is None:
+            return None
+        corpus, lookup = hit
+        row = lookup.get((page, n))
+        return corpus.text(row) if row is not None else None
+
+    def chunk_texts(self, chunk_ids: Sequence[str]) -> List[Optional[str]]:
+        return [self.chunk_text(cid) for cid in chunk_ids]
+
+
+def _parse_chunk_id(chunk_id: str) -> Tuple[str, int, int]:
+    # "<önek>-p<sayfa>-<n>"
+    prefix, page, n = chunk_id.rsplit("-", 2)
+    if not page.startswith("p"):
+        raise ValueError(f"Geçersiz chunk ID: {chunk_id}")
+    return prefix, int(page[1:]), int(n)
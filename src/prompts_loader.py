@@ -1,6 +1,7 @@
 from __future__ import annotations
 from pathlib import Path
-from typing import Any, Dict
+from string import Formatter
+from typing import Any, Dict, Optional
 import yaml
 
 _cache: Dict[str, Dict[str, Any]] = {}
@@ -10,14 +11,16 @@ def load_yaml(path: str | Path) -> Dict[str, Any]:
     with p.open("r", encoding="utf-8") as f:
         return yaml.safe_load(f) or {}
 
-def get_prompt(path: str, section: str, key: str) -> str:
-    # section: extractive_no_wrap | verify_supported
-    # key: system | user_template
-    global _cache
+def _data(path: str) -> Dict[str, Any]:
     abspath = str(Path(path).resolve())
     if abspath not in _cache:
         _cache[abspath] = load_yaml(path)
-    data = _cache[abspath]
+    return _cache[abspath]
+
+def get_prompt(path: str, section: str, key: str) -> str:
+    # section: extractive_no_wrap | verify_supported
+    # key: system | user_template
+    data = _data(path)
     try:
         out = data[section][key]
     except Exception:
@@ -25,3 +28,30 @@ def get_prompt(path: str, section: str, key: str) -> str:
     if not isinstance(out, str) or not out.strip():
         raise ValueError(f"Prompt boş: {section}.{key}")
     return out
+
+def get_generation(path: str, section: str) -> Dict[str, Any]:
+    """
+    Bölümün (opsiyonel) generation ayarları -> QwenChat.chat kwargs'ı:
+      generation:
+        max_new_tokens: 64
+        stop_on_newline: true      # ilk satır sonunda dur
+        stop: ["Soru:"]            # ek durdurma dizgeleri
+    """
+    gen = (_data(path).get(section) or {}).get("generation") or {}
+    stop = [str(s) for s in (gen.get("stop") or []) if str(s)]
+    if gen.get("stop_on_newline"):
+        stop.insert(0, "\n")
+    out: Dict[str, Any] = {"stop": stop or None}
+    if gen.get("max_new_tokens"):
+        out["max_new_tokens"] = int(gen["max_new_tokens"])
+    return out
+
+def context_prefix(template: str, context: str) -> Optional[str]:
+    # Şablon bağlamla başlıyorsa (context-first), bağlam bloğuna kadarki sabit kısım
+    # + bağlamın kendisi döner. Bu önek aynı bağlamı kullanan çağrılar arasında
+    # ortaktır ve KV-cache'lenebilir. {context}'ten önce başka alan varsa None.
+    for text, field, _, _ in Formatter().parse(template):
+        if field != "context":
+            return None
+        return text + context
+    return None
@@ -1,111 +1,700 @@
 from __future__ import annotations
-from typing import List
+import hashlib
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 from langchain_core.documents import Document
 
 from .config import Settings
-from .prompts_loader import get_prompt
+from .prompts_loader import get_prompt, get_generation, context_prefix
 from .embeddings import build_embeddings
-from .ingest_multi import read_pdf_pages, chunk_pages, iter_pdfs
-from .vectorstore import build_chroma, load_chroma, to_documents, format_context
-from .qwen_llm import QwenChat
-from .utils import normalize_for_compare
-from .schemas import InputSchema, OutputSchema, Reference  # <<< eklendi
+from .ingest_multi import iter_pdfs
+from .ingest_pipeline import IngestStats, run_ingest
+from .manifest import MANIFEST_NAME, IndexManifest, SyncPlan
+from .page_store import PageStore
+from .vectorstore import (
+    index_dir, index_size, load_vectorstore, reset_vectorstore, add_embeddings, delete_documents,
+    search_vectors, format_context, best_scores_info, confident,
+)
+from .context_builder import ContextBuilder
+from .grounding import SpanGrounder, GroundedSpan
+from .qcache import AnswerCache, QueryEmbeddingLRU
+from .schemas import InputSchema, OutputSchema, Reference, dump_model  # <<< eklendi
+from . import tracing
+
+
+NO_ANSWER = "BELİRTİLMEMİŞ"
+
+
+@dataclass
+class PreparedBatch:
+    """prepare_batch çıktısı: soru başına önbellek sonucu ya da getirilen belgeler + bağlam."""
+    questions: List[str]
+    k: int
+    fingerprint: str
+    results: List[Optional[OutputSchema]] = field(default_factory=list)
+    miss: List[int] = field(default_factory=list)          # LLM'e gidecek indeksler
+    docs: Dict[int, List[Document]] = field(default_factory=dict)
+    contexts: Dict[int, str] = field(default_factory=dict)
+    trace: Optional[tracing.Trace] = None  # hazırlık ve üretim aynı trace'e yazar
 
 
 class QueryAgent:
     def __init__(self, settings: Settings, prompt_yaml: str = "prompts/query_prompt.yaml"):
         self.cfg = settings
         self.prompt_yaml = prompt_yaml
-        self.emb = build_embeddings(self.cfg.embed_model)
-        self.llm = QwenChat(self.cfg.qwen_model)
+        # Ağır kaynaklar ilk kullanımda yüklenir (build LLM'i, ask indekslemeyi yüklemez)
+        self._emb = None
+        self._llm = None
+        self._vs = None
+        self._store = None
+        self._reranker = None
+        self._tok = None
+        self._ctx: ContextBuilder | None = None
+
+        # Soru önbellekleri: sorgu embedding LRU'su + nihai cevap önbelleği
+        self.qemb = QueryEmbeddingLRU(self.cfg.query_emb_cache_size)
+        self.answers = AnswerCache(
+            max_items=self.cfg.answer_cache_size,
+            ttl_s=self.cfg.answer_cache_ttl_s,
+            path=self.cfg.answer_cache_path or None,
+            semantic_threshold=self.cfg.answer_cache_semantic,
+        )
+        self._fp: Optional[str] = None
+        self._fp_stamp: Optional[float] = None
+        self._indexed: Dict[str, Tuple[str, float, int]] = {}  # kaynak -> (yol, mtime, boyut); bkz. index_pdf
+        if self.cfg.trace_log_path:
+            tracing.configure(self.cfg.trace_log_path)
+
+    @property
+    def emb(self):
+        if self._emb is None:
+            self._emb = build_embeddings(
+                self.cfg.embed_model,
+                cache_dir=self.cfg.embed_cache_dir or None,
+                cache_dtype=self.cfg.embed_cache_dtype,
+                cache_max_items=self.cfg.embed_cache_max_items,
+            )
+        return self._emb
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            from .qwen_llm import QwenChat  # torch/transformers yalnızca üretimde gerekir
+            self._llm = QwenChat(
+                self.cfg.qwen_model,
+                batch_size=self.cfg.llm_batch_size,
+                prefix_cache_size=self.cfg.prefix_cache_size,
+                decoding=self.cfg.decoding,
+                prompt_lookup_num_tokens=self.cfg.prompt_lookup_num_tokens,
+                draft_model=self.cfg.draft_model,
+                cpu_mode=self.cfg.cpu_mode,
+                threads=self.cfg.torch_threads,
+                interop_threads=self.cfg.torch_interop_threads,
+                compile=self.cfg.torch_compile,
+            )
+        return self._llm
+
+    @property
+    def contexts(self) -> ContextBuilder:
+        if self._ctx is None:
+            self._ctx = ContextBuilder(
+                self._count_tokens,
+                max_tokens=self.cfg.context_max_tokens,
+                cache_size=self.cfg.token_count_cache_size,
+            )
+        return self._ctx
+
+    def _count_tokens(self, text: str) -> int:
+        # LLM'inkinden ayrı bir tokenizer örneği: bağlam hazırlığı (batch_runner'da ayrı
+        # thread) üretimle eşzamanlı çalışabilir; hızlı tokenizer'lar thread'ler arası paylaşılamaz.
+        # Yalnızca tokenizer yüklenir, model değil.
+        if self._tok is None:
+            from transformers import AutoTokenizer
+            self._tok = AutoTokenizer.from_pretrained(self.cfg.qwen_model, use_fast=True)
+        return len(self._tok(text, add_special_tokens=False).input_ids)
+
+    def _context(self, docs: List[Document]) -> str:
+        with tracing.span("context", docs=len(docs)) as sp:
+            if self.cfg.context_max_tokens <= 0:
+                context = format_context(docs, max_chars=6000)
+            else:
+                context = self.contexts.build(docs)
+            sp["chars"] = len(context)
+        return context
+
+    @property
+    def reranker(self):
+        if self._reranker is None:
+            from .reranker import Reranker  # CrossEncoder yalnızca rerank açıkken yüklenir
+            self._reranker = Reranker(
+                self.cfg.rerank_model,
+                threshold=self.cfg.rerank_threshold,
+                batch_size=self.cfg.rerank_batch_size,
+                cache_size=self.cfg.rerank_cache_size,
+            )
+        return self._reranker
+
+    @property
+    def store(self) -> PageStore | None:
+        # Parse edilmiş sayfa + chunk metni deposu (page_store_dir boşsa kapalı)
+        if self._store is None and self.cfg.page_store_dir:
+            self._store = PageStore(self.cfg.page_store_dir, self.cfg.chunk_size, self.cfg.chunk_overlap)
+        return self._store
+
+    @property
+    def index_dir(self) -> str:
+        # Seçili backend'in klasörü; manifest de burada tutulur (backend başına ayrı)
+        return index_dir(self.cfg.chroma_dir, self.cfg.vector_backend)
 
     # ---------- Build index for a folder of PDFs ----------
-    def build_index(self, pdf_dir: str):
-        all_chunks = []
-        for pdf in iter_pdfs(pdf_dir):
-            pages = read_pdf_pages(pdf)
-            chunks = chunk_pages(pages, self.cfg.chunk_size, self.cfg.chunk_overlap)
-            all_chunks.extend(chunks)
+    def build_index(self, pdf_dir: str, progress: Callable[[IngestStats], None] | None = None) -> SyncPlan:
+        """
+        İndeksi klasörle senkronize eder (manifest: <index_dir>/manifest.json):
+          - yeni PDF'ler eklenir,
+          - içeriği değişenlerin chunk'ları silinip yeniden eklenir,
+          - klasörden kaldırılanların chunk'ları silinir.
+        Manifest yoksa (eski tam build) ya da chunk ayarları / embed modeli
+        (flat backend'de vektör dtype'ı) değiştiyse koleksiyon sıfırlanıp baştan kurulur.
+        """
+        vs, manifest = self._open_index()
+        plan = manifest.plan(iter_pdfs(pdf_dir))
+        self._sync(vs, manifest, plan, progress=progress)
+        return plan
+
+    def _open_index(self, reset: bool = True):
+        """
+        Vektör deposu + manifest; manifest yoksa ya da ayarlarla uyumsuzsa ikisi de sıfırlanır.
+        reset=False: dolu ve uyumsuz bir indeks sıfırlanmaz, manifest None döner
+        (boş indeks için sıfırlamak zararsızdır).
+        """
+        vs = self._get_vs()
+        manifest = IndexManifest.load(self.index_dir)
+        if manifest is None or getattr(vs, "stale_dtype", False) or not manifest.compatible(
+            self.cfg.chunk_size, self.cfg.chunk_overlap, self.cfg.embed_model
+        ):
+            if not reset and index_size(vs) > 0:
+                return vs, None
+            vs = self._vs = reset_vectorstore(vs, self.emb, self.index_dir)
+            manifest = IndexManifest(
+                chunk_size=self.cfg.chunk_size,
+                chunk_overlap=self.cfg.chunk_overlap,
+                embed_model=self.cfg.embed_model,
+            )
+        return vs, manifest
 
-        docs = to_documents(all_chunks)
-        build_chroma(docs, self.emb, self.cfg.chroma_dir)
+    def _sync(self, vs, manifest: IndexManifest, plan: SyncPlan,
+              progress: Callable[[IngestStats], None] | None = None, workers: int | None = None) -> None:
+        stale: List[str] = []
+        old_hashes: List[str] = []
+        for name in plan.removed + [Path(pdf).name for pdf in plan.changed]:
+            if name in manifest.files:
+                old_hashes.append(manifest.files[name].sha256)
+            stale.extend(manifest.forget(name))
+        delete_documents(vs, stale)
+        store = self.store
+        if store is not None and old_hashes:
+            # Kaldırılan/değişen PDF'lerin chunk korpusları ve artık kimsenin kullanmadığı
+            # sayfa korpusları (içerik hash'iyle paylaşılabilir) silinir
+            store.delete_chunks(stale)
+            live = {fe.sha256 for fe in manifest.files.values()} | set(plan.hashes.values())
+            store.delete_pages([h for h in old_hashes if h not in live])
+
+        def on_file_done(pdf: str, ids: List[str]) -> None:
+            manifest.record(pdf, plan.hashes[pdf], ids)
+            # Her PDF'ten sonra yaz: yarıda kesilirse tamamlananlar tekrar işlenmez
+            manifest.save(self.index_dir)
+
+        # Paralel parse/chunk -> sınırlı kuyruk -> sabit boyutlu embed+upsert batch'leri
+        run_ingest(
+            plan.added + plan.changed,
+            plan.hashes,
+            upsert=lambda docs, ids: self._upsert(vs, docs, ids),
+            on_file_done=on_file_done,
+            chunk_size=self.cfg.chunk_size,
+            chunk_overlap=self.cfg.chunk_overlap,
+            workers=self.cfg.ingest_workers if workers is None else workers,
+            batch_size=self.cfg.ingest_batch_size,
+            queue_size=self.cfg.ingest_queue_size,
+            progress=progress,
+            store_root=self.cfg.page_store_dir or None,
+        )
+
+        manifest.save(self.index_dir)
+        if plan.added or plan.changed:
+            # Embedding önbelleği batch başına değil, senkron başına bir kez yazılır
+            getattr(self.emb, "flush_cache", lambda: None)()
+        if plan.dirty:
+            # Koleksiyon değişti: eski cevaplar ve index_pdf kontrolleri geçersiz
+            self.answers.clear()
+            self._fp_stamp = None
+            self._indexed.clear()
+
+    def _upsert(self, vs, docs: List[Document], ids: List[str]) -> None:
+        # Embed ve yazma ayrı span'ler (ingest aşamaları trace'ten okunabilsin)
+        with tracing.span("ingest.embed", chunks=len(docs)):
+            vecs = self.emb.embed_documents([d.page_content for d in docs])
+        with tracing.span("ingest.index", chunks=len(docs)):
+            add_embeddings(vs, docs, ids, vecs)
+
+    def index_pdf(self, pdf_path: str) -> str:
+        """
+        Tek PDF'in indekste güncel olmasını sağlar ve kaynak adını (metadata.source =
+        dosya adı) döndürür. Yoksa ya da içeriği değiştiyse yalnızca o dosya eklenir /
+        yenilenir; diğer PDF'lere dokunulmaz. Kaynaklar dosya adıyla anahtarlandığı için
+        aynı adlı farklı bir dosya öncekinin yerini alır; build_index (klasör senkronu)
+        klasörde olmayan kaynakları yine kaldırır.
+        Dosya diskte yoksa ama aynı adla indeksliyse indeksteki sürüm kullanılır.
+        İndeks mevcut ayarlarla uyumsuzsa (manifest yok, chunk/embed ayarı ya da dtype
+        değişmiş) hiçbir şey silinmez ve eklenmez: mevcut indeks bu adla sınırlanır,
+        yeniden kurmak build_index'in işidir.
+        """
+        path = Path(pdf_path)
+        name = path.name
+        if not path.is_file():
+            manifest = IndexManifest.load(self.index_dir)
+            if manifest is not None and name in manifest.files:
+                return name
+            raise FileNotFoundError(f"PDF bulunamadı ve indekste yok: {pdf_path}")
+
+        st = path.stat()
+        stamp = (str(path.resolve()), st.st_mtime, st.st_size)
+        if self._indexed.get(name) == stamp:
+            return name  # bu süreçte zaten kontrol edildi; manifest tekrar okunmaz
+        vs, manifest = self._open_index(reset=False)
+        if manifest is None:
+            tracing.count("index_pdf_total", result="incompatible")
+            return name
+        plan = manifest.plan([str(path)])
+        plan.removed = []  # klasör senkronu değil: diğer kaynaklar kalır
+        # Tek dosya: süreç havuzu açmadan parse edilir
+        self._sync(vs, manifest, plan, workers=1)
+        tracing.count("index_pdf_total", result="ingested" if plan.added or plan.changed else "indexed")
+        self._indexed[name] = stamp
+        return name
 
     def _get_vs(self):
-        return load_chroma(self.emb, self.cfg.chroma_dir)
+        # Vektör deposu (Chroma istemcisi / flat indeks) ajan başına bir kez açılır
+        if self._vs is None:
+            self._vs = load_vectorstore(
+                self.emb, self.cfg.chroma_dir, self.cfg.vector_backend,
+                dtype=self.cfg.flat_dtype, rescore=self.cfg.flat_rescore,
+            )
+        return self._vs
 
     # ---------- Public structured entry ----------
     def answer(self, inp: InputSchema, k: int | None = None) -> OutputSchema:
-        # Şimdilik pdf_path'i kullanmadan mevcut indeks üzerinden çalışıyoruz.
-        # Gelecekte tek-PDF modu eklenebilir.
-        return self.ask(inp.query, k=k)
+        """
+        pdf_path verilirse getirme o belgeyle sınırlanır (where={"source": dosya adı});
+        belge indekste yoksa önce eklenir. Boşsa tüm koleksiyonda arar.
+        """
+        return self.ask(inp.query, k=k, source=self._scope(inp.pdf_path))
 
-    # ---------- Ask (now returns OutputSchema) ----------
-    def ask(self, question: str, k: int | None = None) -> OutputSchema:
-        k = k or self.cfg.top_k
-        vs = self._get_vs()
+    def answer_stream(self, inp: InputSchema, k: int | None = None) -> Iterator[Union[str, OutputSchema]]:
+        return self.ask_stream(inp.query, k=k, source=self._scope(inp.pdf_path))
 
-        # Similarity retriever (LangChain 0.2+ -> invoke)
-        retriever = vs.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": k}
-        )
-        docs: List[Document] = retriever.invoke(question)
+    def answer_batch(self, inps: List[InputSchema], k: int | None = None) -> List[OutputSchema]:
+        """answer'ın toplu hâli: aynı pdf_path'e sahip istekler tek ask_batch'te çalışır."""
+        groups: Dict[str, List[int]] = {}
+        for i, inp in enumerate(inps):
+            groups.setdefault(inp.pdf_path or "", []).append(i)
+        results: List[Optional[OutputSchema]] = [None] * len(inps)
+        for pdf_path, idxs in groups.items():
+            outs = self.ask_batch([inps[i].query for i in idxs], k=k, source=self._scope(pdf_path))
+            for i, out in zip(idxs, outs):
+                results[i] = out
+        return results  # type: ignore[return-value]
 
-        if not docs:
-            return OutputSchema(
-                query=question,
-                answer="BELİRTİLMEMİŞ",
-                reference=Reference(doc_id="", page=0),
+    def _scope(self, pdf_path: str) -> str | None:
+        return self.index_pdf(pdf_path) if pdf_path else None
+
+    def _k(self, k: int | None, source: str | None) -> int:
+        # Tek belgeye sınırlı aramada daha az chunk yeterli (scoped_top_k; 0 -> top_k)
+        return k or (self.cfg.scoped_top_k if source else 0) or self.cfg.top_k
+
+    @staticmethod
+    def _where(source: str | None) -> Dict | None:
+        return {"source": source} if source else None
+
+    @staticmethod
+    def _scoped_fp(fp: str, source: str | None) -> str:
+        # Aynı soru farklı belgelerde farklı cevaplanır: kapsam önbellek anahtarına girer
+        return f"{fp}|{source}" if source else fp
+
+    # ---------- Önbellek yardımcıları ----------
+    def _fingerprint(self) -> str:
+        """
+        Cevap önbelleği sürümü: indeks içeriği (manifest) + prompt dosyası + tüm ayarlar.
+        Manifest'in mtime'ı değişmedikçe yeniden hesaplanmaz.
+        """
+        try:
+            stamp = os.stat(Path(self.index_dir) / MANIFEST_NAME).st_mtime
+        except OSError:
+            stamp = 0.0
+        if self._fp is None or stamp != self._fp_stamp:
+            manifest = IndexManifest.load(self.index_dir)
+            h = hashlib.sha1((manifest.version() if manifest else "none").encode("utf-8"))
+            h.update(Path(self.prompt_yaml).read_bytes())
+            h.update(repr(self.cfg).encode("utf-8"))
+            self._fp, self._fp_stamp = h.hexdigest()[:16], stamp
+        return self._fp
+
+    def _embed_query(self, question: str) -> List[float]:
+        return self._embed_queries([question])[0]
+
+    def _embed_queries(self, questions: List[str]) -> List[List[float]]:
+        # LRU'da olmayan sorular tek encode çağrısıyla embed edilir
+        with tracing.span("query_embed", questions=len(questions)) as sp:
+            vecs = [self.qemb.get(q) for q in questions]
+            missing = list(dict.fromkeys(q for q, v in zip(questions, vecs) if v is None))
+            if missing:
+                fresh = dict(zip(missing, self.emb.embed_queries(missing)))
+                for q, v in fresh.items():
+                    self.qemb.put(q, v)
+                vecs = [v if v is not None else fresh[q] for q, v in zip(questions, vecs)]
+            sp["encoded"] = len(missing)
+        tracing.count("cache_total", len(questions) - len(missing), cache="query_emb", result="hit")
+        tracing.count("cache_total", len(missing), cache="query_emb", result="miss")
+        return vecs
+
+    def _cached_answer(self, question: str, k: int, fp: str) -> OutputSchema | None:
+        hit = self.answers.get(question, k, fp)
+        if hit is None and self.cfg.answer_cache_semantic > 0:
+            hit = self.answers.get(question, k, fp, qvec=self._embed_query(question))
+        tracing.count("cache_total", cache="answer", result="miss" if hit is None else "hit")
+        if hit is None:
+            return None
+        out = OutputSchema(**hit)
+        out.query = question  # semantik isabette kayıtlı soru farklı olabilir
+        return out
+
+    def _remember_answer(self, question: str, k: int, fp: str, out: OutputSchema) -> None:
+        qvec = self._embed_query(question) if self.cfg.answer_cache_semantic > 0 else None
+        self.answers.put(question, k, fp, dump_model(out), qvec=qvec)
+
+    # ---------- Pipeline adımları (ask ve ask_batch ortak kullanır) ----------
+    def retrieve_batch(self, questions: List[str], k: int | None = None,
+                       source: str | None = None) -> List[List[Document]]:
+        """
+        Soru başına belge listesi. Tüm sorular tek encode çağrısıyla embed edilir ve
+        tek bir çoklu sorgu aramasıyla (flat: matris-matris çarpımı, Chroma: çoklu
+        query_embeddings) getirilir.
+        rerank açıksa max(k, rerank_fetch_k) aday getirilir, tüm soruların
+        (soru, chunk) çiftleri birlikte skorlanır ve soru başına rerank_top_n chunk kalır.
+        source: verilirse yalnızca o kaynağın (PDF dosya adı) chunk'ları aranır.
+        """
+        if not questions:
+            return []
+        k = self._k(k, source)
+        with tracing.span("retrieval", questions=len(questions), k=k, source=source) as sp:
+            docs_list = self._retrieve_batch(questions, k, source)
+            sp["docs"] = sum(len(d) for d in docs_list)
+        return docs_list
+
+    def _retrieve_batch(self, questions: List[str], k: int, source: str | None) -> List[List[Document]]:
+        # retrieval span'inin içindeki adımlar: query_embed -> search -> gate -> (rerank)
+        fetch_k = max(k, self.cfg.rerank_fetch_k) if self.cfg.rerank else k
+        # top1-top5 farkı için en az 5 aday gerekir
+        hits = self.search_scored(questions, max(fetch_k, 5) if self.cfg.low_conf_gap > 0 else fetch_k, source)
+        passed = [self.passes_gate(h) for h in hits]
+        tracing.count("gate_total", sum(passed), result="pass")
+        tracing.count("gate_total", len(passed) - sum(passed), result="reject")
+        # Güvensiz getirme: belge yok -> LLM çağrılmadan BELİRTİLMEMİŞ
+        docs_list = [[d for d, _ in h[:fetch_k]] if ok else [] for h, ok in zip(hits, passed)]
+        if self.cfg.rerank:
+            with tracing.span("rerank", pairs=sum(len(d) for d in docs_list)) as sp:
+                kept = self.reranker.filter_batch(questions, docs_list, top_n=self.cfg.rerank_top_n)
+                docs_list = [docs for docs, _ in kept]
+                sp["kept"] = sum(len(d) for d in docs_list)
+        return docs_list
+
+    def search_scored(self, questions: List[str], n: int,
+                      source: str | None = None) -> List[List[Tuple[Document, float]]]:
+        """Soru başına en fazla n skorlu (Document, relevance) aday; kapı ve rerank uygulanmaz."""
+        # Metinler chunk ID ile PageStore'dan okunur; vektör deposu yalnızca ID+metadata döndürür
+        store = self.store
+        qvecs = self._embed_queries(questions)
+        with tracing.span("search", questions=len(questions), k=n) as sp:
+            hits = search_vectors(
+                self._get_vs(), qvecs, n,
+                text_lookup=store.chunk_texts if store is not None else None,
+                where=self._where(source),
             )
+            sp["hits"] = sum(len(h) for h in hits)
+            if hits and hits[0]:
+                sp["top_score"] = round(float(hits[0][0][1]), 4)
+        return hits
 
-        # Bağlamı hazırla
-        context = format_context(docs, max_chars=6000)
-        print("\n--- DEBUG CONTEXT PREVIEW ---\n", context[:1200], "\n-----------------------------\n")
+    def passes_gate(self, hits: List[Tuple[Document, float]], min_relevance: float | None = None,
+                    low_conf_gap: float | None = None) -> bool:
+        """
+        Getirme güveni kapısı (search_scored çıktısı üzerinde): en iyi skor min_relevance'ın
+        ya da top1-top5 farkı low_conf_gap'in altındaysa korpus soruyu büyük olasılıkla
+        cevaplayamaz. 0 (ya da negatif) eşik o kontrolü kapatır; tek adayda fark bakılmaz.
+        Eşikler verilmezse Settings'tekiler kullanılır (calibrate farklı eşikleri dener).
+        """
+        if not hits:
+            return False
+        m = self.cfg.min_relevance if min_relevance is None else min_relevance
+        gap = self.cfg.low_conf_gap if low_conf_gap is None else low_conf_gap
+        top1, top5 = best_scores_info(hits)
+        return confident(top1, top5, m, gap if len(hits) > 1 else 0.0)
 
-        # 1) Extractive deneme
+    def _retrieve(self, question: str, k: int, source: str | None = None) -> List[Document]:
+        return self.retrieve_batch([question], k, source)[0]
+
+    def _no_answer(self, question: str) -> OutputSchema:
+        return OutputSchema(
+            query=question,
+            answer=NO_ANSWER,
+            reference=Reference(doc_id="", page=0),
+        )
+
+    def _extract_prompt(self, question: str, context: str) -> Tuple[str, str]:
         sys = get_prompt(self.prompt_yaml, "extractive_no_wrap", "system")
         usr_tpl = get_prompt(self.prompt_yaml, "extractive_no_wrap", "user_template")
-        user = usr_tpl.format(question=question, context=context)
-        raw = self.llm.chat(sys, user).strip()
-
-        if not raw or raw.upper().startswith("BEL") or raw == "BELİRTİLMEMİŞ":
-            return OutputSchema(
-                query=question,
-                answer="BELİRTİLMEMİŞ",
-                reference=Reference(doc_id="", page=0),
-            )
+        return sys, usr_tpl.format(question=question, context=context)
 
-        # 2) Verifier: bağlamda destek var mı?
+    def _verify_prompt(self, question: str, answer: str, context: str) -> Tuple[str, str]:
         ver_sys = get_prompt(self.prompt_yaml, "verify_supported", "system")
         ver_usr = get_prompt(self.prompt_yaml, "verify_supported", "user_template").format(
             question=question,
-            answer=raw,
+            answer=answer,
             context=context
         )
-        verdict = self.llm.chat(ver_sys, ver_usr).strip().upper()
-
-        if verdict != "YES":
-            if normalize_for_compare(raw) not in normalize_for_compare(context):
-                return OutputSchema(
-                    query=question,
-                    answer="BELİRTİLMEMİŞ",
-                    reference=Reference(doc_id="", page=0),
-                )
+        return ver_sys, ver_usr
 
-        # 3) Referans: cevap hangi chunk'ta?
-        norm_ans = normalize_for_compare(raw)
-        ref_idx = -1
-        for i, d in enumerate(docs):
-            if norm_ans in normalize_for_compare(d.page_content):
-                ref_idx = i
-                break
+    def _gen(self, section: str) -> dict:
+        # Bölümün generation ayarları (max_new_tokens, stop) -> chat kwargs
+        return get_generation(self.prompt_yaml, section)
 
-        ref_doc = docs[ref_idx] if ref_idx != -1 else docs[0]
-        doc_id = str(ref_doc.metadata.get("source") or "")
-        page = int(ref_doc.metadata.get("page") or 0)
+    def _cache_prefix(self, section: str, context: str) -> str | None:
+        usr_tpl = get_prompt(self.prompt_yaml, section, "user_template")
+        return context_prefix(usr_tpl, context)
+
+    @staticmethod
+    def _is_no_answer(raw: str) -> bool:
+        return not raw or raw.upper().startswith("BEL") or raw == NO_ANSWER
+
+    def _ground(self, raw: str, docs: List[Document]) -> GroundedSpan | None:
+        return SpanGrounder(docs).find(raw)
+
+    def _needs_verify(self, span: GroundedSpan | None) -> bool:
+        # Cevap bağlamda yüksek güvenle bulunduysa LLM verifier'a gerek yok
+        return span is None or span.score < self.cfg.grounding_threshold
+
+    def _finalize(self, question: str, raw: str, span: GroundedSpan | None,
+                  support: float | None, docs: List[Document]) -> OutputSchema:
+        # support: verifier'ın P(YES); None -> verifier atlandı (span yeterince güvenilir)
+        if support is not None and support < self.cfg.verify_threshold:
+            return self._no_answer(question)
+
+        # 3) Referans: cevabın bulunduğu chunk; bulunamadıysa ilk chunk
+        if span is not None:
+            doc_id, page, offset = span.source, span.page, span.start
+        else:
+            ref_doc = docs[0]
+            doc_id = str(ref_doc.metadata.get("source") or "")
+            page = int(ref_doc.metadata.get("page") or 0)
+            offset = None
 
         return OutputSchema(
             query=question,
             answer=" ".join(raw.split()),
-            reference=Reference(doc_id=doc_id, page=page),
+            reference=Reference(doc_id=doc_id, page=page, offset=offset),
+        )
+
+    # ---------- Ask (now returns OutputSchema) ----------
+    def _attach_trace(self, out: OutputSchema, trace: tracing.Trace) -> OutputSchema:
+        # Trace kapatılır (JSON log + metrikler); debug açıksa çıktıya eklenir
+        trace.finish()
+        if self.cfg.trace_debug:
+            out.debug = trace.as_dict()
+        return out
+
+    def ask(self, question: str, k: int | None = None, source: str | None = None) -> OutputSchema:
+        k = self._k(k, source)
+        trace = tracing.Trace("ask", k=k, source=source)
+        with tracing.activate(trace):
+            fp = self._scoped_fp(self._fingerprint(), source)
+            out = self._cached_answer(question, k, fp)
+            if out is None:
+                out = self._ask_uncached(question, k, source)
+                self._remember_answer(question, k, fp, out)
+        return self._attach_trace(out, trace)
+
+    def ask_stream(self, question: str, k: int | None = None,
+                   source: str | None = None) -> Iterator[Union[str, OutputSchema]]:
+        """
+        ask() ile aynı akış; extract cevabının metin parçaları üretildikçe döner,
+        en son nihai OutputSchema gelir. Verifier cevabı sonradan reddedebilir:
+        geçerli olan her zaman son OutputSchema'dır.
+        """
+        k = self._k(k, source)
+        trace = tracing.Trace("ask_stream", k=k, source=source)
+        with tracing.activate(trace):
+            fp = self._scoped_fp(self._fingerprint(), source)
+            out = self._cached_answer(question, k, fp)
+        if out is not None:
+            yield out.answer
+            yield self._attach_trace(out, trace)
+            return
+        steps = self._ask_steps(question, k, stream=True, source=source)
+        try:
+            while True:
+                # Trace yalnızca adımlar çalışırken etkin; tüketici tarafına sızmaz
+                with tracing.activate(trace):
+                    event = next(steps, None)
+                    if isinstance(event, OutputSchema):
+                        self._remember_answer(question, k, fp, event)
+                if event is None:
+                    return
+                if isinstance(event, OutputSchema):
+                    yield self._attach_trace(event, trace)
+                    return
+                yield event
+        finally:
+            steps.close()
+
+    def _ask_uncached(self, question: str, k: int, source: str | None = None) -> OutputSchema:
+        out = None
+        for out in self._ask_steps(question, k, stream=False, source=source):
+            pass
+        return out  # type: ignore[return-value]
+
+    def _ask_steps(self, question: str, k: int, stream: bool,
+                   source: str | None = None) -> Iterator[Union[str, OutputSchema]]:
+        # stream=True: extract metni parça parça; son öğe her zaman OutputSchema
+        docs: List[Document] = self._retrieve(question, k, source)
+
+        if not docs:
+            yield self._no_answer(question)
+            return
+
+        # Bağlamı hazırla
+        context = self._context(docs)
+
+        # 1) Extractive deneme
+        extract = dict(
+            cache_prefix=self._cache_prefix("extractive_no_wrap", context),
+            assist=True,
+            **self._gen("extractive_no_wrap"),
         )
+        if stream:
+            raw = ""
+            for piece in self.llm.chat_stream(*self._extract_prompt(question, context), **extract):
+                raw += piece
+                yield piece
+        else:
+            raw = self.llm.chat(*self._extract_prompt(question, context), **extract)
+        raw = raw.strip()
+
+        if self._is_no_answer(raw):
+            yield self._no_answer(question)
+            return
+
+        # 2) Grounding: cevap bağlamda birebir/yakın geçiyorsa verifier atlanır
+        with tracing.span("grounding") as sp:
+            span = self._ground(raw, docs)
+            sp["score"] = round(span.score, 4) if span is not None else None
+        support = None
+        if self._needs_verify(span):
+            # Verifier: bağlamda destek var mı? generate yerine tek forward ile P(YES)
+            # (context-first şablonda extract'ın bağlam KV'sinden devam eder)
+            support = self.llm.classify(
+                *self._verify_prompt(question, raw, context),
+                cache_prefix=self._cache_prefix("verify_supported", context),
+            )
+
+        with tracing.span("reference"):
+            out = self._finalize(question, raw, span, support, docs)
+        yield out
+
+    # ---------- Ask batch: aynı adımlar, LLM çağrıları toplu ----------
+    def ask_batch(self, questions: List[str], k: int | None = None,
+                  source: str | None = None) -> List[OutputSchema]:
+        """
+        ask() ile aynı sonuçları üretir; fakat tüm extract prompt'ları tek seferde,
+        ardından tüm verify prompt'ları tek seferde QwenChat.classify_batch'e gönderilir.
+        Önbellekte cevabı olan sorular LLM'e hiç gitmez.
+        """
+        return self.finish_batch(self.prepare_batch(questions, k, source))
+
+    def prepare_batch(self, questions: List[str], k: int | None = None,
+                      source: str | None = None) -> PreparedBatch:
+        """
+        Batch'in LLM'siz kısmı: önbellek araması, getirme ve bağlam hazırlığı.
+        LLM'den bağımsız olduğu için bir sonraki batch'in üretimiyle eşzamanlı
+        (ayrı thread'de) çalıştırılabilir; bkz. batch_runner.
+        """
+        k = self._k(k, source)
+        trace = tracing.Trace("batch", k=k, questions=len(questions), source=source)
+        with tracing.activate(trace):
+            fp = self._scoped_fp(self._fingerprint(), source)
+            if self.cfg.answer_cache_semantic > 0:
+                self._embed_queries(questions)  # semantik önbellek araması için tek encode
+            prep = PreparedBatch(questions=list(questions), k=k, fingerprint=fp, trace=trace)
+            prep.results = [self._cached_answer(q, k, fp) for q in questions]
+            prep.miss = [i for i, r in enumerate(prep.results) if r is None]
+            docs_list = self.retrieve_batch([questions[i] for i in prep.miss], k, source)
+            for i, docs in zip(prep.miss, docs_list):
+                prep.docs[i] = docs
+                prep.contexts[i] = self._context(docs) if docs else ""
+        return prep
+
+    def finish_batch(self, prep: PreparedBatch) -> List[OutputSchema]:
+        """prepare_batch çıktısı için extract + grounding + verify; cevaplar önbelleğe yazılır."""
+        trace = prep.trace or tracing.Trace("batch", k=prep.k, questions=len(prep.questions))
+        with tracing.activate(trace):
+            if prep.miss:
+                outs = self._generate_batch(
+                    [prep.questions[i] for i in prep.miss],
+                    [prep.docs[i] for i in prep.miss],
+                    [prep.contexts[i] for i in prep.miss],
+                )
+                for i, out in zip(prep.miss, outs):
+                    prep.results[i] = out
+                    self._remember_answer(prep.questions[i], prep.k, prep.fingerprint, out)
+        # Batch'in tek trace'i her çıktıya eklenir (LLM çağrıları batch için ortak)
+        return [self._attach_trace(out, trace) for out in prep.results]  # type: ignore[arg-type]
+
+    def _generate_batch(self, questions: List[str], docs_list: List[List[Document]],
+                        contexts: List[str]) -> List[OutputSchema]:
+        results: List[Optional[OutputSchema]] = [
+            None if docs else self._no_answer(q) for q, docs in zip(questions, docs_list)
+        ]
+
+        # 1) Extractive: bekleyen tüm sorular tek batch
+        # (hepsi bağlamsızsa LLM hiç çağrılmaz; lazy model yüklenmez)
+        pending = [i for i in range(len(questions)) if results[i] is None]
+        raws = self.llm.chat_batch(
+            [self._extract_prompt(questions[i], contexts[i]) for i in pending],
+            batch_size=self.cfg.llm_batch_size,
+            assist=True,
+            **self._gen("extractive_no_wrap"),
+        ) if pending else []
+        answers = {}
+        for i, raw in zip(pending, raws):
+            raw = raw.strip()
+            if self._is_no_answer(raw):
+                results[i] = self._no_answer(questions[i])
+            else:
+                answers[i] = raw
+
+        # 2) Grounding; yalnızca güvenle bulunamayanlar tek batch verifier'a gider
+        with tracing.span("grounding", answers=len(answers)):
+            spans = {i: self._ground(raw, docs_list[i]) for i, raw in answers.items()}
+        pending = [i for i in answers if self._needs_verify(spans[i])]
+        supports = self.llm.classify_batch(
+            [self._verify_prompt(questions[i], answers[i], contexts[i]) for i in pending],
+            batch_size=self.cfg.llm_batch_size,
+        ) if pending else []
+        support_of = dict(zip(pending, supports))
+        with tracing.span("reference", answers=len(answers)):
+            for i in answers:
+                results[i] = self._finalize(
+                    questions[i], answers[i], spans[i], support_of.get(i), docs_list[i]
+                )
+
+        return results  # type: ignore[return-value]
@@ -0,0 +1,170 @@
+# src/qcache.py
+from __future__ import annotations
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .utils import normalize_question
+
+
+class QueryEmbeddingLRU:
+    """Soru metni -> sorgu embedding'i; bellek içi LRU."""
+    def __init__(self, max_items: int = 1024):
+        self.max_items = int(max_items)
+        self._data: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str) -> Optional[List[float]]:
+        with self._lock:
+            vec = self._data.get(text)
+            if vec is not None:
+                self._data.move_to_end(text)
+            return vec
+
+    def put(self, text: str, vec: List[float]) -> None:
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._data[text] = vec
+            self._data.move_to_end(text)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+
+class PairScoreCache(QueryEmbeddingLRU):
+    """(soru hash'i, chunk ID) -> cross-encoder skoru; bellek içi LRU."""
+    @staticmethod
+    def key(question: str, chunk_id: str) -> str:
+        # Skor modele giden metne bağlı: normalize edilmiş değil, birebir soru hash'lenir
+        qh = hashlib.sha1(question.encode("utf-8")).hexdigest()[:16]
+        return f"{qh}|{chunk_id}"
+
+
+class AnswerCache:
+    """
+    Nihai cevap önbelleği.
+    Anahtar: (normalize soru, k, sürüm parmak izi). Parmak izi indeks/prompt/model
+    sürümünü taşır; herhangi biri değişince eski kayıtlar artık eşleşmez.
+    TTL ve boyut sınırı (LRU) ile eskir; path verilirse JSON olarak diske yazılır.
+
+    semantic_threshold > 0 ise birebir eşleşme yoksa, aynı (k, parmak izi) altındaki
+    kayıtlardan sorgu embedding'i kosinüs benzerliği eşiği geçen en yakını kullanılır
+    (embedding'ler normalize varsayılır: kosinüs = iç çarpım).
+    """
+    def __init__(self, max_items: int = 10000, ttl_s: float = 86400.0, path: Optional[str] = None,
+                 semantic_threshold: float = 0.0, save_every: int = 32):
+        self.max_items = int(max_items)
+        self.ttl_s = float(ttl_s)
+        self.path = Path(path) if path else None
+        self.semantic_threshold = float(semantic_threshold)
+        self.save_every = max(1, int(save_every))
+        # key -> {"t": zaman, "out": OutputSchema dict, "vec": embedding|None}
+        self._data: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        if self.path is not None:
+            self._load()
+            atexit.register(self.save)
+
+    @staticmethod
+    def _key(question: str, k: int, fingerprint: str) -> str:
+        return f"{fingerprint}|{k}|{normalize_question(question)}"
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return self.ttl_s > 0 and now - entry["t"] > self.ttl_s
+
+    def get(self, question: str, k: int, fingerprint: str,
+            qvec: Optional[List[float]] = None) -> Optional[Dict[str, Any]]:
+        if self.max_items <= 0:
+            return None
+        now = time.time()
+        key = self._key(question, k, fingerprint)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._data[key]
+                entry = None
+            if entry is None and qvec is not None and self.semantic_threshold > 0:
+                key, entry = self._nearest(f"{fingerprint}|{k}|", qvec, now)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            return entry["out"]
+
+    def _nearest(self, prefix: str, qvec: List[float], now: float) -> Tuple[str, Optional[Dict[str, Any]]]:
+        keys, vecs = [], []
+        for key, entry in self._data.items():
+            if key.startswith(prefix) and entry.get("vec") is not None and not self._expired(entry, now):
+                keys.append(key)
+                vecs.append(entry["vec"])
+        if not keys:
+            return "", None
+        sims = np.asarray(vecs, dtype=np.float32) @ np.asarray(qvec, dtype=np.float32)
+        best = int(np.argmax(sims))
+        if float(sims[best]) < self.semantic_threshold:
+            return "", None
+        return keys[best], self._data[keys[best]]
+
+    def put(self, question: str, k: int, fingerprint: str, out: Dict[str, Any],
+            qvec: Optional[List[float]] = None) -> None:
+        if self.max_items <= 0:
+            return
+        key = self._key(question, k, fingerprint)
+        with self._lock:
+            self._data[key] = {
+                "t": time.time(),
+                "out": out,
+                "vec": list(map(float, qvec)) if qvec is not None and self.semantic_threshold > 0 else None,
+            }
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+            self._unsaved += 1
+            should_save = self.path is not None and self._unsaved >= self.save_every
+        if should_save:
+            self.save()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._unsaved += 1
+        self.save()
+
+    # ---------- Kalıcılık ----------
+    def _load(self) -> None:
+        if self.path is None or not self.path.is_file():
+            return
+        try:
+            items = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception:
+            return  # bozuk önbellek dosyası yok sayılır
+        now = time.time()
+        for key, entry in items:
+            if not self._expired(entry, now):
+                self._data[key] = entry
+        while len(self._data) > self.max_items:
+            self._data.popitem(last=False)
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._unsaved:
+                return
+            items = list(self._data.items())
+            self._unsaved = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(items, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
@@ -1,5 +1,17 @@
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import (
+    AutoTokenizer, AutoModelForCausalLM, DynamicCache, StoppingCriteria, StoppingCriteriaList,
+    TextIteratorStreamer,
+)
+
+from . import tracing
+from .utils import cut_at_stop
 
 def _has_accelerate() -> bool:
     try:
@@ -20,10 +32,123 @@ def _try_4bit():
     except Exception:
         return None
 
+CPU_MODES = ("auto", "int8", "bf16", "fp32")
+
+def _cpu_has_bf16() -> bool:
+    # Yerel bf16 desteği (AVX512-BF16 / AMX); yoksa bf16 matmul'ları emüle edilir ve yavaştır
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+def resolve_cpu_mode(mode: str) -> str:
+    """auto -> CPU bf16 destekliyorsa bf16, değilse int8 (dinamik nicemleme)."""
+    if mode not in CPU_MODES:
+        raise ValueError(f"Bilinmeyen cpu_mode: {mode} (seçenekler: {', '.join(CPU_MODES)})")
+    if mode == "auto":
+        return "bf16" if _cpu_has_bf16() else "int8"
+    return mode
+
+def configure_torch_threads(threads: int = 0, interop_threads: int = 0) -> None:
+    # 0 -> torch varsayılanı. interop sayısı yalnızca ilk paralel işten önce ayarlanabilir.
+    if threads > 0:
+        torch.set_num_threads(int(threads))
+    if interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(int(interop_threads))
+        except RuntimeError:
+            pass
+
+def _optimize_for_cpu(model, mode: str, compile: bool = False):
+    if mode == "int8":
+        # Linear ağırlıkları int8, aktivasyonlar çalışma anında nicemlenir (fp32 model gerekir).
+        # inplace: fp32 modelin ikinci bir kopyası oluşmasın (tepe bellek)
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+    if compile:
+        model.forward = torch.compile(model.forward, dynamic=True)
+    return model
+
+def _cache_head(cache, n: int) -> DynamicCache:
+    """cache'in ilk n token'ının bağımsız kopyası; kaynak girdi değişmez."""
+    if hasattr(cache, "layers"):
+        kv = [(layer.keys, layer.values) for layer in cache.layers]
+    else:  # eski transformers: key_cache / value_cache listeleri
+        kv = list(zip(cache.key_cache, cache.value_cache))
+    out = DynamicCache()
+    for i, (k, v) in enumerate(kv):
+        out.update(k[..., :n, :].clone(), v[..., :n, :].clone(), i)
+    return out
+
+def _common_prefix_len(a: List[int], b: List[int]) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+DECODING_MODES = ("greedy", "prompt_lookup", "draft")
+
+class _StopOnStrings(StoppingCriteria):
+    """
+    Üretilen kısım (baştaki boşluk hariç) durdurma dizgelerinden birini içerince
+    o satırı durdurur. Sol dolgulu batch'te yeni token'lar prompt_len'den başlar.
+    """
+    def __init__(self, tok, prompt_len: int, stop: Sequence[str]):
+        self.tok = tok
+        self.prompt_len = prompt_len
+        self.stop = list(stop)
+
+    def __call__(self, input_ids: torch.LongTensor, scores, **kwargs) -> torch.BoolTensor:
+        texts = self.tok.batch_decode(input_ids[:, self.prompt_len:], skip_special_tokens=True)
+        done = [any(s in t.lstrip() for s in self.stop) for t in texts]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+class _FirstTokenTimer(StoppingCriteria):
+    """Hiç durdurmaz; ilk çağrı anını (prefill + ilk token bitti) kaydeder."""
+    def __init__(self):
+        self.first: Optional[float] = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores, **kwargs) -> torch.BoolTensor:
+        if self.first is None:
+            self.first = time.perf_counter()
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+class _StopOnEvent(StoppingCriteria):
+    """Olay set edilince tüm satırları durdurur (akış tüketicisi vazgeçti)."""
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids: torch.LongTensor, scores, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
 class QwenChat:
-    def __init__(self, model_name="Qwen/Qwen3-4B-Instruct-2507", temperature=0.0, max_new_tokens=96):
+    def __init__(self, model_name="Qwen/Qwen3-4B-Instruct-2507", temperature=0.0, max_new_tokens=96, batch_size=8,
+                 prefix_cache_size=3, decoding="greedy", prompt_lookup_num_tokens=10, draft_model="",
+                 cpu_mode="auto", threads=0, interop_threads=0, compile=False):
         self.temperature = temperature
         self.max_new_tokens = max_new_tokens
+        self.batch_size = batch_size
+
+        # Kopyalayan (extractive) çağrılar için spekülatif kod çözme:
+        #   prompt_lookup -> aday token'lar prompt'taki n-gram eşleşmelerinden çekilir
+        #   draft         -> aday token'ları küçük bir taslak model üretir (aynı tokenizer)
+        # Greedy altında çıktı değişmez; yalnızca assist=True çağrılarda ve tek prompt'ta kullanılır.
+        if decoding not in DECODING_MODES:
+            raise ValueError(f"Bilinmeyen decoding: {decoding} (seçenekler: {', '.join(DECODING_MODES)})")
+        self.decoding = decoding
+        self.prompt_lookup_num_tokens = int(prompt_lookup_num_tokens)
+        self.draft_model_name = draft_model
+        self._draft = None
+
+        # Prefix KV-cache: rendered prompt öneki -> (token id'leri, past_key_values).
+        # Sabit system prompt'ları ve (context-first şablonlarda) bağlam öneki bir kez
+        # prefill edilir, sonraki çağrılar kaldığı yerden devam eder. 0 -> kapalı.
+        self.prefix_cache_size = int(prefix_cache_size)
+        self._prefix_cache: "OrderedDict[str, Tuple[List[int], Any]]" = OrderedDict()
 
         has_cuda = torch.cuda.is_available()
         has_acc = _has_accelerate()
@@ -38,33 +163,390 @@ class QwenChat:
             # GPU var ve accelerate var → otomatik yerleşim
             kwargs["device_map"] = "auto"
             kwargs["torch_dtype"] = torch.bfloat16
-        else:
+        elif has_cuda:
             # accelerate yoksa device_map verme; klasik .to(device) yaparız
-            kwargs["torch_dtype"] = torch.bfloat16 if has_cuda else torch.float32
+            kwargs["torch_dtype"] = torch.bfloat16
+
+        # CPU: int8 dinamik nicemleme ya da (destekleniyorsa) bf16; ikisi de fp32'ye göre ~yarı bellek
+        self.cpu_mode = None if has_cuda else resolve_cpu_mode(cpu_mode)
+        self.compile = bool(compile)
+        if self.cpu_mode is not None:
+            configure_torch_threads(threads, interop_threads)
+            kwargs["torch_dtype"] = torch.bfloat16 if self.cpu_mode == "bf16" else torch.float32
 
         self.tok = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+        # Toplu üretimde prompt'lar sola doldurulur (decoder-only modeller için şart)
+        self.tok.padding_side = "left"
+        if self.tok.pad_token_id is None:
+            self.tok.pad_token = self.tok.eos_token
         self.model = AutoModelForCausalLM.from_pretrained(model_name, **kwargs)
+        self._load_kwargs = kwargs
 
         if not kwargs.get("device_map"):
             # accelerate kullanmıyorsak elle cihaza taşı
             self.model.to("cuda" if has_cuda else "cpu")
+        if self.cpu_mode is not None:
+            self.model = _optimize_for_cpu(self.model, self.cpu_mode, self.compile)
+        self.model.eval()
 
         self.eos = self.tok.eos_token_id
+        self._label_cache: dict = {}
+        self.last_new_tokens = 0  # son chat çağrısında üretilen token sayısı (bench için)
+        # Etkin trace varken son generate'in prefill/decode süreleri ve önbellekten gelen token sayısı
+        self._last_timing: dict = {}
+        self._last_cached = 0
+
+    @property
+    def draft(self):
+        # Taslak model yalnızca decoding="draft" ilk kullanıldığında yüklenir
+        if self._draft is None:
+            if not self.draft_model_name:
+                raise ValueError("decoding='draft' için draft_model verilmeli")
+            self._draft = AutoModelForCausalLM.from_pretrained(self.draft_model_name, **self._load_kwargs)
+            if not self._load_kwargs.get("device_map"):
+                self._draft.to(self.model.device)
+            if self.cpu_mode is not None:
+                self._draft = _optimize_for_cpu(self._draft, self.cpu_mode)
+        return self._draft
+
+    @property
+    def assisted(self) -> bool:
+        return self.decoding != "greedy"
+
+    def _assist_kwargs(self) -> dict:
+        if self.decoding == "prompt_lookup":
+            return {"prompt_lookup_num_tokens": self.prompt_lookup_num_tokens}
+        if self.decoding == "draft":
+            return {"assistant_model": self.draft}
+        return {}
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tok(text, add_special_tokens=False).input_ids)
 
-    def chat(self, system: str, user: str) -> str:
+    def _render(self, system: str, user: str) -> str:
         messages = [
             {"role": "system", "content": system},
             {"role": "user", "content": user},
         ]
-        tpl = self.tok.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-        inputs = self.tok([tpl], return_tensors="pt").to(self.model.device)
+        return self.tok.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+    def _generate(self, inputs, max_new_tokens: Optional[int] = None,
+                  stop: Optional[Sequence[str]] = None, cancel: Optional[threading.Event] = None,
+                  **extra) -> torch.Tensor:
+        # max_new_tokens/stop çağrı başına (prompt bölümünün generation ayarları)
+        criteria: List[StoppingCriteria] = []
+        if stop:
+            criteria.append(_StopOnStrings(self.tok, inputs["input_ids"].shape[1], stop))
+        if cancel is not None:
+            criteria.append(_StopOnEvent(cancel))
+        timer = _FirstTokenTimer() if tracing.current() is not None else None
+        if timer is not None:
+            criteria.append(timer)
+        if criteria:
+            extra["stopping_criteria"] = StoppingCriteriaList(criteria)
+        t0 = time.perf_counter()
         with torch.no_grad():
             out = self.model.generate(
                 **inputs,
-                max_new_tokens=self.max_new_tokens,
+                **extra,
+                max_new_tokens=int(max_new_tokens or self.max_new_tokens),
                 temperature=self.temperature,
                 do_sample=False,
                 eos_token_id=self.eos,
+                pad_token_id=self.tok.pad_token_id,
             )
-        text = self.tok.decode(out[0][inputs["input_ids"].shape[1]:], skip_special_tokens=True)
-        return text.strip()
+        if timer is not None:
+            t1, end = timer.first or time.perf_counter(), time.perf_counter()
+            self._last_timing = {"prefill_ms": round((t1 - t0) * 1000.0, 3),
+                                 "decode_ms": round((end - t1) * 1000.0, 3)}
+        return out
+
+    def _call_stats(self, prompt_tokens: int, new_tokens: int) -> dict:
+        # LLM span'inin alanları (bkz. tracing.TOKEN_ATTRS)
+        return {"prompt_tokens": int(prompt_tokens), "cached_tokens": int(self._last_cached),
+                "new_tokens": int(new_tokens), **self._last_timing}
+
+    # ---------- Prefix KV-cache ----------
+    def _lookup_prefix(self, ids: List[int]) -> Tuple[Optional[str], int]:
+        # En uzun eşleşme; eşitlikte en kısa girdi (tamamı eşleşen girdi kopyasız kullanılır)
+        best_key, best_n, best_len = None, 0, 0
+        for key, (pids, _) in self._prefix_cache.items():
+            n = _common_prefix_len(pids, ids)
+            if n > best_n or (n == best_n and n > 0 and len(pids) < best_len):
+                best_key, best_n, best_len = key, n, len(pids)
+        return best_key, best_n
+
+    def _ensure_prefix(self, text: str) -> None:
+        """text önekinin KV'lerini hesaplayıp saklar; mevcut en uzun önekten devam eder."""
+        if text in self._prefix_cache:
+            self._prefix_cache.move_to_end(text)
+            return
+        ids = self.tok(text)["input_ids"]
+        key, n = self._lookup_prefix(ids)
+        if key is not None:
+            # Yalnızca ortak n token kopyalanır; kaynak girdi olduğu gibi kalır
+            cache = _cache_head(self._prefix_cache[key][1], n)
+        else:
+            cache, n = DynamicCache(), 0
+        if n < len(ids):
+            with torch.no_grad():
+                self.model(
+                    input_ids=torch.tensor([ids[n:]], device=self.model.device),
+                    past_key_values=cache,
+                    use_cache=True,
+                )
+        self._prefix_cache[text] = (ids, cache)
+        while len(self._prefix_cache) > self.prefix_cache_size:
+            self._prefix_cache.popitem(last=False)
+
+    def _prefix_for(self, tpl: str, user: str, cache_prefix: Optional[str],
+                    ids: List[int]) -> Tuple[Any, int]:
+        """
+        Prompt için kullanılabilecek en uzun önbellekli KV'yi döndürür.
+        Önekler: system prompt'un tamamı (+ varsa user'ın cache_prefix kısmı).
+        Token sınırında farklılık olabileceği için eşleşme token düzeyinde yapılır.
+        """
+        pos = tpl.rfind(user) if user else -1
+        if pos <= 0:
+            return None, 0
+        self._ensure_prefix(tpl[:pos])
+        if cache_prefix and user.startswith(cache_prefix):
+            self._ensure_prefix(tpl[:pos] + cache_prefix)
+
+        key, n = self._lookup_prefix(ids)
+        n = min(n, len(ids) - 1)  # generate en az bir yeni token ister
+        if key is None or n <= 0:
+            return None, 0
+        pids, cache = self._prefix_cache[key]
+        self._prefix_cache.move_to_end(key)
+        if n < len(pids):
+            # Kısmi eşleşme (ör. önek sonunda farklı token sınırı): saklanan girdi
+            # kırpılmaz, ilk n token'lık çalışma kopyası kullanılır
+            return _cache_head(cache, n), n
+        # Tam eşleşme: generate girdiyi yerinde uzatır, çağıran sonra n'e geri kırpar
+        return cache, n
+
+    def clear_prefix_cache(self) -> None:
+        self._prefix_cache.clear()
+
+    def _generate_for(self, tpl: str, user: str, inputs, cache_prefix: Optional[str],
+                      assist: bool, **gen) -> torch.Tensor:
+        # Tek prompt: spekülatif mod ya da (varsa) prefix KV-cache üzerinden generate
+        self._last_cached = 0
+        if assist and self.assisted:
+            return self._generate(inputs, **gen, **self._assist_kwargs())
+
+        past, n_cached = None, 0
+        if self.prefix_cache_size > 0:
+            ids = inputs["input_ids"][0].tolist()
+            past, n_cached = self._prefix_for(tpl, user, cache_prefix, ids)
+        self._last_cached = n_cached
+
+        if past is None:
+            return self._generate(inputs, **gen)
+        try:
+            return self._generate(inputs, past_key_values=past, **gen)
+        finally:
+            # generate cache'i yerinde uzatır; öneke geri kırp
+            past.crop(n_cached)
+
+    def chat(self, system: str, user: str, cache_prefix: Optional[str] = None, assist: bool = False,
+             max_new_tokens: Optional[int] = None, stop: Optional[Sequence[str]] = None) -> str:
+        """
+        cache_prefix: user metninin, sonraki çağrılarda aynen tekrar edecek baş kısmı
+        (ör. context-first şablonda bağlam bloğu). Verilirse KV'si saklanır.
+        assist: cevap prompt'tan kopyalanıyorsa (extract) ayarlı spekülatif kod çözmeyi kullan.
+        Spekülatif modda prefix KV-cache kullanılmaz (assisted generate önceden
+        doldurulmuş cache ile doğru çalışmıyor).
+        max_new_tokens / stop: çağrı başına üst sınır ve durdurma dizgeleri (ör. "\n");
+        çıktı ilk durdurma dizgesinden önce kesilir.
+        """
+        with tracing.span("llm.chat", assist=bool(assist and self.assisted)) as sp:
+            tpl = self._render(system, user)
+            inputs = self.tok([tpl], return_tensors="pt").to(self.model.device)
+            out = self._generate_for(tpl, user, inputs, cache_prefix, assist,
+                                     max_new_tokens=max_new_tokens, stop=stop)
+            text = cut_at_stop(self._decode_new(out, inputs), stop)
+            sp.update(self._call_stats(inputs["input_ids"].shape[1], self.last_new_tokens))
+        return text
+
+    def _decode_new(self, out: torch.Tensor, inputs) -> str:
+        new = out[0][inputs["input_ids"].shape[1]:]
+        self.last_new_tokens = int(new.shape[0])
+        return self.tok.decode(new, skip_special_tokens=True).strip()
+
+    def chat_stream(self, system: str, user: str, cache_prefix: Optional[str] = None, assist: bool = False,
+                    max_new_tokens: Optional[int] = None, stop: Optional[Sequence[str]] = None) -> Iterator[str]:
+        """
+        chat ile aynı üretim; metin parçaları üretildikçe döner. Durdurma dizgesi
+        görülünce öncesi verilir ve akış biter. Parçaların birleşimi chat() çıktısıdır.
+        Generator erken kapatılırsa generate bir sonraki token'da durdurulur.
+        """
+        tpl = self._render(system, user)
+        inputs = self.tok([tpl], return_tensors="pt").to(self.model.device)
+        streamer = TextIteratorStreamer(self.tok, skip_prompt=True, skip_special_tokens=True)
+        errors: List[BaseException] = []
+        outs: List[torch.Tensor] = []
+        cancel = threading.Event()
+        t0 = time.perf_counter()
+
+        def run() -> None:
+            try:
+                outs.append(self._generate_for(tpl, user, inputs, cache_prefix, assist,
+                                               max_new_tokens=max_new_tokens, stop=stop,
+                                               streamer=streamer, cancel=cancel))
+            except BaseException as e:  # tüketici tarafında yükseltilir
+                errors.append(e)
+                streamer.end()
+
+        # Üretim thread'i etkin trace'i görsün (prefill/decode ölçümü)
+        worker = threading.Thread(target=contextvars.copy_context().run, args=(run,),
+                                  name="qwen-stream", daemon=True)
+        worker.start()
+        text, sent = "", 0
+        try:
+            for piece in streamer:
+                text += piece
+                cut = cut_at_stop(text, stop) if stop else None
+                if cut is not None and len(cut) < len(text.strip()):
+                    # Durdurma dizgesi geldi: kalan kısmı ver, üreticiyi bekle
+                    if len(cut) > sent:
+                        yield cut[sent:]
+                    sent = len(cut)
+                    break
+                visible = text.lstrip()
+                if len(visible) > sent:
+                    yield visible[sent:]
+                    sent = len(visible)
+        finally:
+            # Tüketici bıraktıysa (close/break) generate'i max_new_tokens'a kadar bekleme
+            cancel.set()
+            worker.join()
+        if errors:
+            raise errors[0]
+        trace = tracing.current()
+        if trace is not None and outs:
+            new = outs[0].shape[1] - inputs["input_ids"].shape[1]
+            trace.add("llm.chat_stream", time.perf_counter() - t0, start=t0,
+                      assist=bool(assist and self.assisted),
+                      **self._call_stats(inputs["input_ids"].shape[1], new))
+
+    def chat_batch(self, pairs: List[Tuple[str, str]], batch_size: Optional[int] = None,
+                   assist: bool = False, max_new_tokens: Optional[int] = None,
+                   stop: Optional[Sequence[str]] = None) -> List[str]:
+        """
+        (system, user) çiftlerini toplu üretir; çıktı sırası girdi sırasıyla aynıdır.
+        Dolgu israfını azaltmak için prompt'lar token uzunluğuna göre sıralanıp
+        batch_size'lık gruplar halinde, sola doldurularak generate edilir.
+        Sol dolgu satırları kaydırdığı için prefix KV-cache burada kullanılmaz.
+        assist=True ve spekülatif mod açıksa prompt'lar tek tek üretilir
+        (assisted generate yalnızca batch=1 destekler).
+        """
+        if not pairs:
+            return []
+        if assist and self.assisted:
+            return [self.chat(s, u, assist=True, max_new_tokens=max_new_tokens, stop=stop) for s, u in pairs]
+        bs = max(1, int(batch_size or self.batch_size))
+        tpls = [self._render(s, u) for s, u in pairs]
+        lengths = [len(ids) for ids in self.tok(tpls)["input_ids"]]
+        order = sorted(range(len(tpls)), key=lambda i: lengths[i])
+
+        out_texts: List[str] = [""] * len(tpls)
+        self._last_cached = 0
+        for start in range(0, len(order), bs):
+            group = order[start:start + bs]
+            with tracing.span("llm.chat_batch", batch=len(group)) as sp:
+                inputs = self.tok(
+                    [tpls[i] for i in group], return_tensors="pt", padding=True
+                ).to(self.model.device)
+                out = self._generate(inputs, max_new_tokens=max_new_tokens, stop=stop)
+                prompt_len = inputs["input_ids"].shape[1]
+                for row, i in enumerate(group):
+                    text = self.tok.decode(out[row][prompt_len:], skip_special_tokens=True)
+                    out_texts[i] = cut_at_stop(text, stop)
+                # Dolgu token'ları sayılmaz
+                new = int((out[:, prompt_len:] != self.tok.pad_token_id).sum())
+                sp.update(self._call_stats(int(inputs["attention_mask"].sum()), new))
+        return out_texts
+
+    # ---------- Tek forward ile sınıflandırma ----------
+    def _label_token_ids(self, label: str) -> List[int]:
+        # Etiketin olası ilk token'ları: "YES", " YES", "Yes", "yes" ...
+        if label not in self._label_cache:
+            ids = set()
+            for v in {label, label.lower(), label.capitalize()}:
+                for text in (v, " " + v):
+                    toks = self.tok(text, add_special_tokens=False)["input_ids"]
+                    if toks:
+                        ids.add(toks[0])
+            self._label_cache[label] = sorted(ids)
+        return self._label_cache[label]
+
+    def _label_probs(self, logits: torch.Tensor, labels: Tuple[str, ...]) -> torch.Tensor:
+        # logits: B x V (son pozisyon). Etiket başına varyant logit'lerinin logsumexp'i,
+        # ardından yalnızca etiketler arasında softmax -> B x len(labels)
+        logits = logits.float()
+        id_sets = [set(self._label_token_ids(lb)) for lb in labels]
+        # Birden çok etikette ortak ilk token (ör. yalnızca boşluk) ayırt edici değildir
+        shared = set.union(*[a & b for i, a in enumerate(id_sets) for b in id_sets[i + 1:]] or [set()])
+        groups = [
+            torch.logsumexp(logits[:, sorted(ids - shared) or sorted(ids)], dim=-1) for ids in id_sets
+        ]
+        return torch.softmax(torch.stack(groups, dim=-1), dim=-1)
+
+    def classify(self, system: str, user: str, labels: Tuple[str, ...] = ("YES", "NO"),
+                 cache_prefix: Optional[str] = None) -> float:
+        """
+        generate yerine prompt üzerinde tek forward: ilk cevap token'ında labels[0]'ın
+        labels içindeki olasılığı döner (ör. P(YES | YES/NO)). Prefix KV-cache chat ile ortaktır.
+        """
+        with tracing.span("llm.classify") as sp:
+            tpl = self._render(system, user)
+            inputs = self.tok([tpl], return_tensors="pt").to(self.model.device)
+            ids = inputs["input_ids"]
+
+            past, n_cached = None, 0
+            if self.prefix_cache_size > 0:
+                past, n_cached = self._prefix_for(tpl, user, cache_prefix, ids[0].tolist())
+            t0 = time.perf_counter()
+            try:
+                with torch.no_grad():
+                    if past is None:
+                        logits = self.model(**inputs, use_cache=False).logits
+                    else:
+                        logits = self.model(input_ids=ids[:, n_cached:], past_key_values=past, use_cache=True).logits
+            finally:
+                if past is not None:
+                    past.crop(n_cached)
+            # Tek forward: tamamı prefill
+            sp.update(prompt_tokens=ids.shape[1], cached_tokens=n_cached, new_tokens=0,
+                      prefill_ms=round((time.perf_counter() - t0) * 1000.0, 3))
+        return float(self._label_probs(logits[:, -1, :], labels)[0, 0])
+
+    def classify_batch(self, pairs: List[Tuple[str, str]], labels: Tuple[str, ...] = ("YES", "NO"),
+                       batch_size: Optional[int] = None) -> List[float]:
+        """classify'ın toplu hâli; chat_batch gibi uzunluğa göre sıralı, sola dolgulu gruplar."""
+        if not pairs:
+            return []
+        bs = max(1, int(batch_size or self.batch_size))
+        tpls = [self._render(s, u) for s, u in pairs]
+        lengths = [len(ids) for ids in self.tok(tpls)["input_ids"]]
+        order = sorted(range(len(tpls)), key=lambda i: lengths[i])
+
+        probs: List[float] = [0.0] * len(tpls)
+        for start in range(0, len(order), bs):
+            group = order[start:start + bs]
+            inputs = self.tok(
+                [tpls[i] for i in group], return_tensors="pt", padding=True
+            ).to(self.model.device)
+            # Sol dolguda pozisyonlar dolgu sonrasından başlamalı (generate bunu kendisi yapar)
+            pos = (inputs["attention_mask"].long().cumsum(-1) - 1).clamp(min=0)
+            with tracing.span("llm.classify_batch", batch=len(group)) as sp, torch.no_grad():
+                t0 = time.perf_counter()
+                logits = self.model(**inputs, position_ids=pos, use_cache=False).logits
+                sp.update(prompt_tokens=int(inputs["attention_mask"].sum()), cached_tokens=0, new_tokens=0,
+                          prefill_ms=round((time.perf_counter() - t0) * 1000.0, 3))
+            p = self._label_probs(logits[:, -1, :], labels)[:, 0].tolist()
+            for row, i in enumerate(group):
+                probs[i] = float(p[row])
+        return probs
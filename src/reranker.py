@@ -1,26 +1,59 @@
 # src/reranker.py
 from __future__ import annotations
-from typing import List, Tuple
-from sentence_transformers import CrossEncoder
+import hashlib
+from typing import List, Optional, Sequence, Tuple
 from langchain_core.documents import Document
 
+from .qcache import PairScoreCache
+
 class Reranker:
     """
     BAAI/bge-reranker-base ile tekrar sıralama.
     threshold ~ 0.24-0.28 aralığı genelde güvenli.
+    (soru, chunk) skorları (soru hash'i, chunk ID) ile önbelleğe alınır; batch
+    modunda tüm soruların önbellekte olmayan çiftleri tek predict çağrısına gider.
     """
-    def __init__(self, model_name: str = "BAAI/bge-reranker-base", threshold: float = 0.25):
+    def __init__(self, model_name: str = "BAAI/bge-reranker-base", threshold: float = 0.25,
+                 batch_size: int = 32, cache_size: int = 50000):
+        from sentence_transformers import CrossEncoder  # ağır import; ilk kullanımda
         self.model = CrossEncoder(model_name)
         self.threshold = float(threshold)
+        self.batch_size = int(batch_size)
+        self.cache = PairScoreCache(cache_size)
+
+    @staticmethod
+    def _doc_key(d: Document) -> str:
+        cid = d.metadata.get("chunk_id")
+        return str(cid) if cid else hashlib.sha1(d.page_content.encode("utf-8")).hexdigest()[:16]
+
+    def score_batch(self, items: Sequence[Tuple[str, List[Document]]]) -> List[List[Tuple[Document, float]]]:
+        """Soru başına skorca azalan (Document, skor) listesi."""
+        keys = [[self.cache.key(q, self._doc_key(d)) for d in docs] for q, docs in items]
+        scores: List[List[Optional[float]]] = [[self.cache.get(k) for k in ks] for ks in keys]
+        todo, pairs = [], []
+        seen = {}
+        for i, (q, docs) in enumerate(items):
+            for j, d in enumerate(docs):
+                if scores[i][j] is None:
+                    key = keys[i][j]
+                    if key not in seen:
+                        seen[key] = len(pairs)
+                        pairs.append((q, d.page_content))
+                    todo.append((i, j, seen[key]))
+        if pairs:
+            fresh = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False).tolist()
+            for i, j, p in todo:
+                scores[i][j] = float(fresh[p])
+                self.cache.put(keys[i][j], scores[i][j])
+        return [
+            sorted(zip(docs, s), key=lambda x: x[1], reverse=True)
+            for (_, docs), s in zip(items, scores)
+        ]
 
     def score(self, question: str, docs: List[Document]) -> List[Tuple[Document, float]]:
-        pairs = [(question, d.page_content) for d in docs]
-        scores = self.model.predict(pairs).tolist()
-        ranked = list(sorted(zip(docs, scores), key=lambda x: x[1], reverse=True))
-        return ranked
+        return self.score_batch([(question, docs)])[0]
 
-    def filter(self, question: str, docs: List[Document], top_n: int = 5) -> Tuple[List[Document], List[float]]:
-        ranked = self.score(question, docs)
+    def _keep(self, ranked: List[Tuple[Document, float]], top_n: int) -> Tuple[List[Document], List[float]]:
         keep_docs, keep_scores = [], []
         for d, s in ranked:
             if s >= self.threshold and len(keep_docs) < top_n:
@@ -31,3 +64,11 @@ class Reranker:
             ranked_scores = [float(s) for _, s in ranked[:top_n]]
             return ranked_docs, ranked_scores
         return keep_docs, keep_scores
+
+    def filter(self, question: str, docs: List[Document], top_n: int = 5) -> Tuple[List[Document], List[float]]:
+        return self._keep(self.score(question, docs), top_n)
+
+    def filter_batch(self, questions: List[str], docs_list: List[List[Document]],
+                     top_n: int = 5) -> List[Tuple[List[Document], List[float]]]:
+        ranked = self.score_batch(list(zip(questions, docs_list)))
+        return [self._keep(r, top_n) for r in ranked]
@@ -1,4 +1,5 @@
 from __future__ import annotations
+from typing import Any, Dict, Optional
 from pydantic import BaseModel
 
 class InputSchema(BaseModel):
@@ -8,9 +9,22 @@ class InputSchema(BaseModel):
 class Reference(BaseModel):
     doc_id: str      # PDF dosya adı
     page: int        # 1-tabanlı sayfa numarası
+    offset: Optional[int] = None  # cevabın chunk metni içindeki karakter ofseti
 
 class OutputSchema(BaseModel):
     # ÇIKTI SIRASI: query -> answer -> reference
     query: str
     answer: str
     reference: Reference
+    debug: Optional[Dict[str, Any]] = None  # trace_debug açıksa aşama span'leri (bkz. tracing)
+
+
+def dump_model(model) -> dict:
+    # Pydantic v2: .model_dump(), v1: .dict()
+    try:
+        data = model.model_dump()
+    except Exception:
+        data = model.dict()  # type: ignore
+    if "debug" in data and data["debug"] is None:
+        del data["debug"]  # debug kapalıyken çıktı biçimi değişmesin
+    return data
@@ -0,0 +1,281 @@
+# src/server.py
+from __future__ import annotations
+import json
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from .schemas import InputSchema, OutputSchema, dump_model
+from .tracing import METRICS
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+_END = object()  # akış kuyruğunun sonu
+
+
+@dataclass
+class _Job:
+    inp: InputSchema
+    k: Optional[int]
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Optional[OutputSchema] = None
+    error: Optional[str] = None
+
+
+class QueryServer:
+    """
+    Tek bir sıcak QueryAgent'ı tutan yerel HTTP sunucusu.
+    İstekler kuyruğa alınır; tek işçi thread'i kuyruktan en fazla max_batch isteği
+    (ilk istekten sonra en çok max_wait_ms bekleyerek) toplayıp answer_batch ile çalıştırır.
+    pdf_path dolu istekler yalnızca o belgede arar (gerekirse belge önce indekslenir).
+
+    Uç noktalar:
+      POST /ask         {"query": "...", "pdf_path": "...", "k": 5}  -> OutputSchema JSON
+      POST /ask_stream  aynı gövde -> satır başına JSON olay: {"token": "..."} ...,
+                        son satır {"result": OutputSchema} (ya da {"error": "..."})
+      GET  /health      {"status": "ok", "queue": n}
+      GET  /metrics     aşama süreleri, token ve önbellek sayaçları (Prometheus metin biçimi)
+    Akışlı istekler batch'lenmez; model kilidini işçi thread'iyle paylaşır (bkz. stream).
+    """
+    def __init__(self, agent, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 max_batch: int = 8, max_wait_ms: int = 20):
+        self.agent = agent
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0, int(max_wait_ms)) / 1000.0
+        self.jobs: "queue.Queue[_Job]" = queue.Queue()
+        self.model_lock = threading.Lock()  # ajan/model aynı anda tek işte kullanılır
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._worker = threading.Thread(target=self._run_worker, name="query-worker", daemon=True)
+
+    # ---------- İşçi: mikro-batch ----------
+    def _next_batch(self) -> List[_Job]:
+        batch = [self.jobs.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self.jobs.get(timeout=remaining))
+                else:
+                    batch.append(self.jobs.get_nowait())  # süre doldu; yalnızca hazır olanlar
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_batch(self, batch: List[_Job]) -> None:
+        # Aynı k ve aynı belgeye (pdf_path) sahip istekler birlikte çalışır;
+        # bir belgenin hatası (ör. bulunamadı) diğer grupları etkilemez
+        groups: Dict[tuple, List[_Job]] = {}
+        for job in batch:
+            groups.setdefault((job.k, job.inp.pdf_path), []).append(job)
+        for (k, _), jobs in groups.items():
+            try:
+                outs = self.agent.answer_batch([j.inp for j in jobs], k=k)
+                for j, out in zip(jobs, outs):
+                    j.result = out
+            except Exception as e:  # sunucu ayakta kalmalı; hata istemciye döner
+                for j in jobs:
+                    j.error = f"{type(e).__name__}: {e}"
+            finally:
+                for j in jobs:
+                    j.done.set()
+
+    def _run_worker(self) -> None:
+        while True:
+            batch = self._next_batch()
+            with self.model_lock:
+                self._run_batch(batch)
+
+    def stream(self, inp: InputSchema, k: Optional[int] = None) -> Iterator[Union[str, OutputSchema]]:
+        """
+        Üretim ayrı bir thread'de model kilidi altında yapılır; olaylar kuyruktan okunur.
+        Kilit istemciye yazarken tutulmaz (yavaş okuyan istemci diğer istekleri
+        bekletmez). Generator kapatılırsa üretici bir sonraki olayda answer_stream'i
+        kapatır; bu da QwenChat.chat_stream'in generate'ini bir sonraki token'da durdurur.
+        """
+        events: "queue.Queue[Any]" = queue.Queue()
+        cancel = threading.Event()
+
+        def produce() -> None:
+            try:
+                with self.model_lock:
+                    steps = self.agent.answer_stream(inp, k=k)
+                    try:
+                        for event in steps:
+                            events.put(event)
+                            if cancel.is_set():
+                                break
+                    finally:
+                        steps.close()
+            except Exception as e:
+                events.put(e)
+            finally:
+                events.put(_END)
+
+        threading.Thread(target=produce, name="query-stream", daemon=True).start()
+        try:
+            while True:
+                event = events.get()
+                if event is _END:
+                    return
+                if isinstance(event, Exception):
+                    raise event
+                yield event
+        finally:
+            cancel.set()
+
+    def submit(self, inp: InputSchema, k: Optional[int] = None) -> _Job:
+        job = _Job(inp=inp, k=k)
+        self.jobs.put(job)
+        return job
+
+    # ---------- HTTP ----------
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, code: int, payload: Dict[str, Any]) -> None:
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/health":
+                    return self._send(200, {"status": "ok", "queue": server.jobs.qsize()})
+                if self.path == "/metrics":
+                    body = METRICS.render().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return None
+                return self._send(404, {"error": "not found"})
+
+            def _event(self, payload: Dict[str, Any]) -> None:
+                self.wfile.write((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+                self.wfile.flush()
+
+            def _stream(self, inp: InputSchema, k: Optional[int]) -> None:
+                # HTTP/1.0: gövde bağlantı kapanınca biter; Content-Length gerekmez
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+                self.end_headers()
+                events = server.stream(inp, k)
+                try:
+                    for event in events:
+                        if isinstance(event, OutputSchema):
+                            self._event({"result": dump_model(event)})
+                        else:
+                            self._event({"token": event})
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # istemci koptu
+                except Exception as e:
+                    self._event({"error": f"{type(e).__name__}: {e}"})
+                finally:
+                    events.close()  # istemci koptuysa üretim de dursun
+
+            def do_POST(self):
+                if self.path not in ("/ask", "/ask_stream"):
+                    return self._send(404, {"error": "not found"})
+                try:
+                    n = int(self.headers.get("Content-Length") or 0)
+                    data = json.loads(self.rfile.read(n).decode("utf-8") or "{}")
+                    k = data.pop("k", None)
+                    k = int(k) if k else None
+                    if k is not None and k < 0:
+                        raise ValueError("k negatif olamaz")
+                    data.setdefault("pdf_path", "")
+                    inp = InputSchema(**data)
+                except Exception as e:
+                    return self._send(400, {"error": f"Geçersiz istek: {e}"})
+
+                if self.path == "/ask_stream":
+                    return self._stream(inp, k)
+
+                job = server.submit(inp, k)
+                job.done.wait()
+                if job.error is not None:
+                    return self._send(500, {"error": job.error})
+                return self._send(200, dump_model(job.result))
+
+            def log_message(self, format, *args):  # noqa: A002
+                pass  # her istek için stderr'e yazma
+
+        return Handler
+
+    def serve_forever(self) -> None:
+        self._worker.start()
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+
+    def shutdown(self) -> None:
+        self.httpd.shutdown()
+
+
+class QueryClient:
+    """QueryServer için ince istemci (yalnızca stdlib)."""
+    def __init__(self, url: str = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", timeout: float = 300.0):
+        self.url = url.rstrip("/")
+        self.timeout = float(timeout)
+
+    def health(self) -> bool:
+        try:
+            with urllib.request.urlopen(f"{self.url}/health", timeout=2.0) as r:
+                return r.status == 200
+        except Exception:
+            return False
+
+    def _request(self, path: str, inp: InputSchema, k: Optional[int]) -> urllib.request.Request:
+        payload = dump_model(inp)
+        if k:
+            payload["k"] = int(k)
+        return urllib.request.Request(
+            f"{self.url}{path}",
+            data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json; charset=utf-8"},
+            method="POST",
+        )
+
+    def answer(self, inp: InputSchema, k: Optional[int] = None) -> OutputSchema:
+        req = self._request("/ask", inp, k)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as r:
+                data = json.loads(r.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode("utf-8", errors="replace")
+            raise RuntimeError(f"Sunucu hatası ({e.code}): {detail}") from e
+        return OutputSchema(**data)
+
+    def ask(self, question: str, k: Optional[int] = None, pdf_path: str = "") -> OutputSchema:
+        return self.answer(InputSchema(query=question, pdf_path=pdf_path), k=k)
+
+    def ask_stream(self, question: str, k: Optional[int] = None,
+                   pdf_path: str = "") -> Iterator[Union[str, OutputSchema]]:
+        """Metin parçaları geldikçe döner; son öğe OutputSchema'dır."""
+        req = self._request("/ask_stream", InputSchema(query=question, pdf_path=pdf_path), k)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as r:
+                for line in r:
+                    if not line.strip():
+                        continue
+                    event = json.loads(line.decode("utf-8"))
+                    if "token" in event:
+                        yield event["token"]
+                    elif "result" in event:
+                        yield OutputSchema(**event["result"])
+                    else:
+                        raise RuntimeError(f"Sunucu hatası: {event.get('error')}")
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode("utf-8", errors="replace")
+            raise RuntimeError(f"Sunucu hatası ({e.code}): {detail}") from e
@@ -0,0 +1,201 @@
+# src/tracing.py
+from __future__ import annotations
+import json
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+# Soru (ya da batch) başına bir Trace; aşamalar onun içine Span olarak yazılır.
+# Etkin trace bir ContextVar'da durur: QwenChat gibi alt katmanlar imza değiştirmeden
+# span ekleyebilir. Trace yoksa span() hiçbir şey kaydetmez.
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("rag_trace", default=None)
+
+# LLM span'lerinde sayaç olarak toplanan token alanları
+TOKEN_ATTRS = ("prompt_tokens", "cached_tokens", "new_tokens")
+
+
+class Trace:
+    def __init__(self, name: str, **attrs: Any):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs: Dict[str, Any] = dict(attrs)
+        self.spans: List[Dict[str, Any]] = []
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self._lock = threading.Lock()  # batch'te hazırlık ve üretim farklı thread'lerde
+
+    def add(self, name: str, seconds: float, start: Optional[float] = None, **attrs: Any) -> None:
+        """Biten bir aşamayı ekler; start: perf_counter değeri (varsayılan: şimdi - seconds)."""
+        start = (time.perf_counter() - seconds) if start is None else start
+        span = {
+            "name": name,
+            "start_ms": round((start - self._t0) * 1000.0, 3),
+            "duration_ms": round(seconds * 1000.0, 3),
+            **attrs,
+        }
+        with self._lock:
+            self.spans.append(span)
+        METRICS.observe_span(name, seconds, attrs)
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+        # Dönen dict'e blok içinde alan eklenebilir (ör. token sayıları)
+        t = time.perf_counter()
+        extra = dict(attrs)
+        try:
+            yield extra
+        finally:
+            self.add(name, time.perf_counter() - t, start=t, **extra)
+
+    def finish(self) -> "Trace":
+        if self.duration_ms is None:
+            self.duration_ms = round((time.perf_counter() - self._t0) * 1000.0, 3)
+            METRICS.observe_span(f"{self.name}.total", self.duration_ms / 1000.0, {})
+            if SINK is not None:
+                SINK.write(self)
+        return self
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "ts": round(self.started, 3),
+            "duration_ms": self.duration_ms,
+            **self.attrs,
+            "spans": spans,
+        }
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def activate(trace: Optional[Trace]) -> Iterator[Optional[Trace]]:
+    """trace'i bu blok (ve çağırdığı kod) için etkin yapar."""
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    trace = _current.get()
+    if trace is None:
+        yield dict(attrs)
+        return
+    with trace.span(name, **attrs) as extra:
+        yield extra
+
+
+def count(name: str, n: float = 1, **labels: str) -> None:
+    """Trace'ten bağımsız sayaç (ör. önbellek isabetleri)."""
+    METRICS.inc(name, n, **labels)
+
+
+# ---------- JSON satır çıktısı ----------
+
+class JsonLinesSink:
+    """Biten her trace'i tek satır JSON olarak yazar ("-" -> stderr)."""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._f: Optional[TextIO] = None
+
+    def write(self, trace: Trace) -> None:
+        line = json.dumps(trace.as_dict(), ensure_ascii=False)
+        with self._lock:
+            if self._f is None:
+                self._f = sys.stderr if self.path == "-" else open(self.path, "a", encoding="utf-8")
+            self._f.write(line + "\n")
+            self._f.flush()
+
+
+SINK: Optional[JsonLinesSink] = None
+
+
+def configure(log_path: str = "") -> None:
+    """Trace'lerin yazılacağı yer; boş -> yalnızca metrikler ve (debug açıksa) çıktı."""
+    global SINK
+    SINK = JsonLinesSink(log_path) if log_path else None
+
+
+# ---------- Prometheus biçiminde sayaç/histogram ----------
+
+_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    """Süreç içi sayaç ve histogramlar; render() Prometheus metin biçimi döndürür."""
+    def __init__(self, prefix: str = "rag"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._hists: Dict[str, Dict[LabelKey, List[float]]] = {}  # kova sayıları + [sum, count]
+
+    def inc(self, name: str, n: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + n
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            h = self._hists.setdefault(name, {}).setdefault(key, [0.0] * (len(_BUCKETS) + 2))
+            for i, le in enumerate(_BUCKETS):
+                if value <= le:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def observe_span(self, name: str, seconds: float, attrs: Dict[str, Any]) -> None:
+        self.observe("span_seconds", seconds, span=name)
+        for field in TOKEN_ATTRS:
+            if isinstance(attrs.get(field), (int, float)):
+                self.inc("llm_tokens_total", attrs[field], span=name, kind=field[:-len("_tokens")])
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._hists.clear()
+
+    @staticmethod
+    def _labels(key: LabelKey, extra: str = "") -> str:
+        parts = [f'{k}="{v}"' for k, v in key] + ([extra] if extra else [])
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> str:
+        out: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full = f"{self.prefix}_{name}"
+                out.append(f"# TYPE {full} counter")
+                for key, v in sorted(series.items()):
+                    out.append(f"{full}{self._labels(key)} {v:g}")
+            for name, series in sorted(self._hists.items()):
+                full = f"{self.prefix}_{name}"
+                out.append(f"# TYPE {full} histogram")
+                for key, h in sorted(series.items()):
+                    for i, le in enumerate(_BUCKETS + (float("inf"),)):
+                        n = h[i] if i < len(_BUCKETS) else h[-1]
+                        le_label = 'le="+Inf"' if le == float("inf") else 'le="%g"' % le
+                        out.append(f"{full}_bucket{self._labels(key, le_label)} {n:g}")
+                    out.append(f"{full}_sum{self._labels(key)} {h[-2]:.6f}")
+                    out.append(f"{full}_count{self._labels(key)} {h[-1]:g}")
+        return "\n".join(out) + "\n"
+
+
+METRICS = Metrics()
@@ -1,7 +1,22 @@
 import re
+from typing import Optional, Sequence
 
 def normalize_for_compare(s: str) -> str:
     s = (s or "").strip()
     # sadeleştirme
     s = re.sub(r"\s+", " ", s)
     return s
+
+def normalize_question(s: str) -> str:
+    # önbellek anahtarı: büyük/küçük harf, boşluk ve sondaki noktalama farkları önemsiz
+    s = re.sub(r"\s+", " ", (s or "").strip()).casefold()
+    return s.rstrip(" ?.!")
+
+def cut_at_stop(text: str, stop: Optional[Sequence[str]]) -> str:
+    """Baştaki boşluk atıldıktan sonra ilk durdurma dizgesinden öncesi."""
+    text = text.lstrip()
+    for s in stop or ():
+        pos = text.find(s)
+        if pos != -1:
+            text = text[:pos]
+    return text.strip()
@@ -1,31 +1,550 @@
 from __future__ import annotations
-from typing import List, Tuple
-from langchain_chroma import Chroma
+import json
+import math
+import mmap
+import os
+import shutil
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
 from langchain_core.documents import Document
 
-def build_chroma(docs: List[Document], embeddings, persist_dir: str) -> Chroma:
-    # Not: langchain-chroma 0.1.x ile persist() yok; persist_directory yeterli.
-    vs = Chroma.from_documents(
-        documents=docs,
-        embedding=embeddings,
-        persist_directory=persist_dir,
-        collection_name="qa_multi_pdf",
-    )
-    return vs
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+
+COLLECTION = "qa_multi_pdf"
 
 def load_chroma(embeddings, persist_dir: str) -> Chroma:
+    from langchain_chroma import Chroma  # chromadb yalnızca gerektiğinde yüklenir
     return Chroma(
         embedding_function=embeddings,
         persist_directory=persist_dir,
-        collection_name="qa_multi_pdf",
+        collection_name=COLLECTION,
+    )
+
+def reset_chroma(vs: Chroma, embeddings, persist_dir: str) -> Chroma:
+    """Koleksiyonu boşaltır (silip yeniden oluşturur)."""
+    vs.delete_collection()
+    return load_chroma(embeddings, persist_dir)
+
+def add_embeddings(vs, docs: List[Document], ids: List[str], vectors: Sequence[Sequence[float]],
+                   batch_size: int = 1000) -> None:
+    # Önceden hesaplanmış embedding'lerle upsert (embed ve yazma ayrı ölçülebilsin);
+    # Chroma tek istekte sınırlı sayıda kayıt kabul eder, parça parça gönderilir
+    if isinstance(vs, FlatIndex):
+        vs.add_vectors(docs, list(ids), np.asarray(vectors, dtype=np.float32))
+        return
+    for start in range(0, len(docs), batch_size):
+        part = slice(start, start + batch_size)
+        vs._collection.upsert(
+            ids=list(ids[part]),
+            embeddings=[list(map(float, v)) for v in vectors[part]],
+            metadatas=[d.metadata for d in docs[part]],
+            documents=[d.page_content for d in docs[part]],
+        )
+
+def delete_documents(vs: Chroma, ids: Sequence[str], batch_size: int = 1000) -> None:
+    ids = list(ids)
+    for start in range(0, len(ids), batch_size):
+        vs.delete(ids=ids[start:start + batch_size])
+
+def search_chroma(
+    vs: Chroma,
+    query_embeddings: List[List[float]],
+    k: int,
+    text_lookup: Optional[Callable[[List[str]], List[Optional[str]]]] = None,
+    where: Optional[Dict] = None,
+) -> List[List[Tuple[Document, float]]]:
+    """
+    Çoklu sorgu destekli arama; sorgu başına (Document, relevance) listesi döner
+    (relevance 0..1, büyük = daha yakın; LangChain'in skor fonksiyonu kullanılır).
+    text_lookup verilirse Chroma'dan belge metni istenmez; metin chunk ID'si ile
+    dışarıdan (PageStore) okunur, bulunamayanlar Chroma'dan tamamlanır.
+    """
+    if not query_embeddings:
+        return []
+    include = ["metadatas", "distances"]
+    if text_lookup is None:
+        include.append("documents")
+    res = vs._collection.query(
+        query_embeddings=query_embeddings, n_results=k, include=include, where=where
     )
+    relevance = vs._select_relevance_score_fn()
+
+    out: List[List[Tuple[Document, float]]] = []
+    for qi in range(len(query_embeddings)):
+        ids = list(res["ids"][qi])
+        metas = res["metadatas"][qi]
+        dists = res["distances"][qi]
+        if text_lookup is None:
+            texts = list(res["documents"][qi])
+        else:
+            texts = text_lookup(ids)
+            missing = [cid for cid, t in zip(ids, texts) if t is None]
+            if missing:
+                got = vs.get(ids=missing, include=["documents"])
+                by_id = dict(zip(got["ids"], got["documents"]))
+                texts = [t if t is not None else by_id.get(cid, "") for cid, t in zip(ids, texts)]
+        out.append([
+            (Document(page_content=t or "", metadata=dict(m or {})), float(relevance(d)))
+            for t, m, d in zip(texts, metas, dists)
+        ])
+    return out
+
+# ---------- Flat (NumPy) backend ----------
+
+def _l2_relevance(cos: np.ndarray) -> np.ndarray:
+    # Normalize vektörlerde Chroma'nın kare L2 mesafesi = 2 - 2cos; LangChain'in
+    # l2 relevance dönüşümüyle aynı ölçek (eşikler backend'den bağımsız kalsın)
+    return 1.0 - (2.0 - 2.0 * cos) / math.sqrt(2)
+
+def _matches(meta: Dict[str, Any], where: Optional[Dict]) -> bool:
+    # Chroma where sözdiziminin küçük alt kümesi: {"alan": değer} / {"alan": {"$eq"|"$in": ...}}
+    if not where:
+        return True
+    for key, cond in where.items():
+        val = meta.get(key)
+        if isinstance(cond, dict):
+            if "$eq" in cond and val != cond["$eq"]:
+                return False
+            if "$in" in cond and val not in cond["$in"]:
+                return False
+        elif val != cond:
+            return False
+    return True
+
+
+FLAT_DTYPES = (np.dtype("float32"), np.dtype("float16"), np.dtype("int8"))
+_SCORE_BLOCK = 1 << 15  # arama sırasında float32'ye açılan satır sayısı
+_INDEX_FILES = ("vectors.bin", "vectors.f32.bin", "quant.npy", "texts.bin", "meta.jsonl", "state.json")
+_COMPACT_DIR = "compact.tmp"
+_REFIT_CLIPPED = 0.01   # int8: kırpılan satır oranı bunu geçerse aralık yeniden hesaplanır
+
+
+def _fit_quant(lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    # Boyut başına [orta nokta, adım]; %10 pay sonraki batch'lerdeki küçük taşmaları karşılar
+    mid, half = (lo + hi) / 2.0, (hi - lo) / 2.0 * 1.1
+    return np.stack([mid, np.maximum(half, 1e-6) / 127.0]).astype(np.float32)
+
+
+class FlatIndex:
+    """
+    Süreç içi, tam (exact) top-k arama yapan düz vektör indeksi.
+
+    persist_dir/
+      state.json      {"dim", "dtype", "n_rows", "deleted": [satır, ...], "full": bool}
+      vectors.bin     N x dim satırlar (np.memmap ile okunur; aramada taranan matris)
+      vectors.f32.bin float32 kopya (yalnızca sıkıştırılmış dtype'larda; yeniden skorlama)
+      quant.npy       int8 için boyut başına [orta nokta, adım] (2 x dim)
+      texts.bin       UTF-8 chunk metinleri (mmap)
+      meta.jsonl      satır başına {"id", "m": metadata, "o": [start, end]}
+
+    dtype: float32 | float16 | int8. int8'de her boyut [orta - 127*adım, orta + 127*adım]
+    aralığına nicemlenir; aralık ilk eklenen batch'ten (%10 paylı) belirlenir, dışında
+    kalan değerler kırpılır. Kırpılan satırların oranı %1'i geçince aralık float32
+    kopyanın tamamından yeniden hesaplanır (requantize; compact da yeniden hesaplar). rescore > 0 ise sıkıştırılmış
+    skorla max(k, rescore) aday seçilir ve bunlar float32 kopyadan tam skorla sıralanır.
+
+    Ekleme yalnızca dosya sonuna yazar; silme satırı "deleted" olarak işaretler,
+    silinen oranı %30'u geçince dosyalar sıkıştırılır. Arama blok blok
+    matris-vektör çarpımı + argpartition'dır. Chroma ile aynı add_documents /
+    delete / get arayüzünü sağlar.
+    """
+    def __init__(self, embedding_function, persist_dir: str, dtype: str = "float32", rescore: int = 0):
+        self.embedding = embedding_function
+        self.dir = Path(persist_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        if np.dtype(dtype) not in FLAT_DTYPES:
+            raise ValueError(f"Desteklenmeyen flat dtype: {dtype} (seçenekler: float32, float16, int8)")
+        self.dtype = self.requested_dtype = np.dtype(dtype)
+        self.rescore = max(0, int(rescore))
+        self.full = False  # float32 kopya var mı
+        self.quant: Optional[np.ndarray] = None  # int8: [orta nokta, adım]
+        self.clipped = 0  # int8: aralık dışına taşıp kırpılan satır sayısı
+        self.dim: Optional[int] = None
+        self.ids: List[str] = []
+        self.metas: List[Dict[str, Any]] = []
+        self.offsets: List[Tuple[int, int]] = []
+        self.row_of: Dict[str, int] = {}
+        self.deleted: set = set()
+        self._text_end = 0
+        self._meta_end = 0  # meta.jsonl'in kaydedilmiş (state'e giren) bayt uzunluğu
+        self._mm: Optional[np.memmap] = None
+        self._full_mm: Optional[np.memmap] = None
+        self._text_mm: Optional[mmap.mmap] = None
+        self._load()
+
+    # ---------- Dosyalar ----------
+    @property
+    def _state_path(self) -> Path:
+        return self.dir / "state.json"
+
+    def _load(self) -> None:
+        self._finish_compact()
+        if not self._state_path.is_file():
+            return
+        state = json.loads(self._state_path.read_text(encoding="utf-8"))
+        self.dtype = np.dtype(state["dtype"])
+        self.dim = state.get("dim")
+        self.full = bool(state.get("full", False))
+        self.clipped = int(state.get("clipped", 0))
+        n_rows = int(state["n_rows"])
+        if self.dtype == np.int8 and n_rows:
+            self.quant = np.load(self.dir / "quant.npy")
+        with (self.dir / "meta.jsonl").open("rb") as f:
+            for line in f:
+                if len(self.ids) >= n_rows:
+                    break  # state'ten sonra yarım kalmış yazım
+                rec = json.loads(line)
+                self.row_of[rec["id"]] = len(self.ids)
+                self.ids.append(rec["id"])
+                self.metas.append(rec["m"])
+                self.offsets.append(tuple(rec["o"]))
+                self._meta_end += len(line)
+        self.deleted = set(state.get("deleted", []))
+        for row in self.deleted:
+            if self.row_of.get(self.ids[row]) == row:
+                del self.row_of[self.ids[row]]
+        self._text_end = self.offsets[-1][1] if self.offsets else 0
+
+    def _trim(self) -> None:
+        # Çökme: state'e girmemiş, dosya sonlarına yazılmış baytlar atılır; aksi halde
+        # sonraki ekleme bu artıkların arkasına yazılır ve satır/ofset eşlemesi kayar
+        n, dim = len(self.ids), self.dim or 0
+        sizes = {
+            "vectors.bin": n * dim * self.dtype.itemsize,
+            "vectors.f32.bin": n * dim * 4 if self.full else 0,
+            "texts.bin": self._text_end,
+            "meta.jsonl": self._meta_end,
+        }
+        for name, size in sizes.items():
+            path = self.dir / name
+            if path.is_file() and path.stat().st_size > size:
+                os.truncate(path, size)
+
+    def _save_state(self) -> None:
+        tmp = self._state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({
+            "dim": self.dim, "dtype": self.dtype.name,
+            "n_rows": len(self.ids), "deleted": sorted(self.deleted), "full": self.full,
+            "clipped": self.clipped,
+        }), encoding="utf-8")
+        os.replace(tmp, self._state_path)
+
+    def _matrix(self) -> np.ndarray:
+        n = len(self.ids)
+        if self._mm is None or self._mm.shape[0] != n:
+            self._mm = (np.memmap(self.dir / "vectors.bin", dtype=self.dtype, mode="r", shape=(n, self.dim))
+                        if n else np.zeros((0, self.dim or 0), dtype=self.dtype))
+        return self._mm
+
+    def _full_matrix(self) -> np.ndarray:
+        n = len(self.ids)
+        if self._full_mm is None or self._full_mm.shape[0] != n:
+            self._full_mm = np.memmap(self.dir / "vectors.f32.bin", dtype=np.float32, mode="r", shape=(n, self.dim))
+        return self._full_mm
+
+    @property
+    def vector_bytes(self) -> int:
+        # Aramada taranan (bellekte tutulması gereken) vektör verisi
+        extra = self.quant.nbytes if self.quant is not None else 0
+        return len(self.ids) * (self.dim or 0) * self.dtype.itemsize + extra
+
+    def _text(self, row: int) -> str:
+        start, end = self.offsets[row]
+        if end <= start:
+            return ""
+        if self._text_mm is None or len(self._text_mm) < end:
+            with open(self.dir / "texts.bin", "rb") as f:
+                self._text_mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._text_mm[start:end].decode("utf-8")
 
-def to_documents(chunks) -> List[Document]:
+    def __len__(self) -> int:
+        return len(self.ids) - len(self.deleted)
+
+    @property
+    def stale_dtype(self) -> bool:
+        # Diskteki indeks farklı dtype ile kurulmuş (ayar değişti) -> yeniden kurulmalı
+        return bool(self.ids) and self.dtype != self.requested_dtype
+
+    # ---------- Yazma ----------
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        if not documents:
+            return []
+        ids = list(ids) if ids is not None else [str(i + len(self.ids)) for i in range(len(documents))]
+        vecs = np.asarray(self.embedding.embed_documents([d.page_content for d in documents]), dtype=np.float32)
+        return self.add_vectors(documents, ids, vecs)
+
+    def add_vectors(self, documents: List[Document], ids: List[str], vecs: np.ndarray) -> List[str]:
+        self._trim()
+        if self.dim is None:
+            self.dim = int(vecs.shape[1])
+        # Aynı ID varsa eski satır silinmiş sayılır (upsert)
+        self._mark_deleted([cid for cid in ids if cid in self.row_of])
+        blobs = [d.page_content.encode("utf-8") for d in documents]
+        vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+        if not self.ids and self.dtype != np.float32:
+            self.full = True  # boş indeks: sıkıştırılmış dtype'ta float32 kopya da tutulur
+        with (self.dir / "vectors.bin").open("ab") as f:
+            f.write(self._encode(vecs).tobytes())
+        if self.full:
+            with (self.dir / "vectors.f32.bin").open("ab") as f:
+                f.write(vecs.tobytes())
+        with (self.dir / "texts.bin").open("ab") as f:
+            f.write(b"".join(blobs))
+        with (self.dir / "meta.jsonl").open("ab") as f:
+            for cid, d, b in zip(ids, documents, blobs):
+                start, self._text_end = self._text_end, self._text_end + len(b)
+                self.row_of[cid] = len(self.ids)
+                self.ids.append(cid)
+                self.metas.append(dict(d.metadata))
+                self.offsets.append((start, self._text_end))
+                line = json.dumps({"id": cid, "m": d.metadata, "o": [start, self._text_end]},
+                                  ensure_ascii=False) + "\n"
+                f.write(line.encode("utf-8"))
+                self._meta_end += len(line.encode("utf-8"))
+        if self.full and self.quant is not None and self.clipped > _REFIT_CLIPPED * len(self.ids):
+            self.requantize()  # sonraki batch'ler ilk batch'in aralığına sığmıyor
+        self._save_state()
+        return ids
+
+    def _encode(self, vecs: np.ndarray) -> np.ndarray:
+        if self.dtype != np.int8:
+            return vecs.astype(self.dtype)
+        if self.quant is None:
+            self.quant = _fit_quant(vecs.min(axis=0), vecs.max(axis=0))
+            np.save(self.dir / "quant.npy", self.quant)
+        codes = np.rint((vecs - self.quant[0]) / self.quant[1])
+        self.clipped += int((np.abs(codes) > 127).any(axis=1).sum())
+        return np.clip(codes, -127, 127).astype(np.int8)
+
+    def requantize(self) -> None:
+        """int8: aralığı float32 kopyanın tüm satırlarından yeniden hesaplar, kodları yeniden yazar."""
+        full = self._full_matrix()
+        lo = np.full(self.dim, np.inf, dtype=np.float32)
+        hi = np.full(self.dim, -np.inf, dtype=np.float32)
+        for start in range(0, full.shape[0], _SCORE_BLOCK):
+            block = np.asarray(full[start:start + _SCORE_BLOCK])
+            lo, hi = np.minimum(lo, block.min(axis=0)), np.maximum(hi, block.max(axis=0))
+        self.quant, self.clipped = _fit_quant(lo, hi), 0
+        tmp = self.dir / "vectors.bin.tmp"
+        with tmp.open("wb") as f:
+            for start in range(0, full.shape[0], _SCORE_BLOCK):
+                f.write(self._encode(np.asarray(full[start:start + _SCORE_BLOCK])).tobytes())
+        np.save(self.dir / "quant.tmp.npy", self.quant)
+        self._mm = None
+        os.replace(tmp, self.dir / "vectors.bin")
+        os.replace(self.dir / "quant.tmp.npy", self.dir / "quant.npy")
+        self._save_state()
+
+    def _decode(self, rows: List[int]) -> np.ndarray:
+        if self.full:
+            return np.array(self._full_matrix()[rows], dtype=np.float32)
+        vecs = np.array(self._matrix()[rows], dtype=np.float32)
+        return vecs * self.quant[1] + self.quant[0] if self.quant is not None else vecs
+
+    def _mark_deleted(self, ids: Sequence[str]) -> None:
+        for cid in ids:
+            row = self.row_of.pop(cid, None)
+            if row is not None:
+                self.deleted.add(row)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs) -> None:
+        self._mark_deleted(list(ids or []))
+        if self.ids and len(self.deleted) > 0.3 * len(self.ids):
+            self.compact()
+        else:
+            self._save_state()
+
+    def compact(self) -> None:
+        """
+        Silinmiş satırları dosyalardan atar. Yeni dosyalar compact.tmp/ altında kurulur;
+        DONE işareti yazıldıktan sonra yerlerine taşınır (state.json en son). Arada
+        çökerse bir sonraki açılışta taşıma tamamlanır, DONE yoksa geçici klasör atılır.
+        """
+        keep = [r for r in range(len(self.ids)) if r not in self.deleted]
+        tmp = self.dir / _COMPACT_DIR
+        shutil.rmtree(tmp, ignore_errors=True)
+        new = FlatIndex(self.embedding, str(tmp), dtype=self.dtype.name, rescore=self.rescore)
+        for start in range(0, len(keep), _SCORE_BLOCK):
+            rows = keep[start:start + _SCORE_BLOCK]
+            docs = [Document(page_content=self._text(r), metadata=self.metas[r]) for r in rows]
+            new.add_vectors(docs, [self.ids[r] for r in rows], self._decode(rows))
+        new._save_state()
+        del new
+        for name in ("vectors.bin", "texts.bin", "meta.jsonl"):
+            (tmp / name).touch()  # hiç satır kalmasa da taşınacak dosyalar eksiksiz olsun
+        (tmp / "DONE").touch()
+        self._clear()
+        self._load()  # taşımayı tamamlar ve yeni dosyaları okur
+
+    def _finish_compact(self) -> None:
+        tmp = self.dir / _COMPACT_DIR
+        if not tmp.is_dir():
+            return
+        if (tmp / "DONE").is_file() and (tmp / "state.json").is_file():
+            state = json.loads((tmp / "state.json").read_text(encoding="utf-8"))
+            present = {"vectors.bin", "texts.bin", "meta.jsonl"}
+            if state.get("full"):
+                present.add("vectors.f32.bin")
+            if state.get("dtype") == "int8" and state.get("n_rows"):
+                present.add("quant.npy")
+            for name in _INDEX_FILES[:-1]:
+                if (tmp / name).is_file():
+                    os.replace(tmp / name, self.dir / name)
+                elif name not in present:
+                    (self.dir / name).unlink(missing_ok=True)  # eski indeksten kalan
+            os.replace(tmp / "state.json", self._state_path)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    def reset(self) -> None:
+        self._clear()
+        shutil.rmtree(self.dir / _COMPACT_DIR, ignore_errors=True)
+        for name in _INDEX_FILES:
+            (self.dir / name).unlink(missing_ok=True)
+
+    def _clear(self) -> None:
+        self._mm, self._full_mm, self._text_mm = None, None, None
+        self.dim, self.ids, self.metas, self.offsets = None, [], [], []
+        self.row_of, self.deleted, self._text_end, self._meta_end = {}, set(), 0, 0
+        self.dtype, self.full, self.quant, self.clipped = self.requested_dtype, False, None, 0
+
+    # ---------- Okuma ----------
+    def get(self, ids: Optional[List[str]] = None, include: Optional[List[str]] = None, **kwargs) -> Dict[str, Any]:
+        rows = [self.row_of[c] for c in (ids if ids is not None else list(self.row_of)) if c in self.row_of]
+        return {
+            "ids": [self.ids[r] for r in rows],
+            "metadatas": [self.metas[r] for r in rows],
+            "documents": [self._text(r) for r in rows],
+        }
+
+    def search_by_vectors(self, query_embeddings: List[List[float]], k: int,
+                          with_text: bool = True, where: Optional[Dict] = None,
+                          ) -> List[List[Tuple[str, Dict[str, Any], Optional[str], float]]]:
+        """
+        Sorgu başına (id, metadata, metin|None, relevance) listesi. float32'de tam top-k;
+        sıkıştırılmış dtype'larda yaklaşık skor (rescore > 0 ise adaylar tam skorla sıralanır).
+        """
+        if not query_embeddings:
+            return []
+        if not self.ids:
+            return [[] for _ in query_embeddings]
+        q = np.asarray(query_embeddings, dtype=np.float32)
+        scores = self._scores(q)  # N x B
+        mask = np.zeros(len(self.ids), dtype=bool)
+        if self.deleted:
+            mask[list(self.deleted)] = True
+        if where:
+            mask |= np.array([not _matches(m, where) for m in self.metas])
+        if mask.any():
+            scores[mask] = -np.inf
+        n_valid = int((~mask).sum())
+        k = min(k, n_valid)
+        rescore = self.full and self.rescore > 0
+        n_cand = min(max(k, self.rescore), n_valid) if rescore else k
+        out = []
+        for b in range(q.shape[0]):
+            col = scores[:, b]
+            if k <= 0:
+                out.append([])
+                continue
+            top = np.argpartition(-col, n_cand - 1)[:n_cand] if n_cand < len(col) else np.arange(len(col))
+            if rescore:
+                top = np.sort(top)  # memmap'ten artan sırayla oku
+                col = np.full(len(self.ids), -np.inf, dtype=np.float32)
+                col[top] = self._full_matrix()[top] @ q[b]
+            top = top[np.argsort(-col[top])][:k]
+            rel = _l2_relevance(col[top])
+            out.append([
+                (self.ids[r], self.metas[r], self._text(r) if with_text else None, float(s))
+                for r, s in zip(top.tolist(), rel.tolist())
+            ])
+        return out
+
+    def _scores(self, q: np.ndarray) -> np.ndarray:
+        # Satır blokları halinde: float16/int8 matris bir kerede float32'ye açılmasın.
+        # int8: x ≈ orta + kod * adım  =>  x·q = kod·(adım*q) + orta·q
+        mat = self._matrix()
+        if self.quant is not None:
+            qt, bias = (q * self.quant[1]).T, q @ self.quant[0]
+        else:
+            qt, bias = q.T, None
+        scores = np.empty((mat.shape[0], q.shape[0]), dtype=np.float32)
+        for start in range(0, mat.shape[0], _SCORE_BLOCK):
+            block = np.asarray(mat[start:start + _SCORE_BLOCK], dtype=np.float32)
+            scores[start:start + len(block)] = block @ qt
+        if bias is not None:
+            scores += bias
+        return scores
+
+
+def load_flat(embeddings, persist_dir: str, dtype: str = "float32", rescore: int = 0) -> FlatIndex:
+    return FlatIndex(embeddings, persist_dir, dtype=dtype, rescore=rescore)
+
+
+# ---------- Backend seçimi ----------
+
+BACKENDS = ("chroma", "flat")
+
+def index_dir(persist_dir: str, backend: str) -> str:
+    # Chroma kök klasörü doğrudan kullanır; diğer backend'ler (ve manifest'leri) alt klasörde durur
+    if backend not in BACKENDS:
+        raise ValueError(f"Bilinmeyen vektör backend'i: {backend} (seçenekler: {', '.join(BACKENDS)})")
+    return persist_dir if backend == "chroma" else str(Path(persist_dir) / backend)
+
+def load_vectorstore(embeddings, persist_dir: str, backend: str = "chroma", dtype: str = "float32",
+                     rescore: int = 0):
+    path = index_dir(persist_dir, backend)
+    if backend == "flat":
+        return load_flat(embeddings, path, dtype=dtype, rescore=rescore)
+    return load_chroma(embeddings, path)
+
+def reset_vectorstore(vs, embeddings, persist_dir: str):
+    if isinstance(vs, FlatIndex):
+        vs.reset()
+        return vs
+    return reset_chroma(vs, embeddings, persist_dir)
+
+def index_size(vs) -> int:
+    # Canlı (silinmemiş) kayıt sayısı
+    if isinstance(vs, FlatIndex):
+        return len(vs)
+    return vs._collection.count()
+
+def search_vectors(
+    vs,
+    query_embeddings: List[List[float]],
+    k: int,
+    text_lookup: Optional[Callable[[List[str]], List[Optional[str]]]] = None,
+    where: Optional[Dict] = None,
+) -> List[List[Tuple[Document, float]]]:
+    """Backend'den bağımsız çoklu sorgu araması; bkz. search_chroma."""
+    if not isinstance(vs, FlatIndex):
+        return search_chroma(vs, query_embeddings, k, text_lookup=text_lookup, where=where)
+    results = vs.search_by_vectors(query_embeddings, k, with_text=text_lookup is None, where=where)
+    out: List[List[Tuple[Document, float]]] = []
+    for hits in results:
+        texts = [t for _, _, t, _ in hits]
+        if text_lookup is not None:
+            ids = [cid for cid, _, _, _ in hits]
+            texts = [t if t is not None else vs._text(vs.row_of[cid])
+                     for cid, t in zip(ids, text_lookup(ids))]
+        out.append([
+            (Document(page_content=t or "", metadata=dict(m)), s)
+            for (_, m, _, s), t in zip(hits, texts)
+        ])
+    return out
+
+
+def to_documents(chunks, ids: Optional[List[str]] = None) -> List[Document]:
     docs = []
-    for ch in chunks:
+    for i, ch in enumerate(chunks):
+        metadata = {"source": ch.source, "page": ch.page}
+        if ids is not None:
+            metadata["chunk_id"] = ids[i]
         docs.append(Document(
             page_content=ch.text,
-            metadata={"source": ch.source, "page": ch.page}
+            metadata=metadata
         ))
     return docs
 
@@ -48,3 +567,9 @@ def best_scores_info(results_with_scores: List[Tuple[Document, float]]) -> Tuple
     top1 = max(scores)
     top5 = scores[min(4, len(scores)-1)]
     return top1, top5
+
+def confident(top1: float, top5: float, min_relevance: float, low_conf_gap: float) -> bool:
+    # Getirme kapısı: en iyi skor ve top1-top5 farkı eşiklerin üstünde mi (eşik <= 0 -> kontrol yok)
+    if min_relevance > 0 and top1 < min_relevance:
+        return False
+    return low_conf_gap <= 0 or top1 - top5 >= low_conf_gap